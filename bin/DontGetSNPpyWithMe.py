@@ -39,10 +39,12 @@ class DiddyKongRacing(nn.Module):
     # layerWidths == The widths of each layer (how many cells in each layer) #Type list 
     # dropout == fraction of nodes to dropout for regularization (default 0.5)
     # multitask outputs == the number of neurons in the final layer for each task (type list) --> defaulting to [1,1] for each for now (e.g, assuming a binary classification task for both)
+    # dosage == if True the first layer is a DosageKong64 that takes raw int8 0/1/2 dosages (-1 missing) instead of z-scores, 
+    #           snpMeans/snpStds are the per SNP training means and stds (train_set_stats.tsv) it z-scores with inside the layer
     
     # OUTPUT: A list of unactivated ouputs 
     
-    def __init__(self, inputDimensions = [2,512], numLayers = 3, layerWidths = None, dropout = 0.5, multitaskOutputs = [1,1]):
+    def __init__(self, inputDimensions = [2,512], numLayers = 3, layerWidths = None, dropout = 0.5, multitaskOutputs = [1,1], dosage = False, snpMeans = None, snpStds = None):
         super(DiddyKongRacing,self).__init__()
         self.getWide = None
         self.howManyLayers = numLayers
@@ -77,7 +79,10 @@ class DiddyKongRacing(nn.Module):
         #print("A ba ba boua ba ba: Layers are initializing...")
         for i in range(len(self.getWide) - 1):
             #print("Adding linear layer from {} nodes to {} nodes...".format(self.getWide[i], self.getWide[i+1]))
-            self.hotTopVolcano.append(DonkeyKong64(self.getWide[i],self.getWide[i+1], dropout, False))
+            if dosage and i == 0:
+                self.hotTopVolcano.append(DosageKong64(self.getWide[i],self.getWide[i+1], dropout, snpMeans, snpStds))
+            else:
+                self.hotTopVolcano.append(DonkeyKong64(self.getWide[i],self.getWide[i+1], dropout, False))
             
         #Add in multitask layers here
         #print("The angry aztec sends his llama regards: Multi-task layers initializing...")
@@ -122,5 +127,96 @@ class DonkeyKong64(nn.Module):
         return self.goldBanana(x)
         
   
-  
-  
\ No newline at end of file
+
+#First layer for raw dosages: int8 0/1/2 SNP calls (-1 for missing) go in, and the per SNP z-scoring the preprocessing used to do
+#((dosage - mean) / std, missing -> 0) happens here on the fly so the data can stay int8 (4x less memory than float z-scores).
+#Same Linear -> BatchNorm1d -> Dropout -> ReLU as DonkeyKong64 and the Linear is still trained on the z-score scale. For CPU inference:
+#   FoldTheScales() folds the scale and offset into the weights (W' = W/std, b' = b - W' @ mean, missing imputed with the mean)
+#   PruneTheJungle() drops blocks of input SNP columns with the smallest weights so the first GEMM (and the input) shrinks
+#   ShrinkRay() swaps the Linear for a dynamically quantized int8 one
+class DosageKong64(nn.Module):
+
+    def __init__(self, diddyKong, donkeyKong, krool, snpMeans = None, snpStds = None): #(self, input, output, dropout, means, stds)
+        super(DosageKong64, self).__init__()
+        means = torch.zeros(diddyKong) if snpMeans is None else torch.tensor(snpMeans, dtype = torch.float32)
+        stds = torch.ones(diddyKong) if snpStds is None else torch.tensor(snpStds, dtype = torch.float32)
+        self.register_buffer("means", torch.nan_to_num(means))  #all missing SNP (nan mean) -> 0 so it can't spread nan
+        self.register_buffer("invStds", torch.where(stds > 0, 1 / stds, torch.zeros_like(stds)))  #no spread (or nan) -> 0 like normalizeGenotypes
+        self.register_buffer("keep", torch.arange(diddyKong))  #SNP columns still in use after pruning
+        self.register_buffer("isFolded", torch.tensor(False))
+        self.numSNPs = diddyKong
+        
+        self.firstLinear = nn.Linear(diddyKong, donkeyKong)
+        PhotoCopierInitialize(self.firstLinear)
+        self.goldBanana = nn.Sequential(nn.BatchNorm1d(donkeyKong), nn.Dropout(krool), nn.ReLU(inplace=True))
+        
+    def forward(self, x):
+        if len(self.keep) < self.numSNPs:
+            x = x[:, self.keep]
+        missing = x < 0
+        x = x.float()
+        if self.isFolded:
+            x = torch.where(missing, self.means[self.keep], x)
+        else:
+            x = ((x - self.means[self.keep]) * self.invStds[self.keep]).masked_fill(missing, 0)
+        return self.goldBanana(self.firstLinear(x))
+    
+    #Fold the z-scoring into the Linear so forward is just impute -> GEMM (outputs unchanged up to rounding)
+    def FoldTheScales(self):
+        if self.isFolded:
+            return self
+        with torch.no_grad():
+            weight = self.firstLinear.weight * self.invStds[self.keep]
+            self.firstLinear.bias -= weight @ self.means[self.keep]
+            self.firstLinear.weight.copy_(weight)
+        self.isFolded.fill_(True)
+        return self
+    
+    #Keep only the given SNP columns (indices into the original input), the Linear shrinks to match
+    def Prune(self, keep):
+        keep = torch.as_tensor(keep, dtype = torch.long, device = self.keep.device)
+        columns = torch.searchsorted(self.keep, keep)  #keep is sorted so this maps SNPs to current columns
+        shrunk = nn.Linear(len(keep), self.firstLinear.out_features).to(self.firstLinear.weight.device)
+        with torch.no_grad():
+            shrunk.weight.copy_(self.firstLinear.weight[:, columns])
+            shrunk.bias.copy_(self.firstLinear.bias)
+        self.firstLinear = shrunk
+        self.keep = keep
+        return self
+    
+    #Block magnitude pruning: split the input columns into blocks of blockSize SNPs and keep the keepFraction of blocks with the largest weight norm
+    def PruneTheJungle(self, keepFraction, blockSize = 64):
+        norms = self.firstLinear.weight.detach().pow(2).sum(0)
+        numBlocks = (len(norms) + blockSize - 1) // blockSize
+        blockNorms = torch.zeros(numBlocks, device = norms.device).index_add_(0, torch.arange(len(norms), device = norms.device) // blockSize, norms)
+        keepBlocks = torch.topk(blockNorms, max(1, int(round(keepFraction * numBlocks)))).indices
+        columns = (keepBlocks.unsqueeze(1) * blockSize + torch.arange(blockSize, device = norms.device)).flatten()
+        columns = torch.sort(columns[columns < len(norms)]).values
+        return self.Prune(self.keep[columns])
+    
+    #Dynamic int8 quantization of the Linear (CPU inference only, weights stored as int8 and activations quantized per batch)
+    def ShrinkRay(self):
+        self.firstLinear = torch.ao.quantization.quantize_dynamic(nn.Sequential(self.firstLinear), {nn.Linear}, dtype = torch.qint8)[0]
+        return self
+
+
+#Rebuild a DiddyKongRacing from a saved state_dict (e.g. models/best_models/*.pt) without having to remember how it was made
+#The architecture is read off the weight shapes: hidden layer widths from hotTopVolcano.*.goldBanana.0 and task sizes from jetPacksAndPeanutPistols.*.goldBanana.0
+#Dosage models (DosageKong64 first layer) are picked up from their buffers, including pruning and folding
+#Dropout isn't stored in the state_dict so it is passed in (it doesn't matter in eval mode anyways)
+def KongFromCheckpoint(checkpoint, dropout = 0.5, device = "cpu"):
+    stateDict = torch.load(checkpoint, map_location = device) if isinstance(checkpoint, str) else checkpoint
+    numHidden = len({key.split(".")[1] for key in stateDict if key.startswith("hotTopVolcano.")})
+    numTasks = len({key.split(".")[1] for key in stateDict if key.startswith("jetPacksAndPeanutPistols.")})
+    dosage = "hotTopVolcano.0.means" in stateDict
+    hiddenWeights = [stateDict["hotTopVolcano.0.firstLinear.weight"]] if dosage else []
+    hiddenWeights += [stateDict["hotTopVolcano.{}.goldBanana.0.weight".format(i)] for i in range(len(hiddenWeights), numHidden)]
+    layerWidths = [w.shape[0] for w in hiddenWeights]
+    multitaskOutputs = [stateDict["jetPacksAndPeanutPistols.{}.goldBanana.0.weight".format(i)].shape[0] for i in range(numTasks)]
+    numSNPs = len(stateDict["hotTopVolcano.0.means"]) if dosage else hiddenWeights[0].shape[1]
+    
+    kong = DiddyKongRacing([2, numSNPs], numHidden, layerWidths, dropout, multitaskOutputs, dosage = dosage)
+    if dosage and len(stateDict["hotTopVolcano.0.keep"]) < numSNPs:
+        kong.hotTopVolcano[0].Prune(stateDict["hotTopVolcano.0.keep"])
+    kong.load_state_dict(stateDict)
+    return kong.to(device).eval()
@@ -1,19 +1,48 @@
+import os
+import threading
 from copy import deepcopy
+import torch
+
+#mode == what is kept of the best model (the last one whose val loss went down):
+#   "model" --> a deepcopy of the whole model (returned as the second value, like always)
+#   "state" --> only a CPU copy of its state_dict, copied into the same preallocated (pinned if there is a GPU) buffers every time
+#   "disk"  --> the same CPU copy, written to path by a background thread so training doesn't wait on the disk
+#In "state"/"disk" mode the second value returned is the state_dict copy, use SaveTheBest/BestStateDict to not care which mode it is
+#lastImprovedEpoch/lastImprovedLoss == which call (1 based, so it lines up with lists that start with the untrained epoch 0) kept the model and its loss,
+#that is the last time the val loss went down from the epoch before, not necessarily the lowest val loss seen
 class EarlyStop:
-    def __init__(self, patience):
+    def __init__(self, patience, mode = "model", path = None):
+        if mode not in ("model", "state", "disk"):
+            raise ValueError("mode needs to be model, state or disk not {}".format(mode))
+        if mode == "disk" and path is None:
+            raise ValueError("disk mode needs a path to write the best checkpoint to")
         self.patience = patience
+        self.mode = mode
+        self.path = path
         self.virtue = 0
         self.prevLoss = float('inf')
         self.readySetStop = False
-        self.theOneModelToRuleThemAll = None 
+        self.theOneModelToRuleThemAll = None
+        self.lastImprovedEpoch = None
+        self.lastImprovedLoss = float('inf')
+        self.epoch = 0
+        self.scribe = None
     
     def __call__(self, valLoss, bottomOfTheBarrel):
+        self.epoch += 1
         if self.readySetStop:
             print("Why are you still training???  You are overfitting...")
         elif (valLoss < self.prevLoss):
             self.virtue = 0
             self.prevLoss = valLoss
-            self.theOneModelToRuleThemAll = deepcopy(bottomOfTheBarrel)
+            self.lastImprovedEpoch, self.lastImprovedLoss = self.epoch, valLoss
+            if self.mode == "model":
+                self.theOneModelToRuleThemAll = deepcopy(bottomOfTheBarrel)
+            else:
+                self.theOneModelToRuleThemAll = self.CopyTheBarrel(bottomOfTheBarrel)
+                if self.mode == "disk":
+                    self.scribe = threading.Thread(target=self.WriteItDown, daemon=True)
+                    self.scribe.start()
             #print("Going down no need to do anything... good job!")
         else:
             #print("Entering the thunderdome...")
@@ -23,4 +52,51 @@ class EarlyStop:
                 self.readySetStop = True
                 print("You have won the hunger games")
                
-        return self.readySetStop, self.theOneModelToRuleThemAll
\ No newline at end of file
+        return self.readySetStop, self.theOneModelToRuleThemAll
+
+    #Copy the model's state_dict into the CPU buffers (made on the first call)
+    def CopyTheBarrel(self, model):
+        self.WaitForTheScribe()  #the last write might still be reading the buffers
+        stateDict = model.state_dict()
+        if self.theOneModelToRuleThemAll is None:
+            pin = torch.cuda.is_available()
+            self.theOneModelToRuleThemAll = {key: torch.empty(value.shape, dtype=value.dtype, pin_memory=pin) for key, value in stateDict.items()}
+        onGpu = False
+        with torch.no_grad():
+            for key, value in stateDict.items():
+                self.theOneModelToRuleThemAll[key].copy_(value, non_blocking=value.is_cuda)
+                onGpu = onGpu or value.is_cuda
+        if onGpu:
+            torch.cuda.synchronize()
+        return self.theOneModelToRuleThemAll
+
+    #Background write of the buffers, to a temp file first so path is never half written
+    def WriteItDown(self):
+        torch.save(self.theOneModelToRuleThemAll, self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+
+    def WaitForTheScribe(self):
+        if self.scribe is not None:
+            self.scribe.join()
+            self.scribe = None
+
+    #state_dict of the best model whatever the mode
+    def BestStateDict(self):
+        self.WaitForTheScribe()
+        if self.mode == "model":
+            return self.theOneModelToRuleThemAll.state_dict()
+        return self.theOneModelToRuleThemAll
+
+    #torch.save the best model's state_dict to filename (disk mode just waits for its write and moves it there)
+    #Returns False and saves nothing if no epoch ever improved the val loss (e.g. nan losses), so there is no model
+    def SaveTheBest(self, filename):
+        self.WaitForTheScribe()
+        if self.lastImprovedEpoch is None:
+            return False
+        if self.mode == "disk":
+            if os.path.abspath(filename) != os.path.abspath(self.path):
+                os.replace(self.path, filename)
+                self.path = filename
+        else:
+            torch.save(self.BestStateDict(), filename)
+        return True
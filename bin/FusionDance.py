@@ -0,0 +1,136 @@
+'''
+@author = james
+FusionDance.py turns a trained DiddyKongRacing into a lean inference-only network (Gotenks) for scoring on CPU:
+    1) every eval-mode BatchNorm1d is folded into the Linear before it (W' = W * g/sqrt(var+eps), b' = (b - mean) * g/sqrt(var+eps) + beta)
+    2) Dropout is dropped (it does nothing in eval mode anyways)
+    3) all the jetPacksAndPeanutPistols heads are concatenated into a single Linear (one GEMM) whose output is split back into per task views
+    4) a DosageKong64 first layer also gets its z-scoring folded in, so Gotenks takes the same int8 dosages (-1 missing) and just imputes the mean
+The output is the same list of unactivated outputs DiddyKongRacing gives (up to float rounding from the folding), so Meowth/Validate etc. work unchanged.
+Fuse before quantizing (pass --quantize here rather than calling ShrinkRay first) since BatchNorm can't be folded into int8 weights.
+Example to run (export a frozen TorchScript artifact straight from a checkpoint and check it against the original):
+python FusionDance.py -m ../models/best_models/BestModel_Cinco_De_Mayo_1000_100_epochs_5_hiddenLayers.pt -o ../models/Cinco_De_Mayo_fused.pt
+gotenks = torch.jit.load("../models/Cinco_De_Mayo_fused.pt")
+'''
+
+import argparse
+import time
+from typing import List
+import copy
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from DontGetSNPpyWithMe import KongFromCheckpoint, DosageKong64
+
+
+#The fused warrior: Linear -> ReLU for each hidden layer, then one Linear for all tasks split into views
+#With dosage=True the input is raw dosages: the kept SNP columns are gathered and missing (-1) calls are imputed with imputeMeans
+class Gotenks(nn.Module):
+
+    def __init__(self, hiddenLayers, heads, splits: List[int], dosage: bool = False, keep = None, imputeMeans = None):
+        super(Gotenks, self).__init__()
+        self.hiddenLayers = nn.ModuleList(hiddenLayers)
+        self.heads = heads
+        self.splits = splits
+        self.dosage = dosage
+        self.subset = keep is not None
+        self.register_buffer("keep", keep if keep is not None else torch.zeros(0, dtype=torch.long))
+        self.register_buffer("imputeMeans", imputeMeans if imputeMeans is not None else torch.zeros(0))
+
+    def forward(self, x) -> List[torch.Tensor]:
+        if self.dosage:
+            if self.subset:
+                x = x[:, self.keep]
+            x = torch.where(x < 0, self.imputeMeans, x.float())
+        for layer in self.hiddenLayers:
+            x = F.relu(layer(x))
+        return list(self.heads(x).split(self.splits, dim=1))
+
+
+#Fold an eval-mode BatchNorm1d into the Linear before it, returns a new Linear
+def FoldTheBanana(linear, batchNorm):
+    scale = batchNorm.weight / torch.sqrt(batchNorm.running_var + batchNorm.eps)
+    folded = nn.Linear(linear.in_features, linear.out_features)
+    with torch.no_grad():
+        folded.weight.copy_(linear.weight * scale.unsqueeze(1))
+        folded.bias.copy_((linear.bias - batchNorm.running_mean) * scale + batchNorm.bias)
+    return folded
+
+
+#Build a Gotenks from a DiddyKongRacing (the original model is left alone)
+def FusionDance(kong):
+    hiddenLayers = []
+    dosage, keep, imputeMeans = False, None, None
+    for donkey in kong.hotTopVolcano:
+        if isinstance(donkey, DosageKong64):
+            #Fold the z-scoring into a copy first so the BatchNorm folds onto dosage-scale weights
+            donkey = copy.deepcopy(donkey).FoldTheScales()
+            dosage, imputeMeans = True, donkey.means[donkey.keep].clone()
+            keep = donkey.keep.clone() if len(donkey.keep) < donkey.numSNPs else None
+            linear, batchNorm = donkey.firstLinear, donkey.goldBanana[0]
+        else:
+            linear, batchNorm = donkey.goldBanana[0], donkey.goldBanana[1]
+        hiddenLayers.append(FoldTheBanana(linear, batchNorm))
+
+    heads = [donkey.goldBanana[0] for donkey in kong.jetPacksAndPeanutPistols]
+    splits = [head.out_features for head in heads]
+    fusedHeads = nn.Linear(heads[0].in_features, sum(splits))
+    with torch.no_grad():
+        fusedHeads.weight.copy_(torch.cat([head.weight for head in heads], dim=0))
+        fusedHeads.bias.copy_(torch.cat([head.bias for head in heads], dim=0))
+
+    device = next(kong.parameters()).device
+    return Gotenks(hiddenLayers, fusedHeads, splits, dosage, keep, imputeMeans).to(device).eval()
+
+
+#Dynamic int8 quantization of the fused first layer (the big one), CPU only
+def ShrinkGotenks(gotenks):
+    gotenks.hiddenLayers[0] = torch.ao.quantization.quantize_dynamic(nn.Sequential(gotenks.hiddenLayers[0]), {nn.Linear}, dtype=torch.qint8)[0]
+    return gotenks
+
+
+#Script and freeze a Gotenks so weights are constants and it can be torch.jit.save'd/loaded without this code
+def PotaraEarrings(gotenks):
+    return torch.jit.freeze(torch.jit.script(gotenks.eval()))
+
+
+#Average seconds per forward pass of a model on a batch
+def HowFastIsHe(model, batch, repeats = 50):
+    with torch.inference_mode():
+        for _ in range(5):
+            model(batch)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(batch)
+    return (time.perf_counter() - start) / repeats
+
+
+def main(args):
+    kong = KongFromCheckpoint(args.model, device = "cpu")
+    gotenks = FusionDance(kong)
+    if args.quantize:
+        gotenks = ShrinkGotenks(gotenks)
+    gotenks = PotaraEarrings(gotenks)
+    torch.jit.save(gotenks, args.output)
+    print("Saved fused model to {}".format(args.output))
+
+    #Check the fused model against the original and time them both on a random batch
+    if isinstance(kong.hotTopVolcano[0], DosageKong64):
+        batch = torch.randint(-1, 3, (args.batch_size, kong.getWide[0]), dtype=torch.int8)
+    else:
+        batch = torch.randn(args.batch_size, kong.getWide[0])
+    with torch.inference_mode():
+        original, fused = kong(batch), gotenks(batch)
+    for i, (o, f) in enumerate(zip(original, fused)):
+        print("Task {}: max abs difference {:.2e}, same argmax {}".format(i, (o - f).abs().max().item(), bool((o.argmax(1) == f.argmax(1)).all())))
+    kongTime, gotenksTime = HowFastIsHe(kong, batch), HowFastIsHe(gotenks, batch)
+    print("Latency per batch of {}: original {:.3f} ms, fused {:.3f} ms ({:.1f}x)".format(args.batch_size, kongTime * 1000, gotenksTime * 1000, kongTime / gotenksTime))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--model', type=str, required=True, help='filepath to a saved DiddyKongRacing state_dict')
+    parser.add_argument('-o', '--output', type=str, required=True, help='filepath to save the frozen TorchScript model to')
+    parser.add_argument('-q', '--quantize', action='store_true', help='dynamically quantize the fused first layer to int8')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='batch size for the equivalence check and timing')
+    args = parser.parse_args()
+    main(args)
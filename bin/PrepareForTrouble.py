@@ -1,52 +1,79 @@
 '''
 @author = james
 Functions used to generate ROC plots for openSNP test set. If want to save instead of outputting to nb simply pass in save=True to TeamROCket.
+To compare many models (or plot with no display) use RocketScience.py instead.
 Example to run (note first arg==Loaded trained model for first line):
-whatAreMyScores = np.array(Meowth(whoeverMadeQualExamsAThingHasEarnedMyEternalIre, test_loader, pleaseBeGpu))
-phenotypeLabels = list(pd.read_csv("../Sheen/test_labels.csv").loc[:, "label"])
+whatAreMyScores, phenotypeLabels = Meowth(whoeverMadeQualExamsAThingHasEarnedMyEternalIre, test_loader, pleaseBeGpu)
 irisPlexScores = np.array(pd.read_csv("../Sheen/openSNP_final_iris_preds.tsv", sep="\t").loc[:, "brown":"other"])
 TeamROCket(whatAreMyScores, phenotypeLabels, "Get Gymwrecked")
 TeamROCket(irisPlexScores, phenotypeLabels, "IrisPlex")
 '''
 
+import numpy as np
+import torch
 import matplotlib.pyplot as plt
 from itertools import cycle
 
-from sklearn.metrics import roc_curve, auc
-from sklearn.preprocessing import label_binarize
 from sklearn.metrics import roc_auc_score
+from RocketScience import Binarize, RocCurve, LookingForTrouble
 
-def Meowth(model, loader, pleaseBeGpu):
+#Scores every sample in a loader, returns (scores, labels) as arrays in loader order:
+#   scores == N x classes array of unactivated outputs of the first head, or a list of them for every head with allHeads=True
+#   labels == the labels the loader handed out with them (N, or N x tasks if there are several label columns)
+#Runs under inference_mode and copies each batch into its slice of preallocated arrays, labels never go to the device
+#The arrays are sized for the whole dataset and cut to the samples the loader actually handed out
+def Meowth(model, loader, pleaseBeGpu, allHeads=False):
     model.eval()
-    predictedScores = list()
-    #orderOfPheno = will just be pulled from the CSV of labels here: phenotype_file="../Sheen/test_labels.csv", 
-    for i, (snpBatch, phenotypeBatch) in enumerate(loader): 
-        #print(*phenotypeBatch.tolist())
-        snpBatch = snpBatch.to(pleaseBeGpu)
-        phenotypeBatch = phenotypeBatch.to(pleaseBeGpu)
-        output = model(snpBatch)
-        for el in output[0].to('cpu').detach().numpy():
-            predictedScores.append(el)
-     
-    
-    return predictedScores 
+    numSamples = len(loader.dataset)
+    predictedScores, labels = None, None
+    start = 0
+    with torch.inference_mode():
+        for i, (snpBatch, phenotypeBatch) in enumerate(loader):
+            output = model(snpBatch.to(pleaseBeGpu, non_blocking=True))
+            stop = start + len(phenotypeBatch)
+            if predictedScores is None:
+                predictedScores = [np.empty((numSamples, head.shape[1]), dtype=np.float32) for head in output]
+                labels = np.empty((numSamples,) + tuple(phenotypeBatch.shape[1:]), dtype=phenotypeBatch.numpy().dtype)
+            for scores, head in zip(predictedScores, output):
+                scores[start:stop] = head.to('cpu').numpy()
+            labels[start:stop] = phenotypeBatch.numpy()
+            start = stop
 
-def TeamROCket(scores, labels, name, save=False):
-    y = label_binarize(labels, classes=[0, 1, 2])
+    if labels is None:
+        raise ValueError("Meowth got an empty loader, there is nothing to score")
+    #Only the rows batches were copied into (a sampler with drop_last or a subset leaves the rest unset)
+    predictedScores, labels = [scores[:start] for scores in predictedScores], labels[:start]
+    if labels.ndim == 2 and labels.shape[1] == 1:
+        labels = labels[:, 0]
+    return (predictedScores if allHeads else predictedScores[0]), labels
+
+#Per class and micro-average ROC curves and areas, what TeamROCket plots (also used to score models without plotting)
+#The curves and areas come from RocketScience's cumulative sums over sorted scores rather than one roc_curve call per class
+def PrepareForTroubleAndMakeItDouble(scores, labels):
+    y = Binarize(labels, classes=[0, 1, 2])
     n_classes = y.shape[1]
 
-    y_score = scores
+    y_score = np.asarray(scores)
 
     fpr = dict()
     tpr = dict()
-    roc_auc = dict()
     for i in range(n_classes):
-        fpr[i], tpr[i], _ = roc_curve(y[:, i], y_score[:, i])
-        roc_auc[i] = auc(fpr[i], tpr[i])
+        fpr[i], tpr[i] = RocCurve(y_score[:, i], y[:, i])
 
     # Compute micro-average ROC curve and ROC area
-    fpr["micro"], tpr["micro"], _ = roc_curve(y.ravel(), y_score.ravel())
-    roc_auc["micro"] = auc(fpr["micro"], tpr["micro"])
+    fpr["micro"], tpr["micro"] = RocCurve(y_score.ravel(), y.ravel())
+    metrics = LookingForTrouble(y_score, labels).iloc[0]
+    roc_auc = {key: metrics[key] for key in fpr}
+    
+    return fpr, tpr, roc_auc
+
+#Fraction of argmax predictions that match the labels
+def Wobbuffet(scores, labels):
+    return np.mean(np.argmax(scores, axis=1) == np.asarray(labels))
+
+def TeamROCket(scores, labels, name, save=False):
+    fpr, tpr, roc_auc = PrepareForTroubleAndMakeItDouble(scores, labels)
+    n_classes = len(roc_auc) - 1
     
     plt.figure(figsize=(7,7))
     lw=2.3
@@ -69,8 +96,9 @@ def TeamROCket(scores, labels, name, save=False):
     plt.ylabel('True Positive Rate')
     plt.title(name + ' Test Set ROC')
     plt.legend(loc="lower right")
-    plt.show()
+    #Save before showing, show() leaves a blank figure behind on most backends
     if save:
         plt.savefig(name + "_ROC.png")
+    plt.show()
         
     return None
\ No newline at end of file
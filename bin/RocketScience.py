@@ -0,0 +1,131 @@
+'''
+@author = james
+RocketScience.py scores many models' ROC AUCs at once without a display, for comparing models in a hyper parameter sweep:
+    1) one-vs-rest AUC for every class of every model from one sort of the scores (midranks, so ties count half like roc_auc_score)
+    2) micro-average AUC (all classes pooled) and macro-average AUC (mean of the class AUCs)
+    3) metrics go to a table (one row per model) that can be written to JSON/CSV
+    4) plotting is optional and headless (Agg canvas, never shown), ROC curves are NumPy cumulative sums over the sorted scores
+Example to run (scores are N x classes .npy files, e.g. np.save of what Meowth returns, in the order of the labels csv):
+python RocketScience.py -s Cinco_De_Mayo.npy LankyKong.npy -l ../Sheen/test_labels.csv -o ../results/test_auc --plot
+whatAreMyMetrics = LookingForTrouble(np.stack([cincoScores, lankyScores]), phenotypeLabels, ["Cinco_De_Mayo", "LankyKong"])
+'''
+
+import os
+import argparse
+import json
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+#Labels -> N x classes bool matrix, one-vs-rest (what label_binarize does)
+def Binarize(labels, classes = (0, 1, 2)):
+    return np.asarray(labels).reshape(-1, 1) == np.asarray(classes).reshape(1, -1)
+
+
+#AUCs of scores against bool labels along the last axis, any leading axes (models, classes) are done in the same sort
+#AUC == (sum of positive ranks - P(P+1)/2) / (P * N) with tied scores getting their average rank, nan if a class is missing
+def MidrankAUC(scores, y):
+    scores, y = np.broadcast_arrays(np.asarray(scores, dtype=np.float64), np.asarray(y, dtype=bool))
+    order = np.argsort(scores, axis=-1, kind='mergesort')
+    sortedScores = np.take_along_axis(scores, order, axis=-1)
+    sortedY = np.take_along_axis(y, order, axis=-1)
+
+    #First and last position of each run of tied scores, the midrank is their average (1 based)
+    n = scores.shape[-1]
+    idx = np.broadcast_to(np.arange(n), scores.shape)
+    newRun = np.ones(scores.shape, dtype=bool)
+    newRun[..., 1:] = sortedScores[..., 1:] != sortedScores[..., :-1]
+    endRun = np.ones(scores.shape, dtype=bool)
+    endRun[..., :-1] = newRun[..., 1:]
+    first = np.maximum.accumulate(np.where(newRun, idx, 0), axis=-1)
+    last = np.flip(np.minimum.accumulate(np.flip(np.where(endRun, idx, n - 1), axis=-1), axis=-1), axis=-1)
+    ranks = (first + last) / 2 + 1
+
+    positives = sortedY.sum(axis=-1)
+    negatives = n - positives
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return ((ranks * sortedY).sum(axis=-1) - positives * (positives + 1) / 2) / (positives * negatives)
+
+
+#ROC curve (fpr, tpr) of one score vector, one point per distinct threshold from highest to lowest
+def RocCurve(scores, y):
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='mergesort')
+    sortedScores, sortedY = np.asarray(scores)[order], np.asarray(y, dtype=bool)[order]
+    cut = np.r_[np.flatnonzero(np.diff(sortedScores)), len(sortedY) - 1]
+    tps = np.cumsum(sortedY)[cut]
+    fps = (cut + 1) - tps
+    return np.r_[0, fps] / max(fps[-1], 1), np.r_[0, tps] / max(tps[-1], 1)
+
+
+#Per class, micro and macro AUCs for one model (N x classes scores) or many (models x N x classes), one row per model
+def LookingForTrouble(scores, labels, names = None, classes = (0, 1, 2)):
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.ndim == 2:
+        scores = scores[None]
+    y = Binarize(labels, classes)
+
+    #models x classes x N, every class of every model in one sort
+    perClass = MidrankAUC(np.swapaxes(scores, 1, 2), y.T)
+    micro = MidrankAUC(scores.reshape(len(scores), -1), y.ravel())
+    metrics = pd.DataFrame(perClass, columns=list(classes), index=names)
+    metrics["micro"] = micro
+    metrics["macro"] = perClass.mean(axis=1)
+    return metrics
+
+
+#Save a metrics table as <prefix>.json (model -> {class: auc}) and <prefix>.csv
+def WriteTheRocket(metrics, prefix):
+    metrics.to_csv("{}.csv".format(prefix))
+    with open("{}.json".format(prefix), 'w') as f:
+        json.dump({str(name): {str(key): value for key, value in row.items()} for name, row in metrics.iterrows()}, f, indent=1)
+
+
+#Draw per class and micro-average ROC curves of one model on a headless figure, saved to filename if given
+def PlotTheRocket(scores, labels, name, filename = None, classes = (0, 1, 2)):
+    scores = np.asarray(scores, dtype=np.float64)
+    y = Binarize(labels, classes)
+    metrics = LookingForTrouble(scores, labels, classes=classes).iloc[0]
+
+    fig = Figure(figsize=(7,7))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    fpr, tpr = RocCurve(scores.ravel(), y.ravel())
+    ax.plot(fpr, tpr, label='micro-average ROC curve (area = {0:0.2f})'.format(metrics["micro"]),
+            color='indigo', linestyle=':', linewidth=4)
+    for i, color in zip(range(len(classes)), ['cyan', 'green', 'red']):
+        fpr, tpr = RocCurve(scores[:, i], y[:, i])
+        ax.plot(fpr, tpr, color=color, lw=2.3, label='ROC curve of class {0} (area = {1:0.2f})'.format(classes[i], metrics[classes[i]]))
+    ax.plot([0, 1], [0, 1], 'k--', lw=2.3)
+    ax.set_xlim([0.0, 1.0])
+    ax.set_ylim([0.0, 1.05])
+    ax.set_xlabel('False Positive Rate')
+    ax.set_ylabel('True Positive Rate')
+    ax.set_title(name + ' Test Set ROC')
+    ax.legend(loc="lower right")
+    if filename is not None:
+        fig.savefig(filename)
+    return fig
+
+
+def main(args):
+    labels = pd.read_csv(args.labels, index_col=0).iloc[:, 0].values
+    names = [os.path.splitext(os.path.basename(filename))[0] for filename in args.scores]
+    scores = np.stack([np.load(filename) for filename in args.scores])
+    metrics = LookingForTrouble(scores, labels, names)
+    WriteTheRocket(metrics, args.output)
+    print(metrics.to_string())
+    if args.plot:
+        for name, modelScores in zip(names, scores):
+            PlotTheRocket(modelScores, labels, name, "{}_{}_ROC.png".format(args.output, name))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--scores', type=str, nargs='+', required=True, help='N x classes .npy score matrices, one per model')
+    parser.add_argument('-l', '--labels', type=str, required=True, help='labels csv (first column after the index), rows in the same order as the scores')
+    parser.add_argument('-o', '--output', type=str, required=True, help='prefix to write <prefix>.json and <prefix>.csv (and <prefix>_<model>_ROC.png) to')
+    parser.add_argument('-p', '--plot', action='store_true', help='also save a ROC plot per model')
+    args = parser.parse_args()
+    main(args)
@@ -1,8 +1,14 @@
+import os
+import sys
 import pandas as pd
 import torch
 from torch.utils import data
 import numpy as np
 
+# The genotype store format lives with the preprocessing scripts that write it
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_preprocessing"))
+from genotypeStore import read_store
+
 class SNPDataset(data.Dataset):
     """Characterizes a dataset for PyTorch."""
 
@@ -33,10 +39,95 @@ class SNPDataset(data.Dataset):
         return X,y
 
 
-def get_loader(genotype_file, phenotype_file, batch_size, shuffle, num_workers, pickle=False):
-    """Returns torch.utils.data.DataLoader for geno dataset."""
+class SNPArrayDataset(data.Dataset):
+    """Array-backed version of SNPDataset.
+
+    Genotypes and phenotypes are converted once at construction into contiguous
+    float32/int64 arrays ordered like the phenotype file, so indexing is a plain
+    array slice instead of a pandas label lookup. Integer indices return zero-copy
+    tensor views, lists of indices return a whole batch from one fancy-index slice.
+    With memmap=True geno_file is the .json sidecar of a genotype store and the
+    matrix is memory-mapped instead of loaded, so forked workers share one copy.
+    With dosage=True genotypes stay int8 dosages (-1 missing) for DosageKong64
+    models instead of being cast to float32.
+    """
+
+    def __init__(self, geno_file, pheno_file, pickle=False, memmap=False, dosage=False):
+        """Initialization.
+        Args:
+            geno_file
+            pheno_file
+        """
+        phenotypes = pd.read_csv(pheno_file, index_col=0)
+        self.list_ids = phenotypes.index
+        self.geno_file = geno_file
+        self.memmap = memmap
+        self.dosage = dosage
+
+        # Row of every ID, computed once (raises KeyError like .loc for unknown IDs)
+        ids = [str(ID) for ID in self.list_ids]
+        if memmap:
+            self.genotypes, samples, _ = read_store(geno_file, mode='c')  # copy-on-write so tensors can view it
+            rows = pd.Index(samples).get_indexer(ids)
+        else:
+            if pickle == False:
+                genotypes = pd.read_csv(geno_file, index_col=0)
+            else:
+                genotypes = pd.read_pickle(geno_file)
+            rows = genotypes.index.get_indexer(ids)
+        if (rows < 0).any():
+            raise KeyError("IDs in {} missing from {}: {}".format(pheno_file, geno_file, list(self.list_ids[rows < 0][:5])))
+
+        if memmap:
+            self.rows = rows
+        else:
+            self.genotypes = np.ascontiguousarray(genotypes.to_numpy(dtype=np.int8 if dosage else np.float32)[rows])
+            self.rows = np.arange(len(rows))
+        self.phenotypes = np.array(phenotypes.to_numpy(), dtype=np.int64, order='C')
+
+    def __len__(self):
+        return len(self.list_ids)
+
+    def __getitem__(self, index):
+        """Returns one data pair (genotypes and label), or a whole batch for a list of indices."""
+        if not isinstance(index, (int, np.integer)):
+            index = np.asarray(index, dtype=np.int64)
+        X = torch.from_numpy(self.genotypes[self.rows[index]])
+        y = torch.from_numpy(self.phenotypes[index])
+        if X.dtype != torch.float32 and not self.dosage:
+            X = X.float()
+        return X,y
+
+    def __getstate__(self):
+        # Reopen the memmap in spawned workers rather than pickling the matrix
+        state = self.__dict__.copy()
+        if self.memmap:
+            state["genotypes"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.memmap:
+            self.genotypes = read_store(self.geno_file, mode='c')[0]
+
+
+def get_loader(genotype_file, phenotype_file, batch_size, shuffle, num_workers, pickle=False, array=True, memmap=False, dosage=False, pin_memory=False):
+    """Returns torch.utils.data.DataLoader for geno dataset.
+
+    With array=True (default) the array-backed dataset is used and batches are built
+    by a BatchSampler, so each batch is a single slice rather than batch_size lookups.
+    Pass array=False to get the original per-sample pandas dataset, or memmap=True
+    to memory-map a genotype store (genotype_file is then its .json sidecar).
+    Pass dosage=True to keep int8 dosage batches for a DiddyKongRacing(dosage=True).
+    pin_memory=True puts batches in page-locked memory so .to(gpu, non_blocking=True) overlaps the copy.
+    """
+    if not array:
+        geno = SNPDataset(geno_file=genotype_file, pheno_file=phenotype_file, pickle=pickle)
+        params = {'batch_size': batch_size, 'shuffle': shuffle,'num_workers': num_workers, 'pin_memory': pin_memory}
+        return torch.utils.data.DataLoader(dataset=geno,**params)
 
-    geno = SNPDataset(geno_file=genotype_file, pheno_file=phenotype_file, pickle=pickle)
-    params = {'batch_size': batch_size, 'shuffle': shuffle,'num_workers': num_workers}
-    data_loader = torch.utils.data.DataLoader(dataset=geno,**params)
-    return data_loader
\ No newline at end of file
+    geno = SNPArrayDataset(geno_file=genotype_file, pheno_file=phenotype_file, pickle=pickle, memmap=memmap, dosage=dosage)
+    sampler = data.RandomSampler(geno) if shuffle else data.SequentialSampler(geno)
+    batches = data.BatchSampler(sampler, batch_size=batch_size, drop_last=False)
+    data_loader = torch.utils.data.DataLoader(dataset=geno, sampler=batches, batch_size=None, num_workers=num_workers, pin_memory=pin_memory)
+    return data_loader
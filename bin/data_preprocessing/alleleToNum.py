@@ -9,19 +9,43 @@ import os
 import pandas as pd
 import argparse
 import numpy as np
-from tqdm import tqdm
-tqdm.pandas()
 
 
-# Function to convert genotype from nucleotides to numbers 
-# 0 (homozygous reference), 1(heteroozygous), 2 (homozygous minor allele)
-def get_gt(x):
-    for col in x.index[3:-2]:       
-        if isinstance(x[col], str):
-            ref_allele = x["REF"]
-            gt = 2 - x[col].upper().count(ref_allele)
-            x[col] = gt
-    return x
+# Function to convert genotypes from nucleotides to numbers for a whole SNP x individual block
+# 0 (homozygous reference), 1(heteroozygous), 2 (homozygous minor allele), -1 (missing or --)
+# Genotype strings and REF alleles are encoded as small integer codes, the REF allele count is
+# worked out once per (genotype, REF) code pair and then looked up for every cell with NumPy
+def get_gt(genotypes, ref):
+    values = np.asarray(genotypes, dtype=object)
+    codes, uniques = pd.factorize(values.ravel())
+    codes = codes.reshape(values.shape)
+    ref_codes, ref_uniques = pd.factorize(np.asarray(ref, dtype=object))
+
+    # Lookup table of 2 - count(REF) for each distinct genotype string and REF allele
+    table = np.full((len(uniques) + 1, len(ref_uniques) + 1), -1, dtype=np.int8)
+    for i, gt in enumerate(uniques):
+        if isinstance(gt, str) and gt != '--':
+            for j, ref_allele in enumerate(ref_uniques):
+                if isinstance(ref_allele, str):
+                    table[i, j] = 2 - gt.upper().count(ref_allele)
+
+    # Missing codes (-1) index the last row/column of the table, which stays -1
+    return table[codes, ref_codes[:, None]]
+
+
+# Codes from get_gt as a table of nullable "Int8" (missing is <NA>), so it is written as 0/1/2 and empty like the old
+# row-wise apply wrote its object columns, not as 0.0/1.0/2.0
+def to_table(gt, columns, index=None, dtype="Int8"):
+    return pd.DataFrame(np.where(gt < 0, np.nan, gt), columns=columns, index=index).astype(dtype)
+
+
+# Convert one chunk of filtered genotypes, keeping only SNPs found in 1000Genomes
+# ref is the 1000Genomes REF allele table indexed by rsID, so the join is a hash lookup
+def convert_chunk(chunk, ref):
+    gt_char = chunk.join(ref, on="rsid", how="inner")
+    users = gt_char.columns[3:-1]
+    gt = get_gt(gt_char[users], gt_char["REF"])
+    return pd.concat([gt_char.iloc[:, :3], to_table(gt, users, gt_char.index), gt_char[["REF"]]], axis=1)
 
 
 #Main function
@@ -30,27 +54,29 @@ def main(args):
     # Open log file for writing
     log = open("{}/alleleToNum.log".format(args.log_dir), 'w')
     
-    # Read in filtered genotypes
-    filtered_genotypes = pd.read_csv(args.genotype_file, sep='\t')
-    log.writelines("Number of SNPs in {}: {}\n".format(args.genotype_file, len(filtered_genotypes)))
-    
-    # Replace -- with NaN
-    filtered_genotypes = filtered_genotypes.replace('--', np.nan)
-
-    # Read in the final SNP the final SNP set
+    # Read in the final SNP the final SNP set, kept in memory as an rsID index of REF alleles
     oneK_ref = pd.read_csv(args.rsids, sep='\t')
-    log.writelines("Number of SNPs in {}: {}\n".format(args.rsids, len(oneK_ref)))
+    ref = oneK_ref.set_index("ID")[["REF"]]
     
-    # Keep only SNPs found in 1000Genomes
-    gt_char = filtered_genotypes.merge(oneK_ref, left_on="rsid", right_on="ID")
-
-    # WARNING: Getting the numbers takes about an hour and half
-    gt_nums = gt_char.progress_apply(get_gt, axis=1)
-    gt_nums = gt_nums.drop("ID", axis=1)
+    # Stream the filtered genotypes in row chunks so memory depends on chunk size, not number of SNPs
+    outfile = "{}/openSNP_final_genotypes.tsv".format(args.output_dir)
+    num_snps, num_out, pickled = 0, 0, []
+    for i, chunk in enumerate(pd.read_csv(args.genotype_file, sep='\t', chunksize=args.chunk_size)):
+        num_snps += len(chunk)
+        
+        # Convert all individuals in the chunk at once (-- counts as missing) and append to output
+        gt_nums = convert_chunk(chunk, ref)
+        gt_nums.to_csv(outfile, sep='\t', index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+        num_out += len(gt_nums)
+        if args.pickle:
+            pickled.append(gt_nums)
     
     # Save a final SNP vs indiviudal table with other SNP info in it
-    log.writelines("Number of SNPs in output: {}\n".format(len(gt_nums)))
-    gt_nums.to_csv("{}/openSNP_final_genotypes.tsv".format(args.output_dir), sep='\t', index=False)
+    log.writelines("Number of SNPs in {}: {}\n".format(args.genotype_file, num_snps))
+    log.writelines("Number of SNPs in {}: {}\n".format(args.rsids, len(oneK_ref)))
+    log.writelines("Number of SNPs in output: {}\n".format(num_out))
+    if args.pickle:
+        pd.concat(pickled, ignore_index=True).to_pickle("{}/openSNP_final_genotypes.pickle".format(args.output_dir))
     
                
 if __name__ == '__main__':
@@ -59,7 +85,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-g', '--genotype_file', type=str, default=GENOTYPES, help='filepath to openSNP filtered genotype tsv, default is {}'.format(GENOTYPES))
     parser.add_argument('-id', '--rsids', type=str, default=ONEK_RSIDS, help='filepath to 1000Genomes rsids with ref allele default is {}'.format(ONEK_RSIDS))
-    parser.add_argument('-p', '--pickle', type=bool, default=False, help='Boolean for whether or not to save output as a pickle file')
+    parser.add_argument('-p', '--pickle', type=bool, default=False, help='Boolean for whether or not to also save output as a pickle file (Int8 genotype columns)')
+    parser.add_argument('-c', '--chunk_size', type=int, default=100000, help='number of SNPs to read and convert at a time, default is 100000')
     parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
     parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
     args = parser.parse_args()
@@ -0,0 +1,180 @@
+"""
+Time the preprocessing scripts end to end on syntheticData.py datasets of several sizes, to catch regressions between commits
+Input:
+    - scales: openSNP users x SNPs (e.g. 100x20000 300x100000), each gets its own synthetic dataset in --work_dir
+      (reused while its settings match), all with --samples 1000Genomes samples
+Output:
+    - pipeline_benchmark.json: git commit, machine and one row per scale and stage with wall time, peak RSS and throughput
+Notes:
+    - stages run in order as their own processes, each reading what the previous ones wrote like the real workflow:
+      initialPhenotypes, extractGenotypes, filterGenotypes, alleleToNum, predictPhenotype, extractTrainSet,
+      extractTestSet and loadTrainSet (one shuffled epoch over the train store with data_loader.get_loader)
+    - seconds is the fastest of --repeats runs, peak_rss_mb the largest resident set of the stage process (or of a
+      worker it waited for, e.g. extractGenotypes --jobs), from os.wait4
+    - throughput is items per second, items being the raw files, individuals or genotype calls (SNPs x individuals)
+      the stage goes through at that scale
+    - --compare prints each stage's time and peak RSS next to an earlier results file
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import pandas as pd
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# One epoch over the train store the way train.py reads it
+LOAD_TRAIN_SET = """
+import sys
+from data_loader import get_loader
+loader = get_loader(sys.argv[1], sys.argv[2], int(sys.argv[3]), True, 0, memmap=True)
+for X, y in loader:
+    pass
+"""
+
+
+# Parse a USERSxSNPS scale
+def parse_scale(scale):
+    users, snps = scale.lower().split("x")
+    return int(users), int(snps)
+
+
+# Every stage as (name, command, working dir, unit, items), data is the synthetic dataset and run the output dir
+def pipeline(data, run, users, snps, samples, args):
+    script = lambda name: [sys.executable, os.path.join(HERE, name)]
+    out = ["-o", run, "-l", run]
+    return [
+        ("initialPhenotypes", script("initialPhenotypes.py") + ["-p", os.path.join(data, "phenotypes_synthetic.csv")] + out,
+         HERE, "users", users),
+        ("extractGenotypes", script("extractGenotypes.py") + ["-i", os.path.join(data, "openSNP_initial_userids.txt"),
+         "-g", os.path.join(data, "genotypes"), "-j", str(args.jobs)] + out, HERE, "files", users),
+        ("filterGenotypes", script("filterGenotypes.py") + ["-g", os.path.join(run, "openSNP_initial_genotypes.tsv")] + out,
+         HERE, "genotypes", users * snps),
+        ("alleleToNum", script("alleleToNum.py") + ["-g", os.path.join(run, "openSNP_filtered_genotypes.tsv"),
+         "-id", os.path.join(data, "oneK_rsids.tsv")] + out, HERE, "genotypes", users * snps),
+        ("predictPhenotype", script("predictPhenotype.py") + ["-g", os.path.join(data, "iris_oneK_genotypes.tsv"),
+         "-ip", os.path.join(data, "irisplex.bed")] + out, HERE, "individuals", samples),
+        ("extractTrainSet", script("extractTrainSet.py") + ["-g", os.path.join(data, "oneK_genotypes.tsv"),
+         "-t", os.path.join(run, "train_ids.txt"), "-v", os.path.join(run, "val_ids.txt"),
+         "-so", os.path.join(run, "openSNP_final_genotypes.tsv")] + out, HERE, "genotypes", samples * snps),
+        ("extractTestSet", script("extractTestSet.py") + ["-g", os.path.join(run, "openSNP_final_genotypes.tsv"),
+         "-p", os.path.join(run, "openSNP_initial_phenotypes.tsv"), "-s", os.path.join(run, "train_set_stats.tsv")] + out,
+         HERE, "genotypes", users * snps),
+        ("loadTrainSet", [sys.executable, "-c", LOAD_TRAIN_SET, os.path.join(run, "train_set.json"),
+         os.path.join(run, "train_labels.csv"), str(args.batch_size)], os.path.dirname(HERE), "individuals", samples),
+    ]
+
+
+# Run a command, returns (exit code, seconds, peak RSS in MB), output goes to log_file
+def run_stage(command, cwd, log_file):
+    with open(log_file, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, seconds, usage.ru_maxrss / 1024
+
+
+# Make the synthetic dataset of a scale unless the one already there was made with the same settings
+def make_dataset(data, users, snps, args):
+    wanted = {"users": users, "snps": snps, "samples": args.samples, "seed": args.seed}
+    settings = os.path.join(data, "synthetic.json")
+    if os.path.exists(settings):
+        with open(settings) as f:
+            made = json.load(f)
+        if all(made.get(key) == value for key, value in wanted.items()):
+            return False
+    os.makedirs(data, exist_ok=True)
+    command = [sys.executable, os.path.join(HERE, "syntheticData.py"), "-u", str(users), "-n", str(snps),
+               "-k", str(args.samples), "-r", str(args.seed), "-o", data, "-l", data]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return True
+
+
+# Commit the benchmark ran on (with -dirty for uncommitted changes), None outside a git checkout
+def git_commit():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Stage times and peak RSS next to an earlier results file (ratios above 1 are slower/bigger now)
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    keys = ["users", "snps", "samples", "stage"]
+    new = pd.DataFrame(results)[keys + ["seconds", "peak_rss_mb"]]
+    old = pd.DataFrame(baseline["results"])[keys + ["seconds", "peak_rss_mb"]]
+    table = old.merge(new, on=keys, suffixes=("_old", "_new"))
+    table["time_ratio"] = table["seconds_new"] / table["seconds_old"]
+    table["rss_ratio"] = table["peak_rss_mb_new"] / table["peak_rss_mb_old"]
+    print("Compared to {} ({}):".format(baseline_file, baseline.get("commit")))
+    print(table.round(3).to_string(index=False))
+    return table
+
+
+# Main function
+def main(args):
+    results = []
+    for scale in args.scales:
+        users, snps = parse_scale(scale)
+        name = "{}x{}x{}".format(users, snps, args.samples)
+        work_dir = os.path.abspath(args.work_dir)  # stages run from bin/data_preprocessing
+        data, run = os.path.join(work_dir, name, "data"), os.path.join(work_dir, name, "run")
+        os.makedirs(run, exist_ok=True)
+        print("Scale {}: {} users x {} SNPs, {} 1000Genomes samples".format(name, users, snps, args.samples))
+        if make_dataset(data, users, snps, args):
+            print("  made synthetic dataset in {}".format(data))
+
+        # Each stage needs the outputs of the ones before it, so a failure ends the scale
+        for stage, command, cwd, unit, items in pipeline(data, run, users, snps, args.samples, args):
+            times, peak = [], 0.0
+            for repeat in range(args.repeats):
+                code, seconds, rss = run_stage(command, cwd, os.path.join(run, "{}.out".format(stage)))
+                if code != 0:
+                    break
+                times.append(seconds)
+                peak = max(peak, rss)
+            row = {"users": users, "snps": snps, "samples": args.samples, "stage": stage, "returncode": code,
+                   "unit": unit, "items": items, "seconds": min(times) if times else None, "all_seconds": times,
+                   "throughput": items / min(times) if times else None, "peak_rss_mb": peak if times else rss}
+            results.append(row)
+            if code != 0:
+                print("  {} failed with exit code {}, see {}".format(stage, code, os.path.join(run, "{}.out".format(stage))))
+                break
+            print("  {:<18} {:>9.2f}s {:>9.1f} MB {:>14.0f} {}/s".format(stage, row["seconds"], row["peak_rss_mb"], row["throughput"], unit))
+
+    # Results with what they ran on
+    output = {"commit": git_commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(),
+              "platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(),
+              "settings": {"samples": args.samples, "seed": args.seed, "repeats": args.repeats, "jobs": args.jobs, "batch_size": args.batch_size},
+              "results": results}
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=1)
+    print("Results written to {}".format(args.output))
+    if args.compare != None:
+        compare(results, args.compare)
+    if any(row["returncode"] != 0 for row in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--scales', type=str, nargs='+', default=["100x20000", "300x100000"], help='USERSxSNPS sizes to run, default is 100x20000 300x100000')
+    parser.add_argument('-k', '--samples', type=int, default=1000, help='number of 1000Genomes samples at every scale, default is 1000')
+    parser.add_argument('-r', '--repeats', type=int, default=1, help='runs of each stage, the fastest is kept, default is 1')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='--jobs for extractGenotypes.py, default is 1')
+    parser.add_argument('-b', '--batch_size', type=int, default=64, help='batch size of the loadTrainSet stage, default is 64')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic datasets, default is 0')
+    parser.add_argument('-w', '--work_dir', type=str, default='benchmark_data', help='where the synthetic datasets and stage outputs go, default is benchmark_data')
+    parser.add_argument('-c', '--compare', type=str, default=None, help='earlier results json to compare against')
+    parser.add_argument('-o', '--output', type=str, default='pipeline_benchmark.json', help='results json, default is pipeline_benchmark.json')
+    args = parser.parse_args()
+    main(args)
@@ -7,15 +7,219 @@ Input:
     - list of userids
 Output: 
     - openSNP_initial_genotypes.tsv: tab deliminated table of SNPs vs individuals
+Notes:
+    - with --cache_dir every file parsed is kept as the indexes of its rsids (into rsids.txt, every rsid ever seen) and
+      its genotypes, listed with its size, mtime, sha1 and status in manifest.json, so a rerun on a refreshed dump only
+      parses new or changed files (a file that only got a new mtime is matched on its sha1) and rebuilds the same
+      table from the cache, the first valid file is still read for its chromosome and position columns
 """
 
 import pandas as pd
 import os
-import glob
 import numpy as np
 import tqdm
 import re
+import json
+import hashlib
 import argparse
+from multiprocessing import Pool
+
+
+# Unique rsids of the first valid file, shared with worker processes
+lookup = None
+
+
+def set_lookup(rsids):
+    global lookup
+    lookup = rsids
+
+
+# Scan the genotype directory once and map each user id to its first file (like glob("user{id}_*")[0])
+def scan_genotype_dir(path):
+    user_files = {}
+    for entry in os.scandir(path):
+        if entry.name.startswith("user") and "_" in entry.name:
+            user_files.setdefault(entry.name[4:entry.name.index("_")], entry.name)
+    return user_files
+
+
+# Read a 23andMe or AncestryDNA raw file with fixed string dtypes and only the needed columns
+# Returns None for unused filetypes, raises if the file cannot be read as csv
+def read_genotype_file(filename, base=False):
+    if "23andme.txt" in filename:
+        columns = ['rsid', 'chromosome', 'position', 'gt']
+        current = pd.read_csv(filename, sep='\t', names=columns, comment='#', dtype=str,
+                              usecols=columns if base else ['rsid', 'gt'])
+    elif "ancestry.txt" in filename:
+        columns = ['rsid', 'chromosome', 'position', 'allele1', 'allele2']
+        current = pd.read_csv(filename, sep='\t', comment='#', dtype=str,
+                              usecols=columns if base else ['rsid', 'allele1', 'allele2'])
+        current["gt"] = current["allele1"] + current["allele2"]
+    else:
+        return None
+    return current
+
+
+# Worker: parse one file into compact arrays, its rows' slots in lookup and encoded genotypes
+def parse_genotype_file(filename):
+    try:
+        current = read_genotype_file(filename)
+    except Exception:
+        return "bad_csv", None
+    if current is None:
+        return "bad_type", None
+    return "valid", (lookup.get_indexer(current["rsid"]), encode_genotypes(current["gt"]))
+
+
+# Encode genotype strings as short byte strings (b'' for missing)
+def encode_genotypes(gts):
+    return gts.fillna('').astype(str).to_numpy().astype('S')
+
+
+# Worker for the cache: parse one file into its rsids (NaN as '') and encoded genotypes
+def parse_genotype_rsids(filename):
+    try:
+        current = read_genotype_file(filename)
+    except Exception:
+        return "bad_csv", None
+    if current is None:
+        return "bad_type", None
+    return "valid", (current["rsid"].fillna('').to_numpy(dtype=object), encode_genotypes(current["gt"]))
+
+
+# sha1 of a file's contents
+def file_sha1(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Open (or start) the parse cache in cache_dir
+def load_cache(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest, rsids = {}, []
+    if os.path.exists(os.path.join(cache_dir, "manifest.json")):
+        with open(os.path.join(cache_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        with open(os.path.join(cache_dir, "rsids.txt")) as f:
+            rsids = f.read().split("\n")[:-1]
+    return {"dir": cache_dir, "manifest": manifest, "rsids": rsids, "num_saved": len(rsids), "index": pd.Index(rsids)}
+
+
+# Cache indexes of a file's rsids, adding the ones not seen before
+def rsid_indexes(cache, rsids):
+    indexes = cache["index"].get_indexer(rsids)
+    if (indexes < 0).any():
+        cache["rsids"].extend(pd.unique(rsids[indexes < 0]))
+        cache["index"] = pd.Index(cache["rsids"])
+        indexes = cache["index"].get_indexer(rsids)
+    return indexes.astype(np.int32)
+
+
+# Cached status of a file, None if it is not cached or changed since (a new mtime with the same sha1 still counts)
+def cached_status(cache, filename):
+    entry = cache["manifest"].get(filename)
+    if entry is None:
+        return None
+    stat = os.stat(filename)
+    if entry["size"] != stat.st_size:
+        return None
+    if entry["mtime_ns"] != stat.st_mtime_ns:
+        if file_sha1(filename) != entry["sha1"]:
+            return None
+        entry["mtime_ns"] = stat.st_mtime_ns
+    if entry["status"] == "valid" and not os.path.exists(os.path.join(cache["dir"], filename + ".npz")):
+        return None
+    return entry["status"]
+
+
+# Cached (rsid indexes, genotypes) of a valid file
+def load_cached_file(cache, filename):
+    with np.load(os.path.join(cache["dir"], filename + ".npz")) as data:
+        return data["rsids"], data["genotypes"]
+
+
+# Add a parsed file to the cache, returns its (rsid indexes, genotypes) for valid files
+def cache_file(cache, filename, status, parsed=None):
+    stat = os.stat(filename)
+    cache["manifest"][filename] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": file_sha1(filename), "status": status}
+    if status != "valid":
+        return None
+    rsids, values = parsed
+    indexes = rsid_indexes(cache, rsids)
+    np.savez(os.path.join(cache["dir"], filename + ".npz"), rsids=indexes, genotypes=values)
+    return indexes, values
+
+
+# Save the new rsids and the manifest (rsids first, the manifest points into them), forgetting files no longer there
+def save_cache(cache, present):
+    for filename in [filename for filename in cache["manifest"] if filename not in present]:
+        if os.path.exists(os.path.join(cache["dir"], filename + ".npz")):
+            os.remove(os.path.join(cache["dir"], filename + ".npz"))
+        del cache["manifest"][filename]
+    with open(os.path.join(cache["dir"], "rsids.txt"), 'a') as f:
+        f.writelines("{}\n".format(rsid) for rsid in cache["rsids"][cache["num_saved"]:])
+    cache["num_saved"] = len(cache["rsids"])
+    with open(os.path.join(cache["dir"], "manifest.json.tmp"), 'w') as f:
+        json.dump(cache["manifest"], f)
+    os.replace(os.path.join(cache["dir"], "manifest.json.tmp"), os.path.join(cache["dir"], "manifest.json"))
+
+
+# Place one user's genotypes in the output rows (same rows as a left merge on rsid)
+# lookup holds the unique rsids of the first file, base_slots maps its rows into lookup
+# and row_base maps each output row back to a row of the first file
+def fill_column(genotypes, row_base, col, lookup, base_slots, slots, values):
+    if values.dtype.itemsize > genotypes.dtype.itemsize:
+        genotypes = genotypes.astype(values.dtype)
+    found = np.flatnonzero(slots >= 0)
+    counts = np.bincount(slots[found], minlength=len(lookup))
+    row_slots = base_slots[row_base]
+
+    # Usual case: each rsid appears at most once in the file
+    if counts.max(initial=0) <= 1:
+        column = np.zeros(len(lookup), dtype=genotypes.dtype)
+        column[slots[found]] = values[found]
+        genotypes[:, col] = column[row_slots]
+        return genotypes, row_base
+
+    # Duplicated rsids repeat the matching rows once per occurrence, like merge does
+    order = found[np.argsort(slots[found], kind='stable')]
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    repeats = np.maximum(counts[row_slots], 1)
+    expand = np.repeat(np.arange(len(row_slots)), repeats)
+    copy = np.arange(len(expand)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    genotypes, row_base, row_slots = genotypes[expand], row_base[expand], row_slots[expand]
+    column = np.zeros(len(expand), dtype=genotypes.dtype)
+    hit = counts[row_slots] > 0
+    column[hit] = values[order[first[row_slots[hit]] + copy[hit]]]
+    genotypes[:, col] = column
+    return genotypes, row_base
+
+
+# Stream the rsid-filtered SNP x individual table to a tsv without building one big DataFrame
+def write_genotypes(filename, base, genotypes, user_ids, block_size=100000):
+    rsid_re = re.compile('rs[0-9]+')
+    rows = np.flatnonzero(base["rsid"].str.match(rsid_re, na=False).values)
+    base = base.iloc[rows].reset_index(drop=True)
+    with open(filename, 'w') as out:
+        for start in range(0, max(len(rows), 1), block_size):
+            block = genotypes[rows[start:start + block_size]]
+            values = block.astype(str).astype(object)
+            values[block == b''] = np.nan
+            frame = pd.concat([base.iloc[start:start + block_size].reset_index(drop=True),
+                               pd.DataFrame(values, columns=user_ids)], axis=1)
+            frame.to_csv(out, sep='\t', index=False, header=(start == 0), na_rep=np.nan)
+    return len(rows)
+
+
+# Report a file that could not be used
+def log_bad_file(log, status, filename):
+    if status == "bad_csv":
+        log.writelines("Error when reading {} as csv\n".format(filename))
+    else:
+        log.writelines("Error: filetype not currently used: {}\n".format(filename))
 
 
 # Main function
@@ -28,11 +232,18 @@ def main(args):
     # Log file for reporting
     log = open("{}/extractGenotypes.log".format(args.log_dir), 'w')
     
+    # Parse cache (optional), opened before leaving the current directory
+    cache = load_cache(os.path.abspath(args.cache_dir)) if args.cache_dir != None else None
+    num_parsed = 0
+
     # Open directory with genotype files
     os.chdir(args.genotypes_dir)
 
-    # Create a directory to hold genotypes
-    merged = pd.DataFrame()
+    # Rows come from the first valid file, genotypes are filled into a preallocated
+    # SNP x individual array of short byte strings (b'' marks a missing genotype)
+    base = None
+    genotypes = None
+    user_ids = []
 
     # Useful counters
     num_bad_files = 0
@@ -42,59 +253,106 @@ def main(args):
     if args.subset != None:
         ids = ids[:args.subset]
         
-    # Loop through the files
-    for i, id in enumerate(tqdm.tqdm(ids)):
-        filename = glob.glob("user{}_*".format(id))[0]
-
-        # Check for valid 23andMe filetype
-        if "23andme.txt" in filename:
-            try:
-                current = pd.read_csv(filename, sep='\t', names=['rsid', 'chromosome', 'position', 'gt'], comment='#')
-            except:
-                log.writelines("Error when reading {} as csv\n".format(filename))
-                num_bad_files += 1
-                continue
-            else:
-                current[str(id)] = current["gt"]
-
-        # Check for valid AncestryDNA filetype
-        elif "ancestry.txt" in filename:
-            try:
-                current = pd.read_csv(filename, sep='\t', comment='#')
-            except:
-                log.writelines("Error when reading {} as csv\n".format(filename))
-                num_bad_files += 1
-                continue
-            else:
-                current[str(id)] = current["allele1"] + current["allele2"]
-
-        # Report unused filetype
-        else:
-            log.writelines("Error: filetype not currently used: {}\n".format(filename))
+    # Scan the directory once for every user's file
+    user_files = scan_genotype_dir('.')
+    filenames = [user_files[id] for id in ids]
+    progress = tqdm.tqdm(total=len(ids))
+
+    # Parse files in order until the first valid one, which sets up the rows and the genotype array
+    for i, filename in enumerate(filenames):
+        progress.update()
+        status = cached_status(cache, filename) if cache is not None else None
+        if status not in (None, "valid"):
+            log_bad_file(log, status, filename)
+            num_bad_files += 1
+            continue
+        try:
+            current = read_genotype_file(filename, base=True)
+        except Exception:
+            current = "bad_csv"
+        if current is None or isinstance(current, str):
+            status = "bad_type" if current is None else current
+            if cache is not None:
+                cache_file(cache, filename, status)
+                num_parsed += 1
+            log_bad_file(log, status, filename)
             num_bad_files += 1
             continue
 
-        # If this is the first file set-up the dataframe
-        if i == 0:
-            merged = current[["rsid", "chromosome", "position", str(id)]]
+        values = encode_genotypes(current["gt"])
+        base = current[["rsid", "chromosome", "position"]].reset_index(drop=True)
+        set_lookup(pd.Index(base["rsid"]).unique())
+        base_slots = lookup.get_indexer(base["rsid"])
 
-        # Else add the column
-        else:
-            current = current[["rsid", str(id)]]
-            merged = merged.merge(current, how="left", on="rsid")
+        # Slot in lookup of every cached rsid, so cached files are placed without looking up their rsids
+        if cache is not None:
+            rsids = base["rsid"].fillna('').to_numpy(dtype=object)
+            if status == None:
+                cache_file(cache, filename, "valid", (rsids, values))
+                num_parsed += 1
+            rsid_slots = np.full(len(cache["rsids"]), -1, dtype=np.int64)
+            rsid_slots[rsid_indexes(cache, rsids)] = base_slots
+        row_base = np.arange(len(base))
+        genotypes = np.zeros((len(base), len(ids)), dtype='S{}'.format(max(values.dtype.itemsize, 2)))
+        genotypes[:, 0] = values
+        user_ids.append(ids[i])
         num_valid_files += 1
+        break
 
-    # Get only valid rsid SNPs in list
-    rsid_re = re.compile('rs[0-9]+')
-    merged = merged[merged["rsid"].str.match(rsid_re)]
+    # Parse the rest, in a process pool if asked, and add each column in place (results arrive in order)
+    # With the cache only the files not in it are parsed, the others are read back from it
+    rest = list(zip(ids[i + 1:], filenames[i + 1:])) if base is not None else []
+    statuses = [cached_status(cache, filename) if cache is not None else None for _, filename in rest]
+    parse = parse_genotype_file if cache is None else parse_genotype_rsids
+    to_parse = [filename for (_, filename), status in zip(rest, statuses) if status == None]
+    pool = None
+    if args.jobs > 1 and to_parse:
+        pool = Pool(args.jobs, initializer=set_lookup, initargs=(lookup,))
+        results = pool.imap(parse, to_parse)
+    else:
+        results = map(parse, to_parse)
+    for (id, filename), status in zip(rest, statuses):
+        progress.update()
+        if status == "valid":
+            parsed = load_cached_file(cache, filename)
+        elif status == None:
+            status, parsed = next(results)
+            if cache is not None:
+                parsed = cache_file(cache, filename, status, parsed)
+                num_parsed += 1
+        if status != "valid":
+            log_bad_file(log, status, filename)
+            num_bad_files += 1
+            continue
+        slots, values = parsed
+        if cache is not None:
+            if len(rsid_slots) < len(cache["rsids"]):
+                rsid_slots = np.concatenate([rsid_slots, np.full(len(cache["rsids"]) - len(rsid_slots), -1, dtype=np.int64)])
+            slots = rsid_slots[slots]
+        genotypes, row_base = fill_column(genotypes, row_base, num_valid_files, lookup, base_slots, slots, values)
+        user_ids.append(id)
+        num_valid_files += 1
+    if pool:
+        pool.close()
+        pool.join()
+    progress.close()
+    if cache is not None:
+        save_cache(cache, set(os.listdir('.')))
 
-    # Write the dataframe to a file
-    merged.to_csv('{}/openSNP_initial_genotypes.tsv'.format(args.output_dir), sep='\t', index=False, na_rep=np.nan)
+    # Write only valid rsid SNPs to a file
+    if base is None:
+        base = pd.DataFrame(columns=["rsid", "chromosome", "position"])
+        genotypes = np.zeros((0, 0), dtype='S2')
+    else:
+        base = base.iloc[row_base].reset_index(drop=True)
+    num_snps = write_genotypes('{}/openSNP_initial_genotypes.tsv'.format(args.output_dir), base, genotypes[:, :num_valid_files], user_ids)
     
     # Report number of invalid files
     log.writelines("Number of bad file formats: {}\n".format(num_bad_files))
     log.writelines("Number of valid files: {}\n".format(num_valid_files))
-    log.writelines("Number of SNPs captured: {}\n".format(len(merged)))
+    log.writelines("Number of SNPs captured: {}\n".format(num_snps))
+    if cache is not None:
+        log.writelines("Files parsed: {}, read from the cache in {}: {}\n".format(num_parsed, args.cache_dir, len(filenames) - num_parsed))
     log.close()
 
 if __name__ == '__main__':
@@ -105,6 +363,8 @@ if __name__ == '__main__':
     parser.add_argument('-g', '--genotypes_dir', type=str, default=GENOTYPES, help='filepath to openSNP genotype files')
     parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
     parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of processes used to parse genotype files')
     parser.add_argument('-s', '--subset', type=int, default=None, help='number of ids to subset (optional)')
+    parser.add_argument('-c', '--cache_dir', type=str, default=None, help='dir to keep parsed files in, so reruns only parse new or changed files (optional)')
     args = parser.parse_args()
     main(args)
\ No newline at end of file
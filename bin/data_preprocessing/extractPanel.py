@@ -0,0 +1,170 @@
+"""
+Pull a small panel of SNPs (e.g. IrisPlex) out of the 1000Genomes vcfs using their tabix indexes
+Input:
+    - BED file of the panel: chromosome, 0-based start, end, rsid in the first four columns (e.g. irisplex.bed)
+    - directory with bgzipped 1000Genomes vcf.gz files (one per chromosome) and their .tbi indexes
+Output:
+    - iris_oneK_genotypes.tsv: "# CHROM, POS, ID, REF, ALT" columns followed by one 0,1,2 column per individual
+Notes:
+    - Replaces the vcftools scans of whole chromosomes in the old oneK_phenotypes.sh, each BED region is
+      read by seeking straight to the BGZF block the tabix index points at
+    - Records are matched on rsid within the region (any record in the region if the name is missing or ".")
+    - predictPhenotype.py --vcf_dir calls extract_panel directly instead of reading a tsv
+"""
+
+import os
+import gzip
+import struct
+import argparse
+import numpy as np
+import pandas as pd
+from oneK_genotypes import VCF_TEMPLATE, get_dosages, write_tsv_rows
+
+
+# Read a tabix .tbi index into {sequence name: (bins, linear index)}
+# bins maps bin number to (start, end) virtual offset chunks, see the tabix spec
+def read_tabix_index(filename):
+    with gzip.open(filename, 'rb') as f:
+        data = f.read()
+    if data[:4] != b"TBI\x01":
+        raise ValueError("{} is not a tabix index".format(filename))
+    n_ref, _, _, _, _, _, _, l_nm = struct.unpack_from('<8i', data, 4)
+    names = data[36:36 + l_nm].split(b"\0")[:n_ref]
+    offset = 36 + l_nm
+
+    index = {}
+    for name in names:
+        bins = {}
+        n_bin, = struct.unpack_from('<i', data, offset)
+        offset += 4
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from('<Ii', data, offset)
+            offset += 8
+            chunks = struct.unpack_from('<{}Q'.format(2 * n_chunk), data, offset)
+            offset += 16 * n_chunk
+            bins[bin_id] = list(zip(chunks[0::2], chunks[1::2]))
+        n_intv, = struct.unpack_from('<i', data, offset)
+        offset += 4
+        intervals = struct.unpack_from('<{}Q'.format(n_intv), data, offset)
+        offset += 8 * n_intv
+        index[name.decode()] = (bins, intervals)
+    return index
+
+
+# Bins that can hold records overlapping the 0-based half-open region [beg, end)
+def reg2bins(beg, end):
+    end -= 1
+    bins = [0]
+    for shift, first in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+        bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+    return bins
+
+
+# Virtual offset of the first BGZF block that can hold records overlapping [beg, end), None if there are none
+def region_offset(index, chrom, beg, end):
+    if chrom not in index:
+        return None
+    bins, intervals = index[chrom]
+    min_offset = intervals[min(beg >> 14, len(intervals) - 1)] if intervals else 0
+    chunks = [chunk for bin_id in reg2bins(beg, end) for chunk in bins.get(bin_id, []) if chunk[1] > min_offset]
+    if not chunks:
+        return None
+    return max(min(chunk[0] for chunk in chunks), min_offset)
+
+
+# Yield the vcf lines of chrom with 1-based POS in [beg, end], starting at the block the index points to
+def fetch(vcf_file, index, chrom, beg, end):
+    offset = region_offset(index, chrom, beg - 1, end)
+    if offset is None:
+        return
+    with open(vcf_file, 'rb') as raw:
+        raw.seek(offset >> 16)
+        with gzip.GzipFile(fileobj=raw) as bgzf:
+            bgzf.read(offset & 0xFFFF)
+            for line in bgzf:
+                if line.startswith(b"#"):
+                    continue
+                fields = line.split(b"\t", 2)
+                if fields[0].decode() != chrom:
+                    break
+                pos = int(fields[1])
+                if pos > end:
+                    break
+                if pos >= beg:
+                    yield line
+
+
+# Sample names from the #CHROM header line at the start of a vcf
+def read_samples(vcf_file):
+    with gzip.open(vcf_file, 'rb') as vcf:
+        for line in vcf:
+            if line.startswith(b"#CHROM"):
+                return [sample.decode() for sample in line.rstrip(b"\r\n").split(b"\t")[9:]]
+    raise ValueError("No #CHROM header line in {}".format(vcf_file))
+
+
+# Extract every SNP of a BED panel from per-chromosome vcfs, in BED order
+# Returns (samples, SNP info rows, SNP x individual int8 dosages, names of regions with no usable record)
+def extract_panel(bed_file, vcf_dir, vcf_template=VCF_TEMPLATE):
+    bed = pd.read_csv(bed_file, sep='\t', header=None, dtype=str, comment='#')
+    indexes, samples, info, dosages, missing = {}, None, [], [], []
+    for region in bed.itertuples(index=False):
+        chrom, beg, end = region[0], int(region[1]) + 1, int(region[2])
+        name = region[3] if len(region) > 3 and isinstance(region[3], str) and region[3] != "." else None
+        vcf_file = os.path.join(vcf_dir, vcf_template.format(chrom))
+        if chrom not in indexes:
+            if not os.path.exists(vcf_file + ".tbi"):
+                raise FileNotFoundError("No tabix index for {}, run tabix -p vcf on it first".format(vcf_file))
+            indexes[chrom] = read_tabix_index(vcf_file + ".tbi")
+            chrom_samples = read_samples(vcf_file)
+            if samples is None:
+                samples = chrom_samples
+            elif chrom_samples != samples:
+                raise ValueError("Samples in {} do not match the other vcfs".format(vcf_file))
+
+        found = False
+        for line in fetch(vcf_file, indexes[chrom], chrom, beg, end):
+            fields = line.split(b"\t", 9)
+            if name is not None and fields[2].decode() != name:
+                continue
+            gt = get_dosages(fields[8], fields[9], len(samples))
+            if gt is None:
+                continue
+            info.append([field.decode() for field in fields[:5]])
+            dosages.append(gt)
+            found = True
+        if not found:
+            missing.append(name if name is not None else "{}:{}-{}".format(chrom, beg, end))
+    dosages = np.vstack(dosages) if dosages else np.empty((0, len(samples or [])), dtype=np.int8)
+    return samples, info, dosages, missing
+
+
+# Panel genotypes as a DataFrame laid out like the iris_oneK_genotypes.tsv
+def panel_table(samples, info, dosages):
+    table = pd.DataFrame(info, columns=["# CHROM", "POS", "ID", "REF", "ALT"])
+    return pd.concat([table, pd.DataFrame(dosages, columns=samples)], axis=1)
+
+
+# Main function
+def main(args):
+    samples, info, dosages, missing = extract_panel(args.bed_file, args.kg_dir, args.vcf_template)
+    with open("{}/{}".format(args.output_dir, args.output_file), 'wb') as f:
+        f.write("\t".join(["# CHROM", "POS", "ID", "REF", "ALT"] + samples).encode() + b"\n")
+        write_tsv_rows(f, info, dosages)
+    with open("{}/extractPanel.log".format(args.log_dir), 'w') as log:
+        log.writelines("Number of SNPs extracted from {}: {}\n".format(args.bed_file, len(info)))
+        log.writelines("Regions with no usable record: {}\n".format(", ".join(missing)))
+
+
+if __name__ == '__main__':
+    KG_DIR = "/datasets/cs284s-sp20-public/1000Genomes"
+    IRISPLEX = os.path.join(os.environ["HOME"], "project/datasets", "irisplex.bed")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--bed_file', type=str, default=IRISPLEX, help='filepath to BED file of the SNP panel, default is {}'.format(IRISPLEX))
+    parser.add_argument('-k', '--kg_dir', type=str, default=KG_DIR, help='path to tabix indexed 1000Genomes vcfs (one per chromosome), default is {}'.format(KG_DIR))
+    parser.add_argument('-t', '--vcf_template', type=str, default=VCF_TEMPLATE, help='vcf filename with {{}} in place of the chromosome, default is {}'.format(VCF_TEMPLATE))
+    parser.add_argument('-f', '--output_file', type=str, default='iris_oneK_genotypes.tsv', help='name of output tsv, default is iris_oneK_genotypes.tsv')
+    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
+    parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
+    args = parser.parse_args()
+    main(args)
@@ -8,15 +8,8 @@ import os
 import pandas as pd
 import argparse
 import numpy as np
-from tqdm import tqdm
-tqdm.pandas()
-
-
-#Function to z-score SNPs based on input dataframe with standard deviations and means
-def z_score(x, z_df):
-    mean = z_df["means"].loc[x.name]
-    std =  z_df["std"].loc[x.name]
-    return ((x-mean)/std)
+from genotypeStore import write_store
+from normalizeGenotypes import apply_z_score, read_stats, to_dosages, read_snp_order
 
 
 # Map label to numeric
@@ -30,35 +23,46 @@ def main(args):
     # Read in final genotypes
     print("Reading in genotypes")
     raw_genotypes = pd.read_csv(args.genotype_file, sep='\t').drop_duplicates("rsid").set_index("rsid").loc[:, "6":"6131"]
+    
+    # Keep only (and order like) the SNPs the train set was built with, e.g. the ldPrune.py list
+    if args.snp_order != None:
+        raw_genotypes = raw_genotypes.loc[read_snp_order(args.snp_order)]
     print(len(raw_genotypes))
 
     # Read in SNP means and stds
     print("Reading in means and stds from 1000K genomes")
-    mean_std = pd.read_csv(args.stats, sep='\t', index_col=0).loc[raw_genotypes.index]
+    mean_std = read_stats(args.stats, raw_genotypes.index)
     print(len(mean_std))
           
-    # Z-score SNPs
+    # Z-score SNPs in place on a float32 SNP x individual matrix
     print("Z-scoring SNPs")
-    z_genotypes = raw_genotypes.progress_apply(z_score, z_df=mean_std, axis=1)
-    z_genotypes = z_genotypes.replace(np.nan, 0)
+    snps, samples = raw_genotypes.index, raw_genotypes.columns
+    if args.dosage:
+        # Raw int8 dosages for DosageKong64 models, which z-score with the same stats inside the model
+        z_genotypes = to_dosages(raw_genotypes.to_numpy(dtype=np.float32))
+    else:
+        z_genotypes = apply_z_score(raw_genotypes.to_numpy(dtype=np.float32, copy=True), mean_std["means"], mean_std["std"])
     
     # Save SNPs included
     print("Saving SNP list")
-    snps = z_genotypes.index
     with open('{}/openSNP_final_rsids.txt'.format(args.output_dir), 'w') as f:
         f.writelines("%s\n" % id for id in snps)
     
-    # Format data as SNPs in rows and individuals in columns
+    # Format data as SNPs in rows and individuals in columns (transposed view, no copy)
     test_set = z_genotypes.T
     
     # Save test set and test labels
-    print("Saving test set as pickle object")
-    test_set.to_pickle("{}/test_set.pickle".format(args.output_dir))
+    if args.format == "pickle":
+        print("Saving test set as pickle object")
+        pd.DataFrame(test_set, index=samples, columns=snps).to_pickle("{}/test_set.pickle".format(args.output_dir))
+    else:
+        print("Saving test set as memory-mappable store")
+        write_store(test_set, samples, snps, "{}/test_set".format(args.output_dir), dtype=test_set.dtype)
     
     # Read in phenotypes
     print("Reading in phenotpyes")
     phenotypes = pd.read_csv(args.phenotype_file, sep='\t')
-    final_phenotypes = phenotypes[phenotypes["user_id"].isin(test_set.index)]
+    final_phenotypes = phenotypes[phenotypes["user_id"].astype(str).isin(samples)].copy()
     
     # Use numeric labels for phenotypes
     print("Saving test labels as csv")
@@ -82,6 +86,9 @@ if __name__ == '__main__':
     parser.add_argument('-g', '--genotype_file', type=str, default=GENOTYPES, help='filepath to openSNP filtered genotype tsv, default is {}'.format(GENOTYPES))
     parser.add_argument('-p', '--phenotype_file', type=str, default=PHENOTYPES, help='filepath to openSNP phenotypes tsv, default is {}'.format(PHENOTYPES))
     parser.add_argument('-s', '--stats', type=str, default=STATS, help='means and standard devs of SNPs from training set, default is {}'.format(STATS))
+    parser.add_argument('-so', '--snp_order', type=str, default=None, help='rsID list (one per line) to subset and order SNPs by, same as the --snp_order given to extractTrainSet.py')
+    parser.add_argument('-f', '--format', type=str, default='memmap', choices=['memmap', 'pickle'], help='output format for the test set, memmap writes a .dat matrix plus .json sidecar')
+    parser.add_argument('-d', '--dosage', action='store_true', help='write int8 0,1,2 dosages (-1 missing) instead of z-scores, for DosageKong64 models')
     parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
     parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
     args = parser.parse_args()
@@ -8,44 +8,65 @@ import os
 import pandas as pd
 import argparse
 import numpy as np
-from tqdm import tqdm
-tqdm.pandas()
-
-
-#Function to z-score SNPs
-def z_score(x): 
-    return (x-x.mean())/x.std()
+from genotypeStore import write_store, read_store
+from normalizeGenotypes import z_score, write_stats, to_dosages, read_snp_order, get_positions
 
 
 # Main function
 def main(args):
     
-    # Format dataset and z-score
+    # Format dataset and z-score every SNP in place on a float32 SNP x individual matrix
     print("Reading in genotype file and Z-scoring SNPs")
-    data = pd.read_csv(args.genotype_file, sep='\t').drop_duplicates("ID").set_index("ID").loc[:, "HG00096":"NA21144"].progress_apply(z_score, axis=1)
-    data = data.replace(np.nan, 0)
+    if args.genotype_file.endswith(".json"):
+        # int8 individual x SNP store from oneK_genotypes.py --format memmap, read transposed
+        store, samples, rsids = read_store(args.genotype_file)
+        rsids, samples = pd.Index(rsids), pd.Index(samples)
+        keep = ~rsids.duplicated()
+        data = store[:, keep].T.astype(np.float32)
+        rsids = rsids[keep]
+    else:
+        data = pd.read_csv(args.genotype_file, sep='\t').drop_duplicates("ID").set_index("ID").loc[:, "HG00096":"NA21144"]
+        rsids, samples = data.index, data.columns
+        data = data.to_numpy(dtype=np.float32, copy=True)
+    
+    # Keep the raw dosages for DosageKong64 models, the z-scoring is still done for the stats
+    if args.dosage:
+        dosages = to_dosages(data)
+    means, stds = z_score(data)
+    
+    # Save means and stds of all SNPs for z-scoring the test set
+    print("Saving SNP means and stds")
+    write_stats("{}/train_set_stats.tsv".format(args.output_dir), rsids, means, stds)
     
     # Reorder to match
     print("Subsetting SNPs from openSNP")
+    snp_rows = np.arange(len(rsids))
     if args.snp_order != None:
-        with open(args.snp_order, 'r') as filename:
-            snp_order = [line.rstrip() for line in filename.readlines()]
-        data = data.loc[snp_order]
-    data = data.T
+        snp_rows = get_positions(rsids, read_snp_order(args.snp_order))
+        rsids = rsids[snp_rows]
              
-    # Split data into train and val
+    # Split data into train and val, taking individual x SNP slices straight from the transposed view
     print("Train/val split")
     with open(args.train_ids, 'r') as filename:
         train_id = [line.rstrip() for line in filename.readlines()]
     with open(args.val_ids, 'r') as filename:
         val_id = [line.rstrip() for line in filename.readlines()]      
-    train = data.loc[train_id]
-    val = data.loc[val_id]
+    if args.dosage:
+        data, dtype = dosages, np.int8
+    else:
+        dtype = np.float32
+    train = pd.DataFrame(data.T[np.ix_(get_positions(samples, train_id), snp_rows)], index=train_id, columns=rsids)
+    val = pd.DataFrame(data.T[np.ix_(get_positions(samples, val_id), snp_rows)], index=val_id, columns=rsids)
+    del data
     
     print("Writing to sets")    
     # Write to a file
-    train.to_pickle('{}/train_set.pickle'.format(args.output_dir))
-    val.to_pickle('{}/val_set.pickle'.format(args.output_dir))
+    if args.format == "pickle":
+        train.to_pickle('{}/train_set.pickle'.format(args.output_dir))
+        val.to_pickle('{}/val_set.pickle'.format(args.output_dir))
+    else:
+        write_store(train.values, train.index, train.columns, '{}/train_set'.format(args.output_dir), dtype=dtype)
+        write_store(val.values, val.index, val.columns, '{}/val_set'.format(args.output_dir), dtype=dtype)
     
     # Write log info
     with open("{}/extractTrainSet.log".format(args.log_dir), 'w') as filename:
@@ -57,13 +78,15 @@ if __name__ == '__main__':
     GENOTYPES = os.path.join(os.environ["HOME"], "project/datasets/oneKGenomes/data", "oneK_genotypes.tsv")
     TRAIN_IDS = os.path.join(os.environ["HOME"], "project/datasets/oneKGenomes/data", "train_ids.txt")
     VAL_IDS = os.path.join(os.environ["HOME"], "project/datasets/oneKGenomes/data", "val_ids.txt")
-    SNP_ORDERING = os.path.join(os.environ["HOME"], "project/datasets/openSNP/data", "openSNP_final_rsids.txt")
+    SNP_ORDERING = os.path.join(os.environ["HOME"], "project/datasets/openSNP/data", "openSNP_final_genotypes.tsv")
     parser = argparse.ArgumentParser()
-    parser.add_argument('-g', '--genotype_file', type=str, default=GENOTYPES, help='filepath to 1000Genomes genotype tsv')
+    parser.add_argument('-g', '--genotype_file', type=str, default=GENOTYPES, help='filepath to 1000Genomes genotype tsv or .json sidecar of the oneK_genotypes store')
     parser.add_argument('-t', '--train_ids', type=str, default=TRAIN_IDS, help='filepath to training id labels')
     parser.add_argument('-v', '--val_ids', type=str, default=VAL_IDS, help='filepath to val id labels')
-    parser.add_argument('-so', '--snp_order', type=str, default=SNP_ORDERING, help='filepath to ordering of SNPs to match OpenSNP test set')
-    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
+    parser.add_argument('-so', '--snp_order', type=str, default=SNP_ORDERING, help='filepath to ordering of SNPs to match OpenSNP test set, an rsID list or openSNP_final_genotypes.tsv')
+    parser.add_argument('-f', '--format', type=str, default='memmap', choices=['memmap', 'pickle'], help='output format for train/val sets, memmap writes a .dat matrix plus .json sidecar')
+    parser.add_argument('-d', '--dosage', action='store_true', help='write int8 0,1,2 dosages (-1 missing) instead of z-scores, for DosageKong64 models')
+    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir, also gets train_set_stats.tsv')
     parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
     args = parser.parse_args()
     main(args)
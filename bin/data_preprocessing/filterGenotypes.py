@@ -13,34 +13,43 @@ Notes:
 
 import pandas as pd
 import os
-import numpy as np
 import argparse
 
 
+# Fraction of samples with a genotype call for each SNP in a chunk, as one NumPy reduction
+def coverage(chunk):
+    return chunk.iloc[:, 3:].notna().to_numpy().mean(axis=1)
+
+
 # Main function
 def main(args):
 
-    # Read in genotypes
-    initial_genotypes = pd.read_csv(args.genotype_file, sep='\t')
-    
-    # For reporting later
-    num_SNPs = len(initial_genotypes)
-    num_samples = len(initial_genotypes.loc[:, "6":"6131"].columns)
+    # Stream genotypes in chunks of SNPs, read as strings so rows are written back unchanged
+    num_SNPs, num_samples, num_filtered = 0, 0, 0
+    outfile = '{}/openSNP_filtered_genotypes.tsv'.format(args.output_dir)
 
-    # Filter for SNPs that appear in at least 80% of samples (> than min iris SNP fraction)
-    filtered_genotypes = initial_genotypes[initial_genotypes.loc[:,'6':].notna().apply(np.mean, 1) > args.percentage]
+    # Header first, so the table is written (header only) even if no SNP is kept or the input has no rows
+    pd.read_csv(args.genotype_file, sep='\t', dtype=str, nrows=0).to_csv(outfile, sep='\t', index=False)
+    with open("{}/openSNP_filtered_rsids.txt".format(args.output_dir), 'w') as filehandle:
+        for chunk in pd.read_csv(args.genotype_file, sep='\t', dtype=str, chunksize=args.chunk_size):
+        
+            # For reporting later
+            num_SNPs += len(chunk)
+            num_samples = len(chunk.loc[:, "6":"6131"].columns)
 
-    # Write this filtered set to a smaller dataframe
-    filtered_genotypes.to_csv('{}/openSNP_filtered_genotypes.tsv'.format(args.output_dir), sep='\t', index=False)
+            # Filter for SNPs that appear in at least 80% of samples (> than min iris SNP fraction)
+            filtered_genotypes = chunk[coverage(chunk) > args.percentage]
+            num_filtered += len(filtered_genotypes)
 
-    # Save this list of SNP rsids for oneK_genotpyes.sh
-    filtered_rsids = filtered_genotypes["rsid"].values.tolist()
-    with open("{}/openSNP_filtered_rsids.txt".format(args.output_dir), 'w') as filehandle:
-        filehandle.writelines("%s\n" % id for id in filtered_rsids)
+            # Append this filtered set to a smaller dataframe
+            filtered_genotypes.to_csv(outfile, sep='\t', index=False, mode='a', header=False)
+
+            # Save this list of SNP rsids for oneK_genotypes.py
+            filehandle.writelines("%s\n" % id for id in filtered_genotypes["rsid"])
     
     with open("{}/filterGenotypes.log".format(args.log_dir), 'w') as log:
         log.writelines("After extracting genotypes we have {} SNP x {} sample matrix\n".format(num_SNPs, num_samples))
-        log.writelines("After filtering, %d SNPs and %d samples left" % (len(filtered_rsids), len(user_id_list)))
+        log.writelines("After filtering, %d SNPs and %d samples left" % (num_filtered, num_samples))
 
         
 if __name__ == '__main__':
@@ -48,6 +57,7 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-g', '--genotype_file', type=str, default=GENOTYPES, help='filepath to openSNP genotype tsv')
     parser.add_argument('-p', '--percentage', type=float, default=0.8, help='percentage of individuals necessary to keep SNP')
+    parser.add_argument('-c', '--chunk_size', type=int, default=100000, help='number of SNPs to read and filter at a time, default is 100000')
     parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
     parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
     args = parser.parse_args()
@@ -0,0 +1,38 @@
+"""
+Compact on-disk genotype store used in place of pickled DataFrames
+Format:
+    - <name>.dat: raw C-ordered individual x SNP matrix (float32 z-scores or int8 dosages)
+    - <name>.json: sidecar with the data filename, dtype, shape, sample IDs and rsIDs
+Notes:
+    - Stores are opened with np.memmap so DataLoader workers share the page cache
+      instead of each holding their own copy of the matrix
+"""
+
+import os
+import json
+import numpy as np
+
+
+# Write an individual x SNP matrix and its sidecar, returns the sidecar path
+def write_store(matrix, samples, rsids, prefix, dtype=np.float32):
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+    if matrix.shape != (len(samples), len(rsids)):
+        raise ValueError("Matrix shape {} does not match {} samples x {} rsids".format(matrix.shape, len(samples), len(rsids)))
+    matrix.tofile("{}.dat".format(prefix))
+    meta = {"data": os.path.basename("{}.dat".format(prefix)),
+            "dtype": np.dtype(dtype).name,
+            "shape": list(matrix.shape),
+            "samples": [str(sample) for sample in samples],
+            "rsids": [str(rsid) for rsid in rsids]}
+    with open("{}.json".format(prefix), 'w') as f:
+        json.dump(meta, f)
+    return "{}.json".format(prefix)
+
+
+# Open a store from its sidecar, returns (memmap, samples, rsids)
+def read_store(sidecar, mode='r'):
+    with open(sidecar) as f:
+        meta = json.load(f)
+    path = os.path.join(os.path.dirname(sidecar), meta["data"])
+    matrix = np.memmap(path, dtype=meta["dtype"], mode=mode, shape=tuple(meta["shape"]))
+    return matrix, meta["samples"], meta["rsids"]
@@ -60,8 +60,8 @@ def main(args):
     # Save these initial phenotypes to a file
     phenotypes.to_csv('{}/openSNP_initial_phenotypes.tsv'.format(args.output_dir), sep='\t', index=False)
 
-    # Save this id set as a list
-    ids = set(phenotypes["user_id"].values)
+    # Save this id set as a list, in numeric order so the genotype columns run from the first to the last id
+    ids = sorted(set(phenotypes["user_id"].values))
     with open("{}/openSNP_initial_userids.txt".format(args.output_dir), 'w') as filehandle:
         filehandle.writelines("%s\n" % id for id in ids)
     
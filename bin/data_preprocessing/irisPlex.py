@@ -0,0 +1,66 @@
+"""
+IrisPlex eye color model scored for all individuals at once, shared by predictPhenotype.py and testIris.py
+Input:
+    - SNP x individual matrix of minor allele counts (NaN for missing) with rows lined up with irisplex.bed
+Output:
+    - per individual logits (pred1, pred2), probabilities (blue, other, brown) and predicted_eye_color
+Notes:
+    - logits are one (individuals x SNPs) @ (SNPs x 2) matrix multiply against the b1/b2 coefficients
+    - probabilities are a softmax over [0, pred1, pred2] computed with a stable log-sum-exp
+    - missing genotypes contribute 0 to the logits, like np.nansum
+"""
+
+import numpy as np
+import pandas as pd
+
+
+IRIS_HEADER = ["chr", "pos1", "pos2", "id", "minor_allele", "b1", "b2"]
+
+# SNPs whose 1000Genomes ref allele is the IrisPlex minor allele, genotypes are flipped to 2 - x
+FLIPPED_SNPS = ['rs12896399', 'rs12913832', 'rs16891982']
+
+# Intercepts of the two logits
+A1 = 3.94
+A2 = 0.65
+
+# Ties go to the first color, like the old get_color_pred
+COLORS = np.array(["blue", "brown", "other"])
+
+
+# Load irisplex parameters for each SNP
+def read_iris(filename):
+    return pd.read_csv(filename, sep='\t', header=None, names=IRIS_HEADER)
+
+
+# Sign and offset per SNP so flipped genotypes are sign * x + offset (2 - x for FLIPPED_SNPS, x otherwise)
+def flip_vectors(rsids, flipped=FLIPPED_SNPS):
+    flip = np.isin(np.asarray(rsids, dtype=object), flipped)
+    return np.where(flip, -1.0, 1.0), np.where(flip, 2.0, 0.0)
+
+
+# Logits [pred1, pred2] for every individual, genotypes is SNP x individual with rows matching b
+def logits(genotypes, b, sign=None, offset=None, a=(A1, A2)):
+    genotypes = np.asarray(genotypes, dtype=np.float64)
+    if sign is not None:
+        genotypes = genotypes * sign[:, None] + offset[:, None]
+    return np.nan_to_num(genotypes, nan=0.0).T @ np.asarray(b, dtype=np.float64) + np.asarray(a)
+
+
+# Probabilities [brown, blue, other] from logits [pred1, pred2] (brown is the reference class with logit 0)
+def probabilities(pred):
+    full = np.concatenate([np.zeros((len(pred), 1)), pred], axis=1)
+    top = full.max(axis=1, keepdims=True)
+    log_norm = top + np.log(np.exp(full - top).sum(axis=1, keepdims=True))
+    return np.exp(full - log_norm)
+
+
+# IrisPlex predictions as a table indexed by individual
+# iris holds the id, b1 and b2 of each genotype row, flip=False if genotypes are already flipped
+def predict(genotypes, iris, samples, flip=True):
+    sign, offset = flip_vectors(iris["id"]) if flip else (None, None)
+    pred = logits(genotypes, iris[["b1", "b2"]], sign, offset)
+    probs = probabilities(pred)
+    predictions = pd.DataFrame({"pred1": pred[:, 0], "pred2": pred[:, 1],
+                                "blue": probs[:, 1], "other": probs[:, 2], "brown": probs[:, 0]}, index=samples)
+    predictions["predicted_eye_color"] = COLORS[np.argmax(probs[:, [1, 0, 2]], axis=1)]
+    return predictions
@@ -0,0 +1,185 @@
+"""
+Long running IrisPlex scorer for openSNP style raw genotype files (23andMe, AncestryDNA)
+Input:
+    - one raw genotype filepath per line, on stdin or over a local unix socket (--socket)
+    - the line "stats" returns the latency metrics collected so far
+Output:
+    - one JSON line per request with the IrisPlex logits, probabilities, predicted_eye_color,
+      number of IrisPlex SNPs found and the request latency in milliseconds
+Notes:
+    - irisplex.bed and the rsID -> coefficient row index are loaded once and kept in memory
+    - raw files are read in blocks and searched for the six IrisPlex rsIDs directly, reading stops as
+      soon as all six are found, so no other line is parsed
+    - genotypes are the number of IrisPlex minor alleles in the call, no-calls count as 0 like testIris.py
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import socketserver
+import threading
+import signal
+import numpy as np
+import irisPlex
+
+
+# Seconds of recent requests the throughput in stats is measured over
+RATE_WINDOW = 60
+
+
+# Keeps the IrisPlex parameters in memory and scores one raw genotype file at a time
+class IrisScorer:
+
+    def __init__(self, iris_plex_file, block_size=1 << 20):
+        iris = irisPlex.read_iris(iris_plex_file)
+        self.rsids = [rsid.encode() for rsid in iris["id"]]
+        self.rows = {rsid: i for i, rsid in enumerate(self.rsids)}
+        self.minor_alleles = [allele.upper() for allele in iris["minor_allele"]]
+        self.b = iris[["b1", "b2"]].to_numpy(dtype=np.float64)
+        self.block_size = block_size
+        self.latencies = []
+        self.finished = []
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    # Raw genotype lines of the IrisPlex rsIDs in a file, stops reading once all are found
+    def find_lines(self, filename):
+        lines, tail = {}, b"\n"
+        with open(filename, 'rb') as f:
+            while len(lines) < len(self.rsids):
+                block = f.read(self.block_size)
+                if not block:
+                    break
+                # Keep the partial last line so rsIDs split across blocks are still found
+                text = tail + block
+                cut = text.rfind(b"\n")
+                text, tail = text[:cut + 1], text[cut:]
+                for rsid in self.rsids:
+                    if rsid in lines:
+                        continue
+                    start = text.find(b"\n" + rsid + b"\t")
+                    if start >= 0:
+                        start += 1
+                        lines[rsid] = text[start:text.find(b"\n", start)]
+        if tail.strip() and len(lines) < len(self.rsids):
+            for rsid in self.rsids:
+                if rsid not in lines and tail.startswith(b"\n" + rsid + b"\t"):
+                    lines[rsid] = tail[1:]
+        return lines
+
+    # Minor allele counts of the IrisPlex SNPs (NaN when missing or a no-call)
+    def get_dosages(self, lines):
+        dosages = np.full(len(self.rsids), np.nan)
+        for rsid, line in lines.items():
+            i = self.rows[rsid]
+            # 23andMe has the call in one column, AncestryDNA in two allele columns
+            gt = "".join(field.strip() for field in line.decode().split("\t")[3:]).upper()
+            if gt and set(gt) <= set("ACGT"):
+                dosages[i] = gt.count(self.minor_alleles[i])
+        return dosages
+
+    # Score one raw genotype file, returns a JSON serializable dict
+    def score(self, filename):
+        start = time.perf_counter()
+        try:
+            dosages = self.get_dosages(self.find_lines(filename))
+        except OSError as e:
+            response = {"file": filename, "error": str(e)}
+        else:
+            pred = irisPlex.logits(dosages[:, None], self.b)
+            probs = irisPlex.probabilities(pred)[0]
+            response = {"file": filename, "pred1": pred[0, 0], "pred2": pred[0, 1],
+                        "blue": probs[1], "other": probs[2], "brown": probs[0],
+                        "predicted_eye_color": str(irisPlex.COLORS[np.argmax(probs[[1, 0, 2]])]),
+                        "snps_found": int(np.isfinite(dosages).sum())}
+        finished = time.perf_counter()
+        latency = (finished - start) * 1000
+        with self.lock:
+            self.latencies.append(latency)
+            self.finished.append(finished)
+        response["latency_ms"] = latency
+        return response
+
+    # Request count, recent throughput and latency percentiles so far
+    # Requests are handled concurrently and the service idles between them, so throughput is the files finished in the
+    # last RATE_WINDOW seconds (or since startup, if shorter) over that window, not 1 / mean latency or an all-time average
+    def stats(self):
+        now = time.perf_counter()
+        with self.lock:
+            latencies = np.array(self.latencies)
+            finished = np.array(self.finished)
+        if len(latencies) == 0:
+            return {"requests": 0}
+        window = min(RATE_WINDOW, now - self.started)
+        return {"requests": len(latencies),
+                "mean_ms": latencies.mean(),
+                "p50_ms": np.percentile(latencies, 50),
+                "p99_ms": np.percentile(latencies, 99),
+                "max_ms": latencies.max(),
+                "window_s": window,
+                "files_per_second_recent": int((finished > now - window).sum()) / window}
+
+    # Answer one request line
+    def handle(self, request):
+        request = request.strip()
+        if request == "stats":
+            return self.stats()
+        return self.score(request)
+
+
+# One connection on the unix socket, any number of request lines
+class ScorerHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for request in self.rfile:
+            request = request.decode().strip()
+            if request:
+                self.wfile.write((json.dumps(self.server.scorer.handle(request)) + "\n").encode())
+                self.wfile.flush()
+
+
+class ScorerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# Main function
+def main(args):
+    scorer = IrisScorer(args.iris_plex_file)
+
+    if args.socket != None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ScorerServer(args.socket, ScorerHandler)
+        server.scorer = scorer
+        print("Scoring requests on {}".format(args.socket), file=sys.stderr)
+
+        # Shut down cleanly (and still write metrics) on Ctrl-C or kill
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            server.serve_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            server.server_close()
+            os.remove(args.socket)
+    else:
+        for request in sys.stdin:
+            if request.strip():
+                sys.stdout.write(json.dumps(scorer.handle(request)) + "\n")
+                sys.stdout.flush()
+
+    # Write latency metrics when shutting down
+    with open("{}/irisService.log".format(args.log_dir), 'w') as log:
+        log.writelines("{}\n".format(json.dumps(scorer.stats())))
+
+
+if __name__ == '__main__':
+    IRISPLEX = os.path.join(os.environ["HOME"], "project/datasets", "irisplex.bed")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-ip', '--iris_plex_file', type=str, default=IRISPLEX, help='filepath to IrisPlex bed file, default is {}'.format(IRISPLEX))
+    parser.add_argument('-s', '--socket', type=str, default=None, help='path of a unix socket to serve requests on, default is to read requests from stdin')
+    parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
+    args = parser.parse_args()
+    main(args)
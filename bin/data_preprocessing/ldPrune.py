@@ -0,0 +1,103 @@
+"""
+LD prune the SNPs of the training set so redundant SNPs don't all go into the first layer (like plink --indep-pairwise)
+Input:
+    - train_set.json: individual x SNP store from extractTrainSet.py (float32 z-scores, or int8 dosages with --dosage)
+    - openSNP_final_genotypes.tsv: rsid, chromosome and position of every SNP (only those three columns are read)
+Output:
+    - ld_pruned_snps.txt: the SNPs left after pruning, in the order of the store (pass as --snp_order to
+      extractTrainSet.py and extractTestSet.py)
+Notes:
+    - on each chromosome SNPs are walked in position order and a SNP is dropped if its r2 with any SNP kept among the
+      --window SNPs before it is above --threshold
+    - r2 comes from blocked matrix multiplies of the standardized genotypes: each block of --block_size SNPs is one
+      (individuals x window + block)' @ (individuals x block) product, so only that block is read from the memory-mapped store
+    - missing calls count as the SNP's mean (0 after standardizing), SNPs without a position are never pruned
+    - chromosomes are pruned in parallel (--jobs), largest first
+"""
+
+import os
+import argparse
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from genotypeStore import read_store
+
+
+# Center every column on its non-missing mean and scale it to unit norm, missing and constant columns end up all 0
+def unit_columns(block, valid):
+    means = np.where(valid, block, 0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    centered = np.where(valid, block - means, 0).astype(np.float32)
+    norms = np.sqrt(np.einsum('ij,ij->j', centered, centered))
+    return np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+
+
+# Columns of the store as float32 plus which calls are not missing (-1 in dosage stores)
+def read_columns(store, columns):
+    block = np.asarray(store[:, columns])
+    valid = block >= 0 if store.dtype == np.int8 else np.ones(block.shape, dtype=bool)
+    return block.astype(np.float32), valid
+
+
+# Prune one chromosome, columns are its store columns in position order, returns the kept ones
+def prune_chromosome(sidecar, columns, window, threshold, block_size):
+    store = read_store(sidecar)[0]
+    kept = np.ones(len(columns), dtype=bool)
+    for start in range(0, len(columns), block_size):
+        stop = min(start + block_size, len(columns))
+        lookback = max(0, start - window + 1)
+        z = unit_columns(*read_columns(store, columns[lookback:stop]))
+        r2 = (z.T @ z[:, start - lookback:]) ** 2  # (lookback + block) x block
+
+        # Walk the block in order, each SNP only looks at SNPs still kept in its window
+        for j in range(start, stop):
+            first = max(lookback, j - window + 1)
+            previous = r2[first - lookback:j - lookback, j - start]
+            if (previous[kept[first:j]] > threshold).any():
+                kept[j] = False
+    return columns[kept]
+
+
+# Main function
+def main(args):
+
+    # Store columns of each chromosome in position order
+    store, samples, rsids = read_store(args.train_set)
+    info = pd.read_csv(args.snp_info, sep='\t', usecols=["rsid", "chromosome", "position"]).drop_duplicates("rsid").set_index("rsid")
+    info = info.reindex(rsids)
+    info["column"] = np.arange(len(rsids))
+    unplaced = info["chromosome"].isna()
+    chromosomes = [group.sort_values("position")["column"].to_numpy() for _, group in info[~unplaced].groupby("chromosome")]
+    chromosomes.sort(key=len, reverse=True)
+
+    # Prune the chromosomes in parallel
+    print("LD pruning {} SNPs on {} chromosomes".format(len(rsids), len(chromosomes)))
+    with Pool(args.jobs) as pool:
+        kept = pool.starmap(prune_chromosome, [(args.train_set, columns, args.window, args.threshold, args.block_size) for columns in chromosomes])
+
+    # Kept SNPs in store order
+    keep = np.sort(np.concatenate(kept + [info.loc[unplaced, "column"].to_numpy()]))
+    with open("{}/ld_pruned_snps.txt".format(args.output_dir), 'w') as f:
+        f.writelines("{}\n".format(rsids[i]) for i in keep)
+
+    # Write log info
+    with open("{}/ldPrune.log".format(args.log_dir), 'w') as log:
+        log.writelines("Window {} SNPs, r2 threshold {}, {} individuals\n".format(args.window, args.threshold, len(samples)))
+        log.writelines("SNPs before pruning: {}\n".format(len(rsids)))
+        log.writelines("SNPs after pruning: {}\n".format(len(keep)))
+        log.writelines("SNPs without a position (kept): {}\n".format(unplaced.sum()))
+
+
+if __name__ == '__main__':
+    TRAIN = os.path.join(os.environ["HOME"], "project/datasets/oneKGenomes/data", "train_set.json")
+    SNP_INFO = os.path.join(os.environ["HOME"], "project/datasets/openSNP/data", "openSNP_final_genotypes.tsv")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--train_set', type=str, default=TRAIN, help='.json sidecar of the training store, default is {}'.format(TRAIN))
+    parser.add_argument('-s', '--snp_info', type=str, default=SNP_INFO, help='tsv with rsid, chromosome and position columns, default is {}'.format(SNP_INFO))
+    parser.add_argument('-w', '--window', type=int, default=50, help='window size in SNPs, default is 50')
+    parser.add_argument('-r', '--threshold', type=float, default=0.2, help='r2 above which a SNP is dropped, default is 0.2')
+    parser.add_argument('-b', '--block_size', type=int, default=128, help='SNPs per matrix multiply, only a few times --window since the product is (window + block) x block')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='chromosomes to prune at once')
+    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
+    parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,80 @@
+"""
+Z-scoring shared by extractTrainSet.py and extractTestSet.py
+Input:
+    - SNP x individual float32 matrix of 0,1,2 genotypes with NaN for missing
+Output:
+    - the same matrix z-scored in place (missing and constant SNPs become 0)
+    - train_set_stats.tsv: per SNP means and standard deviations (ddof=1, NaN skipped like pandas)
+    - or int8 dosages (-1 missing) left un-scored for DosageKong64 models (--dosage in the extract scripts)
+Notes:
+    - also holds the SNP order and label lookups the extract scripts and selectSNPs.py share
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Standard deviations safe to divide by, SNPs with no spread (or too few calls) are scaled to 0
+def safe_std(stds):
+    return np.where(stds > 0, stds, np.inf).astype(np.float32)
+
+
+# Z-score each SNP (row) of a float matrix in place, returns the means and stds that were used
+# Two passes over the matrix with only a boolean missing mask as extra memory
+def z_score(matrix):
+    missing = np.isnan(matrix)
+    has_missing = missing.any()
+    if has_missing:
+        np.copyto(matrix, 0, where=missing)
+    counts = matrix.shape[1] - np.count_nonzero(missing, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = matrix.sum(axis=1, dtype=np.float64) / counts
+        matrix -= means[:, None].astype(matrix.dtype)
+        if has_missing:
+            np.copyto(matrix, 0, where=missing)
+        stds = np.sqrt(np.einsum('ij,ij->i', matrix, matrix, dtype=np.float64) / (counts - 1))
+    stds[counts < 2] = np.nan
+    matrix /= safe_std(stds)[:, None]
+    return means, stds
+
+
+# Z-score each SNP (row) of a float matrix in place with precomputed means and stds
+def apply_z_score(matrix, means, stds):
+    matrix -= np.asarray(means, dtype=matrix.dtype)[:, None]
+    matrix /= safe_std(np.asarray(stds, dtype=np.float64))[:, None]
+    missing = np.isnan(matrix)
+    if missing.any():
+        np.copyto(matrix, 0, where=missing)
+    return matrix
+
+
+# Raw 0,1,2 genotypes as int8 dosages with -1 for missing, for models that z-score inside their first layer
+def to_dosages(matrix):
+    return np.where(np.isnan(matrix), -1, matrix).astype(np.int8)
+
+
+# Save per SNP means and stds in the train_set_stats.tsv layout (rsID index, means and std columns)
+def write_stats(filename, rsids, means, stds):
+    stats = pd.DataFrame({"means": means, "std": stds}, index=pd.Index(rsids, name="ID"))
+    stats.to_csv(filename, sep='\t')
+
+
+# Read means and stds for the given rsIDs, in that order (KeyError if any are missing)
+def read_stats(filename, rsids):
+    return pd.read_csv(filename, sep='\t', index_col=0).loc[rsids]
+
+
+# Positions of labels in an index, raising a KeyError like .loc if any are missing
+def get_positions(index, labels):
+    positions = index.get_indexer(labels)
+    if (positions < 0).any():
+        raise KeyError("{} not found".format([label for label, pos in zip(labels, positions) if pos < 0][:5]))
+    return positions
+
+
+# Read an ordering of SNPs, either an rsID list (one per line) or the rsid column of openSNP_final_genotypes.tsv
+def read_snp_order(filename):
+    if filename.endswith(".tsv"):
+        return pd.read_csv(filename, sep='\t', usecols=["rsid"])["rsid"].drop_duplicates().tolist()
+    with open(filename, 'r') as f:
+        return [line.rstrip() for line in f.readlines()]
@@ -0,0 +1,177 @@
+"""
+Adam Klie
+05/22/2020
+Code to extract all SNPs found in openSNP from 1000Genomes vcf
+Input:
+    - directory with 1000Genomes vcf.gz files (one per chromosome)
+    - openSNP_filtered_rsids.txt: list of rsids (one per line from openSNP)
+Output:
+    - oneK_genotypes.tsv: "# CHROM, POS, ID, REF, ALT" columns followed by one 0,1,2 column per individual
+      (or an int8 individual x SNP oneK_genotypes.dat/.json store with --format memmap)
+    - oneK_rsids.tsv: ID and REF allele of every SNP kept, for alleleToNum.py
+Notes:
+    - Replaces the vcftools/bgzip/bcftools/sed chain of the old oneK_genotypes.sh, vcf files are streamed
+      straight from gzip and no intermediate vcfs are written
+    - Like the old grep -v "|", SNPs with any call that is not 0 or 1 (multi-allelic or missing) are dropped
+"""
+
+import os
+import gzip
+import numpy as np
+import pandas as pd
+import argparse
+from multiprocessing import Pool
+from genotypeStore import write_store
+
+
+VCF_TEMPLATE = "ALL.chr{}.phase3_shapeit2_mvncall_integrated_v5a.20130502.genotypes.vcf.gz"
+
+# Dosage of each GT call the old sed chain converted, anything else drops the SNP
+GT_DOSAGE = {b"0|0": 0, b"0|1": 1, b"1|0": 1, b"1|1": 2,
+             b"0/0": 0, b"0/1": 1, b"1/0": 1, b"1/1": 2,
+             b"0": 0, b"1": 1}
+
+
+# rsids to keep as a set of bytes, shared with worker processes
+rsid_set = None
+
+
+def set_rsids(rsids):
+    global rsid_set
+    rsid_set = rsids
+
+
+# Decode the sample columns of one VCF line into int8 dosages, None if any call is not 0/1
+# Diploid GT-only lines (every 1000Genomes autosome) are decoded as one fixed-width NumPy view
+def get_dosages(fmt, calls, num_samples):
+    calls = calls.rstrip(b"\r\n")
+    if fmt == b"GT" and len(calls) == 4 * num_samples - 1:
+        fields = np.frombuffer(calls + b"\t", dtype=np.uint8).reshape(num_samples, 4)
+        alleles = fields[:, [0, 2]]
+        if (((alleles == ord("0")) | (alleles == ord("1"))).all()
+                and np.isin(fields[:, 1], [ord("|"), ord("/")]).all() and (fields[:, 3] == ord("\t")).all()):
+            return (alleles.sum(axis=1, dtype=np.int16) - 2 * ord("0")).astype(np.int8)
+        return None
+    dosages = [GT_DOSAGE.get(call.split(b":", 1)[0]) for call in calls.split(b"\t")]
+    if len(dosages) != num_samples or None in dosages:
+        return None
+    return np.array(dosages, dtype=np.int8)
+
+
+# Worker: stream one chromosome's vcf.gz and keep SNPs in rsid_set
+# Returns (chrom, samples, SNP info rows, SNP x individual int8 dosages, number of SNPs dropped)
+def read_vcf(chrom, filename):
+    samples, info, dosages, dropped = None, [], [], 0
+    with gzip.open(filename, 'rb') as vcf:
+        for line in vcf:
+            if line.startswith(b"##"):
+                continue
+            if line.startswith(b"#"):
+                samples = [sample.decode() for sample in line.rstrip(b"\r\n").split(b"\t")[9:]]
+                continue
+
+            # Only split out the ID before deciding to look at the genotypes
+            fields = line.split(b"\t", 3)
+            if fields[2] not in rsid_set:
+                continue
+            fields = line.split(b"\t", 9)
+            gt = get_dosages(fields[8], fields[9], len(samples))
+            if gt is None:
+                dropped += 1
+                continue
+            info.append([field.decode() for field in fields[:5]])
+            dosages.append(gt)
+    dosages = np.vstack(dosages) if dosages else np.empty((0, len(samples or [])), dtype=np.int8)
+    return chrom, samples, info, dosages, dropped
+
+
+def read_vcf_star(job):
+    return read_vcf(*job)
+
+
+# Append SNP rows to a tsv, dosages are written as ASCII digits straight from the int8 matrix
+def write_tsv_rows(f, info, dosages):
+    if len(info) == 0:
+        return
+    text = np.empty((dosages.shape[0], 2 * dosages.shape[1]), dtype=np.uint8)
+    text[:, 0::2] = dosages + ord("0")
+    text[:, 1::2] = ord("\t")
+    text[:, -1] = ord("\n")
+    for row, gt in zip(info, text):
+        f.write("\t".join(row).encode() + b"\t" + gt.tobytes())
+
+
+# Main function
+def main(args):
+
+    # Open log file for writing
+    log = open("{}/oneK_genotypes.log".format(args.log_dir), 'w')
+
+    # Read in SNP list as a hash set
+    with open(args.snp_list, 'r') as f:
+        rsids = set(line.rstrip().encode() for line in f if line.strip())
+    log.writelines("Number of SNPs in {}: {}\n".format(args.snp_list, len(rsids)))
+
+    # One job per chromosome, processed in parallel and collected back in chromosome order
+    jobs = [(chrom, os.path.join(args.kg_dir, args.vcf_template.format(chrom))) for chrom in args.chromosomes]
+    if args.jobs > 1:
+        pool = Pool(args.jobs, initializer=set_rsids, initargs=(rsids,))
+        results = pool.imap(read_vcf_star, jobs)
+    else:
+        set_rsids(rsids)
+        pool = None
+        results = map(read_vcf_star, jobs)
+
+    # Write SNPs chromosome by chromosome as they come back
+    samples, all_info, all_dosages = None, [], []
+    tsv = open("{}/oneK_genotypes.tsv".format(args.output_dir), 'wb') if args.format == "tsv" else None
+    for chrom, chrom_samples, info, dosages, dropped in results:
+        print("Adding SNPs from chromosome {}".format(chrom))
+        if samples is None:
+            samples = chrom_samples
+            if tsv is not None:
+                tsv.write("\t".join(["# CHROM", "POS", "ID", "REF", "ALT"] + samples).encode() + b"\n")
+        elif chrom_samples != samples:
+            raise ValueError("Samples in chromosome {} vcf do not match chromosome {}".format(chrom, args.chromosomes[0]))
+        log.writelines("Chromosome {}: {} SNPs kept, {} dropped for calls other than 0/1\n".format(chrom, len(info), dropped))
+        if tsv is not None:
+            write_tsv_rows(tsv, info, dosages)
+        else:
+            all_dosages.append(dosages)
+        all_info.extend(info)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # Save the final matrix as a memory-mappable store if asked instead of a tsv
+    info = pd.DataFrame(all_info, columns=["# CHROM", "POS", "ID", "REF", "ALT"])
+    if tsv is not None:
+        tsv.close()
+    else:
+        # A store with no SNPs can't be memory-mapped, so say why instead of writing one
+        if len(info) == 0:
+            log.writelines("No SNPs of {} found in the vcfs, no store written\n".format(args.snp_list))
+            log.close()
+            raise ValueError("No SNPs of {} found in the vcfs of chromosomes {}, nothing to write to the memmap store".format(args.snp_list, ", ".join(args.chromosomes)))
+        write_store(np.vstack(all_dosages).T, samples, info["ID"], "{}/oneK_genotypes".format(args.output_dir), dtype=np.int8)
+
+    # Save ID and REF allele of each SNP for alleleToNum.py
+    info.drop_duplicates("ID")[["ID", "REF"]].to_csv("{}/oneK_rsids.tsv".format(args.output_dir), sep='\t', index=False)
+    log.writelines("Number of SNPs in output: {}\n".format(len(info)))
+    log.close()
+
+
+if __name__ == '__main__':
+    KG_DIR = "/datasets/cs284s-sp20-public/1000Genomes"
+    SNP_LIST = os.path.join(os.environ["HOME"], "project/datasets/openSNP/data", "openSNP_filtered_rsids.txt")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--kg_dir', type=str, default=KG_DIR, help='path to 1000Genomes vcfs (one per chromosome), default is {}'.format(KG_DIR))
+    parser.add_argument('-s', '--snp_list', type=str, default=SNP_LIST, help='filepath to SNP list (one per line from openSNP), default is {}'.format(SNP_LIST))
+    parser.add_argument('-t', '--vcf_template', type=str, default=VCF_TEMPLATE, help='vcf filename with {{}} in place of the chromosome, default is {}'.format(VCF_TEMPLATE))
+    parser.add_argument('-c', '--chromosomes', type=str, nargs='+', default=[str(chrom) for chrom in range(1, 23)], help='chromosomes to extract, default is 1-22')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of chromosomes to read in parallel')
+    parser.add_argument('-f', '--format', type=str, default='tsv', choices=['tsv', 'memmap'], help='output format, memmap writes an int8 individual x SNP .dat matrix plus .json sidecar')
+    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
+    parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,310 @@
+"""
+Run the preprocessing steps (initialPhenotypes.py through extractTestSet.py) as a DAG, only rerunning what changed
+Input:
+    - the raw downloads: openSNP phenotype csv and genotype dir, 1000Genomes vcfs and the IrisPlex bed file
+      (or, with --oneK_dir/--iris_genotypes, the tables oneK_genotypes.py/extractPanel.py already made from the vcfs)
+Output:
+    - every step's outputs in --output_dir, with each step's stdout/stderr in <step>.out in --log_dir
+    - .pipeline_state.json: the key and output hashes of every step that finished, plus the file hash cache
+Notes:
+    - each step declares its input and output files, a step runs after the steps whose outputs it reads
+    - a step's key hashes its command line (so its flags), the contents of its inputs and the code of its script and
+      the local modules it imports, a step is skipped if its key is the one it last finished with and its outputs still
+      hash the same, so changing one flag or input only reruns that step and whatever reads what it wrote
+    - files are only read again for hashing when their size or mtime changed (directories hash the files in them),
+      extractPanel only lists the vcfs of the chromosomes in the panel BED so the others are never hashed for it
+    - steps whose inputs are ready run at the same time up to --jobs, e.g. extractPanel -> predictPhenotype next to
+      extractGenotypes -> filterGenotypes -> alleleToNum
+    - flags for one step go in --step_args, e.g. -a "extractTrainSet=--dosage" -a "extractGenotypes=-j 8"
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from oneK_genotypes import VCF_TEMPLATE
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHROMOSOMES = [str(chrom) for chrom in range(1, 23)]
+
+
+# Outputs of a genotype store written as a memmap (.dat + .json) or as a pickle, depending on the step's --format
+def store_files(prefix, step_args):
+    if "pickle" in step_args:
+        return ["{}.pickle".format(prefix)]
+    return ["{}.dat".format(prefix), "{}.json".format(prefix)]
+
+
+# Chromosomes a BED panel has regions on (in order of appearance), every chromosome if the file isn't there yet
+def bed_chromosomes(bed_file):
+    if not os.path.exists(bed_file):
+        return CHROMOSOMES
+    chroms = []
+    with open(bed_file) as f:
+        for line in f:
+            chrom = line.split("\t", 1)[0].strip()
+            if chrom and not line.startswith("#") and chrom not in chroms:
+                chroms.append(chrom)
+    return chroms
+
+
+# The steps as dicts of script, arguments, input files and output files (all paths absolute)
+def pipeline(args):
+    out = lambda name: os.path.join(args.output_dir, name)
+    extra = {name: shlex.split(" ".join(values)) for name, values in args.step_args.items()}
+    vcfs = [os.path.join(args.kg_dir, args.vcf_template.format(chrom)) for chrom in CHROMOSOMES]
+    steps = []
+
+    def step(name, script, arguments, inputs, outputs):
+        steps.append({"name": name, "script": os.path.join(HERE, script), "args": arguments + extra.get(name, []),
+                      "inputs": inputs, "outputs": outputs})
+
+    step("initialPhenotypes", "initialPhenotypes.py", ["-p", args.phenotype_file],
+         [args.phenotype_file], [out("openSNP_initial_phenotypes.tsv"), out("openSNP_initial_userids.txt")])
+    step("extractGenotypes", "extractGenotypes.py", ["-i", out("openSNP_initial_userids.txt"), "-g", args.genotypes_dir],
+         [out("openSNP_initial_userids.txt"), args.genotypes_dir], [out("openSNP_initial_genotypes.tsv")])
+    step("filterGenotypes", "filterGenotypes.py", ["-g", out("openSNP_initial_genotypes.tsv")],
+         [out("openSNP_initial_genotypes.tsv")], [out("openSNP_filtered_genotypes.tsv"), out("openSNP_filtered_rsids.txt")])
+
+    # 1000Genomes genotypes of the filtered SNPs (a tsv, or a .json store with its .dat), from the vcfs or already extracted
+    if args.oneK_dir != None:
+        oneK_dir = args.oneK_dir
+        memmap = not os.path.exists(os.path.join(oneK_dir, "oneK_genotypes.tsv"))
+    else:
+        oneK_dir = args.output_dir
+        memmap = "memmap" in extra.get("oneK_genotypes", [])
+    oneK = store_files(os.path.join(oneK_dir, "oneK_genotypes"), [])[::-1] if memmap else [os.path.join(oneK_dir, "oneK_genotypes.tsv")]
+    oneK_rsids = os.path.join(oneK_dir, "oneK_rsids.tsv")
+    if args.oneK_dir == None:
+        step("oneK_genotypes", "oneK_genotypes.py", ["-s", out("openSNP_filtered_rsids.txt"), "-k", args.kg_dir, "-t", args.vcf_template],
+             [out("openSNP_filtered_rsids.txt")] + vcfs, oneK + [oneK_rsids])
+    step("alleleToNum", "alleleToNum.py", ["-g", out("openSNP_filtered_genotypes.tsv"), "-id", oneK_rsids],
+         [out("openSNP_filtered_genotypes.tsv"), oneK_rsids], [out("openSNP_final_genotypes.tsv")])
+
+    # IrisPlex labels of the 1000Genomes individuals, from the vcfs of the panel's chromosomes or an already extracted panel
+    iris_genotypes = args.iris_genotypes
+    if iris_genotypes == None:
+        iris_genotypes = out("iris_oneK_genotypes.tsv")
+        panel_vcfs = [os.path.join(args.kg_dir, args.vcf_template.format(chrom)) for chrom in bed_chromosomes(args.iris_plex_file)]
+        step("extractPanel", "extractPanel.py", ["-b", args.iris_plex_file, "-k", args.kg_dir, "-t", args.vcf_template],
+             [args.iris_plex_file] + panel_vcfs + [vcf + ".tbi" for vcf in panel_vcfs], [iris_genotypes])
+    step("predictPhenotype", "predictPhenotype.py", ["-g", iris_genotypes, "-ip", args.iris_plex_file],
+         [iris_genotypes, args.iris_plex_file],
+         [out("train_labels.csv"), out("val_labels.csv"), out("train_ids.txt"), out("val_ids.txt")])
+
+    # Train/val sets from 1000Genomes in the order of the openSNP SNPs, and the openSNP test set
+    train_args = extra.get("extractTrainSet", [])
+    step("extractTrainSet", "extractTrainSet.py", ["-g", oneK[0], "-t", out("train_ids.txt"), "-v", out("val_ids.txt"), "-so", out("openSNP_final_genotypes.tsv")],
+         oneK + [out("train_ids.txt"), out("val_ids.txt"), out("openSNP_final_genotypes.tsv")],
+         store_files(out("train_set"), train_args) + store_files(out("val_set"), train_args) + [out("train_set_stats.tsv")])
+    step("extractTestSet", "extractTestSet.py", ["-g", out("openSNP_final_genotypes.tsv"), "-p", out("openSNP_initial_phenotypes.tsv"), "-s", out("train_set_stats.tsv")],
+         [out("openSNP_final_genotypes.tsv"), out("openSNP_initial_phenotypes.tsv"), out("train_set_stats.tsv")],
+         store_files(out("test_set"), extra.get("extractTestSet", [])) + [out("test_labels.csv"), out("openSNP_final_rsids.txt")])
+
+    # Each step comes after the steps that write its inputs
+    writers = {output: step["name"] for step in steps for output in step["outputs"]}
+    for step in steps:
+        step["after"] = sorted(set(writers[path] for path in step["inputs"] if path in writers))
+    unknown = set(args.step_args) - set(step["name"] for step in steps)
+    if unknown:
+        raise ValueError("--step_args for steps not in the pipeline: {}".format(", ".join(sorted(unknown))))
+    return steps
+
+
+# Local modules a script imports (and the ones they import), so a change to e.g. genotypeStore.py reruns its users
+def local_modules(script, found=None):
+    found = set() if found is None else found
+    with open(script) as f:
+        for module in re.findall(r"^\s*(?:from|import)\s+(\w+)", f.read(), flags=re.M):
+            path = os.path.join(os.path.dirname(script), module + ".py")
+            if os.path.exists(path) and path not in found:
+                found.add(path)
+                local_modules(path, found)
+    return found
+
+
+# sha256 of a file, reused from the cache while its size and mtime are the same
+def file_hash(path, cache):
+    stat = os.stat(path)
+    cached = cache.get(path)
+    if cached != None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    cache[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return cache[path][2]
+
+
+# Hash of a file, or of the names and hashes of every file under a directory, None if it does not exist
+def path_hash(path, cache):
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                digest.update("{}\t{}\n".format(os.path.relpath(full, path), file_hash(full, cache)).encode())
+        return digest.hexdigest()
+    if os.path.exists(path):
+        return file_hash(path, cache)
+    return None
+
+
+# Key of a step from its command line, inputs and code, None if an input is missing
+def step_key(step, cache):
+    inputs = {path: path_hash(path, cache) for path in step["inputs"]}
+    if None in inputs.values():
+        return None
+    code = {path: file_hash(path, cache) for path in sorted(local_modules(step["script"]) | {step["script"]})}
+    key = json.dumps({"args": step["args"], "inputs": inputs, "code": code}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# A step is up to date if it last finished with this key and its outputs have not changed since
+def up_to_date(step, key, state, cache):
+    done = state["steps"].get(step["name"])
+    if done == None or done["key"] != key:
+        return False
+    return all(path_hash(path, cache) == done["outputs"].get(path) for path in step["outputs"])
+
+
+# Save the state through a temporary file so an interrupted run never leaves it half written
+def save_state(state, filename):
+    with open(filename + ".tmp", 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(filename + ".tmp", filename)
+
+
+# Run one step's script, returns (exit code, seconds)
+def run_step(step, output_dir, log_dir):
+    command = [sys.executable, step["script"]] + step["args"] + ["-o", output_dir, "-l", log_dir]
+    start = time.perf_counter()
+    with open(os.path.join(log_dir, "{}.out".format(step["name"])), 'w') as log:
+        code = subprocess.run(command, cwd=HERE, stdout=log, stderr=subprocess.STDOUT).returncode
+    return code, time.perf_counter() - start
+
+
+# Main function
+def main(args):
+    args.output_dir, args.log_dir = os.path.abspath(args.output_dir), os.path.abspath(args.log_dir or args.output_dir)
+    for name in ["phenotype_file", "genotypes_dir", "kg_dir", "iris_plex_file", "oneK_dir", "iris_genotypes"]:
+        if getattr(args, name) != None:
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.makedirs(args.log_dir, exist_ok=True)
+    steps = pipeline(args)
+    by_name = {step["name"]: step for step in steps}
+
+    # Only the steps leading to --targets, forced steps are forgotten so they rerun
+    wanted = set()
+    pending = list(args.targets or by_name)
+    while pending:
+        name = pending.pop()
+        if name not in by_name:
+            raise ValueError("Unknown step {}, steps are {}".format(name, ", ".join(by_name)))
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(by_name[name]["after"])
+    state_file = os.path.join(args.output_dir, ".pipeline_state.json")
+    state = {"hashes": {}, "steps": {}}
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+    for name in args.force or []:
+        state["steps"].pop(name, None)
+    cache = state["hashes"]
+
+    # Dry run: a step runs if anything before it runs or its key/outputs changed
+    if args.dry_run:
+        runs = set()
+        for step in steps:
+            if step["name"] not in wanted:
+                continue
+            key = None if runs & set(step["after"]) else step_key(step, cache)
+            if key != None and up_to_date(step, key, state, cache):
+                print("  up to date  {}".format(step["name"]))
+            else:
+                runs.add(step["name"])
+                print("  would run   {}".format(step["name"]))
+        return
+
+    # Start every step whose earlier steps are done, as many at once as --jobs
+    finished, failed, running = set(), set(), {}
+    waiting = [step for step in steps if step["name"] in wanted]
+    with ThreadPoolExecutor(args.jobs) as pool:
+        while waiting or running:
+            for step in list(waiting):
+                if set(step["after"]) & failed:
+                    print("Skipping {}, a step before it failed".format(step["name"]))
+                    failed.add(step["name"])
+                    waiting.remove(step)
+                elif set(step["after"]) <= finished and len(running) < args.jobs:
+                    waiting.remove(step)
+                    key = step_key(step, cache)
+                    if key == None:
+                        missing = [path for path in step["inputs"] if not os.path.exists(path)]
+                        print("Can't run {}, missing inputs: {}".format(step["name"], ", ".join(missing)))
+                        failed.add(step["name"])
+                    elif up_to_date(step, key, state, cache):
+                        print("{} is up to date".format(step["name"]))
+                        finished.add(step["name"])
+                    else:
+                        print("Running {}".format(step["name"]))
+                        running[pool.submit(run_step, step, args.output_dir, args.log_dir)] = (step, key)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, key = running.pop(future)
+                code, seconds = future.result()
+                missing = [path for path in step["outputs"] if not os.path.exists(path)]
+                if code != 0 or missing:
+                    print("{} failed (exit code {}{}), see {}".format(step["name"], code, ", missing " + ", ".join(missing) if missing else "",
+                                                                      os.path.join(args.log_dir, "{}.out".format(step["name"]))))
+                    state["steps"].pop(step["name"], None)
+                    failed.add(step["name"])
+                else:
+                    print("Finished {} in {:.1f}s".format(step["name"], seconds))
+                    state["steps"][step["name"]] = {"key": key, "outputs": {path: path_hash(path, cache) for path in step["outputs"]},
+                                                    "seconds": seconds, "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                    finished.add(step["name"])
+                save_state(state, state_file)
+    save_state(state, state_file)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    DATASETS = os.path.join(os.environ["HOME"], "project/datasets")
+    KG_DIR = "/datasets/cs284s-sp20-public/1000Genomes"
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--phenotype_file', type=str, default=os.path.join(DATASETS, "openSNP", "phenotypes_202004220659.csv"), help='filepath to openSNP phenotype csv')
+    parser.add_argument('-g', '--genotypes_dir', type=str, default=os.path.join(DATASETS, "openSNP/genotypes/"), help='filepath to openSNP genotype files')
+    parser.add_argument('-k', '--kg_dir', type=str, default=KG_DIR, help='path to 1000Genomes vcfs (one per chromosome, tabix indexed), default is {}'.format(KG_DIR))
+    parser.add_argument('-t', '--vcf_template', type=str, default=VCF_TEMPLATE, help='vcf filename with {{}} in place of the chromosome, default is {}'.format(VCF_TEMPLATE))
+    parser.add_argument('-ip', '--iris_plex_file', type=str, default=os.path.join(DATASETS, "irisplex.bed"), help='filepath to IrisPlex bed file')
+    parser.add_argument('--oneK_dir', type=str, default=None, help='dir with an oneK_genotypes.tsv (or .json store) and oneK_rsids.tsv to use instead of the oneK_genotypes step')
+    parser.add_argument('--iris_genotypes', type=str, default=None, help='iris_oneK_genotypes.tsv to use instead of the extractPanel step')
+    parser.add_argument('-a', '--step_args', type=str, action='append', default=[], help='STEP="FLAGS" extra flags for one step, can be repeated')
+    parser.add_argument('--targets', type=str, nargs='+', default=None, help='only run these steps and the steps before them, default is every step')
+    parser.add_argument('-f', '--force', type=str, nargs='+', default=None, help='rerun these steps even if they are up to date (and whatever their new outputs change)')
+    parser.add_argument('-n', '--dry_run', action='store_true', help='only print which steps would run')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='steps to run at once, default is 2')
+    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir of every step')
+    parser.add_argument('-l', '--log_dir', type=str, default=None, help='path to output log files to, default is the output dir')
+    args = parser.parse_args()
+    step_args = {}
+    for item in args.step_args:
+        name, _, flags = item.partition("=")
+        step_args.setdefault(name, []).append(flags)
+    args.step_args = step_args
+    main(args)
@@ -0,0 +1,155 @@
+"""
+Select a reduced SNP panel (e.g. the 1000 and 6 SNP models) by scoring every SNP against the IrisPlex derived labels
+Input:
+    - train_set.json: individual x SNP genotype store from extractTrainSet.py (int8 dosages with --dosage, or float32 z-scores)
+    - train_labels.csv: IrisPlex labels of the training individuals from predictPhenotype.py
+    - val_set.json/test_set.json (optional): stores to subset to the same SNPs
+Output:
+    - <K>_snps.txt: top K rsIDs, best first (one per line, usable as extractTrainSet.py --snp_order)
+    - <K>_train_set, <K>_val_set, <K>_test_set: the stores cut down to those SNPs in that order
+Notes:
+    - scores: chi2 of the label x 0/1/2 genotype contingency table, ANOVA F of the dosages between labels, or dosage variance
+    - SNPs are scored in blocks of columns read from the memory-mapped store, so only one block is in memory at a time,
+      and every statistic of a block comes from a few one-hot label @ genotype indicator matrix products
+    - missing calls are left out of every statistic, z-scored stores are turned back into dosages with train_set_stats.tsv
+      (their missing calls were set to the mean, which is not a whole dosage unless the mean happens to be one)
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from genotypeStore import read_store, write_store
+from normalizeGenotypes import read_stats, get_positions
+
+
+# Back to 0,1,2 dosages (-1 missing) from z-scores, anything not within 1e-3 of a whole dosage was missing
+def z_to_dosages(block, means, stds):
+    with np.errstate(invalid='ignore'):
+        raw = block * stds + means
+    dosages = np.rint(raw)
+    missing = ~(np.abs(raw - dosages) < 1e-3) | (dosages < 0) | (dosages > 2)
+    return np.where(missing, -1, dosages).astype(np.int8)
+
+
+# Chi2 of the label x genotype table of every SNP in a block, genotypes not seen in a SNP are left out like empty columns
+def chi2_scores(onehot, dosages):
+    observed = np.stack([onehot.T @ (dosages == g).astype(np.float32) for g in range(3)], axis=1)  # labels x genotypes x SNPs
+    total = observed.sum(axis=(0, 1))
+    expected = observed.sum(axis=1, keepdims=True) * observed.sum(axis=0, keepdims=True) / np.maximum(total, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cells = np.where(expected > 0, (observed - expected) ** 2 / expected, 0)
+    return cells.sum(axis=(0, 1))
+
+
+# Per label counts, sums and sums of squares of the non-missing dosages of a block
+def label_moments(onehot, dosages):
+    valid = (dosages >= 0).astype(np.float32)
+    values = np.where(dosages >= 0, dosages, 0).astype(np.float32)
+    return onehot.T @ valid, onehot.T @ values, onehot.T @ (values * values)
+
+
+# One way ANOVA F of the dosages between labels for every SNP in a block
+def anova_scores(onehot, dosages):
+    counts, sums, squares = label_moments(onehot, dosages)
+    n, k = counts.sum(axis=0), (counts > 0).sum(axis=0)
+    grand = sums.sum(axis=0) / np.maximum(n, 1)
+    between = (sums ** 2 / np.maximum(counts, 1)).sum(axis=0) - n * grand ** 2
+    within = squares.sum(axis=0) - (sums ** 2 / np.maximum(counts, 1)).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (between / (k - 1)) / (within / (n - k))
+
+
+# Variance (ddof=1) of the non-missing dosages of every SNP in a block, labels are not used
+def variance_scores(onehot, dosages):
+    counts, sums, squares = label_moments(onehot, dosages)
+    n = counts.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (squares.sum(axis=0) - sums.sum(axis=0) ** 2 / n) / (n - 1)
+
+
+SCORES = {"chi2": chi2_scores, "anova": anova_scores, "variance": variance_scores}
+
+
+# Score every SNP of a store block by block, returns one score per SNP (nan scores count as 0)
+def score_snps(store, rows, labels, method, block_size, means=None, stds=None):
+    classes = np.unique(labels)
+    onehot = (labels[:, None] == classes[None, :]).astype(np.float32)
+    scores = np.empty(store.shape[1], dtype=np.float64)
+    for start in range(0, store.shape[1], block_size):
+        stop = min(start + block_size, store.shape[1])
+        block = np.asarray(store[:, start:stop])[rows]
+        if means is not None:
+            block = z_to_dosages(block, means[start:stop], stds[start:stop])
+        scores[start:stop] = SCORES[method](onehot, block)
+    return np.nan_to_num(scores, nan=0.0, posinf=0.0)
+
+
+# Cut a store down to some rsIDs (in that order) and write it as a new store
+def subset_store(sidecar, rsids, prefix, file_format):
+    store, samples, store_rsids = read_store(sidecar)
+    columns = get_positions(pd.Index(store_rsids), rsids)
+    order = np.argsort(columns)
+    subset = np.empty((store.shape[0], len(columns)), dtype=store.dtype)
+    subset[:, order] = store[:, columns[order]]
+    if file_format == "pickle":
+        pd.DataFrame(subset, index=samples, columns=rsids).to_pickle("{}.pickle".format(prefix))
+    else:
+        write_store(subset, samples, rsids, prefix, dtype=store.dtype)
+    return subset.shape
+
+
+# Main function
+def main(args):
+
+    # Training individuals with labels, in the order of the store
+    store, samples, rsids = read_store(args.train_set)
+    labels = pd.read_csv(args.train_labels, index_col=0).iloc[:, 0]
+    rows = get_positions(pd.Index(samples), labels.index.astype(str))
+
+    # z-scored stores are scored as the dosages they came from
+    means, stds = None, None
+    if store.dtype != np.int8:
+        stats_file = args.stats if args.stats != None else os.path.join(os.path.dirname(args.train_set), "train_set_stats.tsv")
+        stats = read_stats(stats_file, rsids)
+        means, stds = stats["means"].to_numpy(np.float32), stats["std"].to_numpy(np.float32)
+
+    # Score and rank every SNP
+    print("Scoring {} SNPs with {}".format(len(rsids), args.method))
+    scores = score_snps(store, rows, labels.to_numpy(), args.method, args.block_size, means, stds)
+    top = np.argsort(-scores, kind='stable')[:args.top_k]
+    top_rsids = [rsids[i] for i in top]
+    with open("{}/{}_snps.txt".format(args.output_dir, args.top_k), 'w') as f:
+        f.writelines("{}\n".format(rsid) for rsid in top_rsids)
+
+    # Matching train/val/test sets
+    print("Writing {} SNP sets".format(args.top_k))
+    shapes = {}
+    for name, sidecar in [("train", args.train_set), ("val", args.val_set), ("test", args.test_set)]:
+        if sidecar != None:
+            shapes[name] = subset_store(sidecar, top_rsids, "{}/{}_{}_set".format(args.output_dir, args.top_k, name), args.format)
+
+    # Write log info
+    with open("{}/selectSNPs.log".format(args.log_dir), 'w') as log:
+        log.writelines("Scored {} SNPs of {} individuals with {}\n".format(len(rsids), len(rows), args.method))
+        log.writelines("Top {} scores: {} to {}\n".format(len(top), scores[top[0]], scores[top[-1]]))
+        for name, shape in shapes.items():
+            log.writelines("{} dimensions: {} X {}\n".format(name, shape[1], shape[0]))
+
+
+if __name__ == '__main__':
+    DATA = os.path.join(os.environ["HOME"], "project/datasets/oneKGenomes/data")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--train_set', type=str, default=os.path.join(DATA, "train_set.json"), help='.json sidecar of the training store to score SNPs on')
+    parser.add_argument('-p', '--train_labels', type=str, default=os.path.join(DATA, "train_labels.csv"), help='training labels from predictPhenotype.py')
+    parser.add_argument('-v', '--val_set', type=str, default=None, help='.json sidecar of the val store to subset as well')
+    parser.add_argument('-t', '--test_set', type=str, default=None, help='.json sidecar of the test store to subset as well')
+    parser.add_argument('-s', '--stats', type=str, default=None, help='train_set_stats.tsv for z-scored stores, default is next to the train store')
+    parser.add_argument('-m', '--method', type=str, default='chi2', choices=list(SCORES), help='how to score SNPs, default is chi2')
+    parser.add_argument('-k', '--top_k', type=int, default=1000, help='number of SNPs to keep, default is 1000')
+    parser.add_argument('-b', '--block_size', type=int, default=4096, help='SNP columns scored at a time')
+    parser.add_argument('-f', '--format', type=str, default='memmap', choices=['memmap', 'pickle'], help='output format for the subset sets')
+    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
+    parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
+    args = parser.parse_args()
+    main(args)
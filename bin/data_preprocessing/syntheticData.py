@@ -0,0 +1,271 @@
+"""
+Write a synthetic openSNP + 1000Genomes dataset laid out like the real downloads, for benchmarking the preprocessing
+scripts without the real data (see benchmarkPipeline.py)
+Input:
+    - irisplex.bed: the IrisPlex SNPs, placed at their real positions with their real minor alleles
+Output:
+    - genotypes/: one raw file per openSNP user, 23andMe (rsid, chromosome, position, genotype) or AncestryDNA
+      (rsid, chromosome, position, allele1, allele2) like user{id}_file{n}_yearofbirth_{year}_sex_{sex}.23andme.txt
+    - phenotypes_synthetic.csv: ; separated openSNP phenotype dump with the three eye color columns initialPhenotypes.py reads
+    - openSNP_initial_userids.txt: the users initialPhenotypes.py keeps, in the same order
+    - oneK_genotypes.tsv, oneK_rsids.tsv: what oneK_genotypes.py writes for the openSNP SNPs
+    - iris_oneK_genotypes.tsv, irisplex.bed: what extractPanel.py writes for the IrisPlex SNPs and the panel itself
+    - synthetic.json: the settings the dataset was made with
+Notes:
+    - user ids are spread over 6..6131 and 1000Genomes samples run from HG00096 to NA21144 (with the NA12249, NA20509
+      and NA12750 predictPhenotype.py logs), the column slices of filterGenotypes.py and extractTestSet.py need those ends
+    - genotypes are drawn in Hardy-Weinberg proportions from a per SNP minor allele frequency, except rs12913832 which
+      depends on the eye color of the individual so the IrisPlex labels are not all one color
+    - each chip covers its own --chip_coverage of the SNPs (23andMe also has internal i-ids), calls are missing at
+      --missing_rate, --not_in_oneK of the SNPs are left out of 1000Genomes and --bad_files of the users get a raw file
+      that cannot be read
+    - raw files are written from one byte template per chip with only the genotype bytes filled in per user
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import tqdm
+import irisPlex
+from oneK_genotypes import write_tsv_rows
+
+
+BASES = np.array(list("ACGT"))
+COLORS = ["brown", "blue", "green"]
+
+# Relative chromosome sizes (GRCh37 Mb) so SNPs are spread over the genome like a genotyping chip
+CHROM_SIZES = [249, 243, 198, 191, 181, 171, 159, 146, 141, 136, 135, 134, 115, 107, 102, 90, 81, 78, 59, 63, 48, 51]
+
+# Minor allele count probabilities (0, 1, 2) of rs12913832 for each eye color
+EYE_COLOR_SNP = "rs12913832"
+EYE_COLOR_COUNTS = {"brown": [0.05, 0.35, 0.6], "blue": [0.85, 0.13, 0.02], "green": [0.5, 0.4, 0.1]}
+
+HEADERS = {"23andme": "# This data file generated by syntheticData.py\n# rsid\tchromosome\tposition\tgenotype\n",
+           "ancestry": "#AncestryDNA raw data download (syntheticData.py)\nrsid\tchromosome\tposition\tallele1\tallele2\n"}
+MISSING = {"23andme": b"--", "ancestry": b"00"}
+
+
+# rs SNPs spread over chromosomes 1-22 with the IrisPlex SNPs at their real positions, in genome order
+# ref/alt are what 1000Genomes would call them (IrisPlex minor allele as REF for irisPlex.FLIPPED_SNPS)
+def make_panel(num_snps, iris, rng):
+    chroms = rng.choice(np.arange(1, 23), size=num_snps, p=np.array(CHROM_SIZES) / sum(CHROM_SIZES))
+    panel = pd.DataFrame({"rsid": ["rs{}".format(i) for i in rng.choice(10 ** 8, size=num_snps, replace=False)],
+                          "chromosome": chroms,
+                          "position": rng.integers(10 ** 4, np.array(CHROM_SIZES)[chroms - 1] * 10 ** 6),
+                          "iris": -1})
+    ref = rng.integers(0, 4, size=num_snps)
+    panel["ref"], panel["alt"] = BASES[ref], BASES[(ref + rng.integers(1, 4, size=num_snps)) % 4]
+
+    # IrisPlex SNPs replace random rsids so the SNP count stays num_snps
+    iris_rows = pd.DataFrame({"rsid": iris["id"], "chromosome": iris["chr"], "position": iris["pos2"], "iris": np.arange(len(iris))})
+    minor = iris["minor_allele"].to_numpy()
+    other = BASES[(np.searchsorted(BASES, minor) + 2) % 4]
+    flipped = iris["id"].isin(irisPlex.FLIPPED_SNPS).to_numpy()
+    iris_rows["ref"], iris_rows["alt"] = np.where(flipped, minor, other), np.where(flipped, other, minor)
+    panel = pd.concat([panel.iloc[len(iris):], iris_rows], ignore_index=True)
+    panel["maf"] = rng.uniform(0.05, 0.5, size=len(panel))
+    return panel.sort_values(["chromosome", "position"]).reset_index(drop=True)
+
+
+# openSNP user ids spread over 6..6131, always including both ends
+def user_ids(num_users):
+    if not 2 <= num_users <= 6126:
+        raise ValueError("Number of users needs to be between 2 and 6126, not {}".format(num_users))
+    return np.linspace(6, 6131, num_users).round().astype(int)
+
+
+# 1000Genomes style sample names from HG00096 to NA21144, including the individuals predictPhenotype.py logs
+def sample_names(num_samples, rng):
+    fixed = ["NA12249", "NA12750", "NA20509"]
+    if num_samples < len(fixed) + 2:
+        raise ValueError("Need at least {} 1000Genomes samples".format(len(fixed) + 2))
+    num_hg = max(1, (num_samples - len(fixed) - 1) // 2)
+    na = np.setdiff1d(np.arange(6985, 21144), [int(name[2:]) for name in fixed])
+    na = rng.choice(na, size=num_samples - len(fixed) - 1 - num_hg, replace=False)
+    names = ["HG{:05d}".format(96 + i) for i in range(num_hg)]
+    return names + sorted(["NA{:05d}".format(i) for i in na] + fixed) + ["NA21144"]
+
+
+# ALT allele dosages (SNP x individual int8) of some panel rows, rs12913832 drawn from each individual's eye color
+def draw_dosages(panel, rows, colors, rng):
+    dosages = rng.binomial(2, panel["maf"].to_numpy()[rows, None], size=(len(rows), len(colors))).astype(np.int8)
+    eye = np.flatnonzero(panel["rsid"].to_numpy()[rows] == EYE_COLOR_SNP)
+    if len(eye):
+        probs = np.array([EYE_COLOR_COUNTS[color] for color in colors])
+        counts = (rng.random(len(colors))[:, None] > probs.cumsum(axis=1)).sum(axis=1)
+        flipped = EYE_COLOR_SNP in irisPlex.FLIPPED_SNPS
+        dosages[eye[0]] = 2 - counts if flipped else counts
+    return dosages
+
+
+# Bytes of the two alleles for each panel SNP and ALT dosage, (SNPs x 3 x 2), heterozygotes in alphabetical order
+def allele_codes(panel):
+    ref = panel["ref"].to_numpy().astype('S1').view(np.uint8)
+    alt = panel["alt"].to_numpy().astype('S1').view(np.uint8)
+    low, high = np.minimum(ref, alt), np.maximum(ref, alt)
+    return np.stack([np.stack([ref, ref], axis=1), np.stack([low, high], axis=1), np.stack([alt, alt], axis=1)], axis=1)
+
+
+# One chip's raw file as a byte template, returns (template, offsets of the first allele, gap to the second allele)
+def file_template(panel, rows, kind):
+    blank = "??\n" if kind == "23andme" else "?\t?\n"
+    lines = ["{}\t{}\t{}\t".format(*row) for row in panel.loc[rows, ["rsid", "chromosome", "position"]].itertuples(index=False)]
+    lengths = np.array([len(line) + len(blank) for line in lines])
+    template = np.frombuffer((HEADERS[kind] + blank.join(lines) + blank).encode(), dtype=np.uint8)
+    offsets = len(HEADERS[kind]) + np.cumsum(lengths) - len(blank)
+    return template, offsets, 1 if kind == "23andme" else 2
+
+
+# Fill one user's genotypes into a chip template and write the raw file
+def write_raw_file(filename, chip, codes, dosages, missing):
+    template, offsets, gap = chip["template"], chip["offsets"], chip["gap"]
+    alleles = codes[chip["rows"], dosages]
+    alleles[missing] = np.frombuffer(MISSING[chip["kind"]], dtype=np.uint8)
+    data = template.copy()
+    data[offsets], data[offsets + gap] = alleles[:, 0], alleles[:, 1]
+    with open(filename, 'wb') as f:
+        f.write(data.tobytes())
+
+
+# openSNP phenotype dump, the eye color of each user is in one of the three columns initialPhenotypes.py reads,
+# plus users it should drop (no eye color, or a filetype other than 23andMe/AncestryDNA)
+def make_phenotypes(ids, filenames, colors, rng):
+    columns = ["Eye color", "Eye Color", "Eye pigmentation "]
+    phenotypes = pd.DataFrame({"user_id": ids, "genotype_filename": filenames,
+                               "date_of_birth": rng.integers(1940, 2000, size=len(ids)).astype(str),
+                               "chrom_sex": rng.choice(["XX", "XY", "rather not say"], size=len(ids))})
+    for column in columns:
+        phenotypes[column] = "-"
+    which = rng.integers(0, len(columns), size=len(ids))
+    capital = rng.random(len(ids)) < 0.5
+    for i, (color, column) in enumerate(zip(colors, which)):
+        phenotypes.loc[i, columns[column]] = color.capitalize() if capital[i] else color
+    num_extra = max(1, len(ids) // 10)
+    extra = pd.DataFrame({"user_id": 6132 + np.arange(num_extra),
+                          "genotype_filename": ["user{}_file{}_yearofbirth_unknown_sex_unknown.{}".format(6132 + i, i, kind)
+                                                for i, kind in enumerate(rng.choice(["23andme.txt", "ftdna-illumina.txt"], size=num_extra))],
+                          "date_of_birth": "rather not say", "chrom_sex": "rather not say"})
+    for column in columns:
+        extra[column] = np.where(extra["genotype_filename"].str.contains("ftdna"), "Brown", "-")
+    phenotypes = pd.concat([phenotypes, extra], ignore_index=True)
+    phenotypes["Hair Color"] = rng.choice(["-", "Brown", "Blonde", "Black"], size=len(phenotypes))
+    return phenotypes
+
+
+# Redraw rs12913832 for anyone whose IrisPlex color is the only one of its kind,
+# predictPhenotype.py's stratified train/val split needs at least two of every color
+def fix_lonely_colors(dosages, colors, iris, panel_iris, rng):
+    order = np.argsort(panel_iris["iris"].to_numpy())
+    eye = np.flatnonzero(panel_iris["rsid"].to_numpy()[order] == EYE_COLOR_SNP)
+    for _ in range(100):
+        predicted = irisPlex.predict(dosages[order], iris, np.arange(len(colors)))["predicted_eye_color"]
+        counts = predicted.value_counts()
+        lonely = predicted.index[predicted.isin(counts.index[counts == 1])]
+        if len(lonely) == 0:
+            return dosages
+        redraw = draw_dosages(panel_iris, np.arange(len(panel_iris)), [colors[i] for i in lonely], rng)
+        dosages[order[eye[0]], lonely] = redraw[order[eye[0]]]
+    return dosages
+
+
+# Main function
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(os.path.join(args.output_dir, "genotypes"), exist_ok=True)
+    iris = irisPlex.read_iris(args.iris_plex_file)
+    iris.to_csv(os.path.join(args.output_dir, "irisplex.bed"), sep='\t', header=False, index=False)
+
+    # SNPs, the 23andMe internal i-ids and the SNPs 1000Genomes has
+    panel = make_panel(args.snps, iris, rng)
+    panel["in_oneK"] = (rng.random(len(panel)) >= args.not_in_oneK) | (panel["iris"] >= 0)
+    num_internal = len(panel) // 100
+    internal = pd.DataFrame({"rsid": ["i{}".format(3000001 + i) for i in range(num_internal)],
+                             "chromosome": rng.integers(1, 23, size=num_internal), "position": rng.integers(10 ** 4, 10 ** 7, size=num_internal),
+                             "iris": -1, "ref": "A", "alt": "G", "maf": 0.1, "in_oneK": False})
+    panel = pd.concat([panel, internal], ignore_index=True).sort_values(["chromosome", "position"]).reset_index(drop=True)
+    codes = allele_codes(panel)
+
+    # One template per chip, each covers its own random subset of the SNPs (all IrisPlex SNPs are on both)
+    chips = {}
+    for kind in ["23andme", "ancestry"]:
+        on_chip = (rng.random(len(panel)) < args.chip_coverage) | (panel["iris"] >= 0)
+        if kind == "ancestry":
+            on_chip &= ~panel["rsid"].str.startswith("i")
+        rows = np.flatnonzero(on_chip.to_numpy())
+        template, offsets, gap = file_template(panel, rows, kind)
+        chips[kind] = {"kind": kind, "rows": rows, "template": template, "offsets": offsets, "gap": gap}
+
+    # openSNP users, the first and last are never bad files so the "6":"6131" column slices hold
+    ids = user_ids(args.users)
+    colors = rng.choice(COLORS, size=len(ids), p=[0.45, 0.35, 0.2])
+    kinds = rng.choice(["23andme", "ancestry"], size=len(ids), p=[0.7, 0.3])
+    bad = rng.random(len(ids)) < args.bad_files
+    bad[[0, -1]] = False
+    filenames = []
+    for i, (id, color, kind) in enumerate(tqdm.tqdm(list(zip(ids, colors, kinds)))):
+        filename = "user{}_file{}_yearofbirth_{}_sex_{}.{}.txt".format(id, i + 1, rng.integers(1940, 2000), rng.choice(["XX", "XY"]), kind)
+        filenames.append(filename)
+        path = os.path.join(args.output_dir, "genotypes", filename)
+        if bad[i]:
+            with open(path, 'wb') as f:
+                f.write(b"PK\x03\x04" + rng.bytes(1024))
+            continue
+        rows = chips[kind]["rows"]
+        dosages = draw_dosages(panel, rows, [color], rng)[:, 0]
+        write_raw_file(path, chips[kind], codes, dosages, rng.random(len(rows)) < args.missing_rate)
+    make_phenotypes(ids, filenames, colors, rng).to_csv(os.path.join(args.output_dir, "phenotypes_synthetic.csv"), sep=';', index=False)
+    with open(os.path.join(args.output_dir, "openSNP_initial_userids.txt"), 'w') as f:
+        f.writelines("%s\n" % id for id in ids)
+
+    # 1000Genomes tables, streamed in blocks of SNPs
+    samples = sample_names(args.samples, rng)
+    sample_colors = list(rng.choice(COLORS, size=len(samples), p=[0.5, 0.35, 0.15]))
+    oneK = panel[panel["in_oneK"]].reset_index(drop=True)
+    iris_rows = np.flatnonzero(oneK["iris"].to_numpy() >= 0)
+    iris_dosages = fix_lonely_colors(draw_dosages(oneK, iris_rows, sample_colors, rng), sample_colors, iris,
+                                     oneK.iloc[iris_rows].reset_index(drop=True), rng)
+    info = oneK[["chromosome", "position", "rsid", "ref", "alt"]].astype(str).values.tolist()
+    header = "\t".join(["# CHROM", "POS", "ID", "REF", "ALT"] + samples).encode() + b"\n"
+    with open(os.path.join(args.output_dir, "oneK_genotypes.tsv"), 'wb') as f:
+        f.write(header)
+        for start in range(0, len(oneK), args.block_size):
+            rows = np.arange(start, min(start + args.block_size, len(oneK)))
+            dosages = draw_dosages(oneK, rows, sample_colors, rng)
+            hits = np.flatnonzero((iris_rows >= rows[0]) & (iris_rows <= rows[-1]))
+            dosages[iris_rows[hits] - start] = iris_dosages[hits]
+            write_tsv_rows(f, info[start:start + len(rows)], dosages)
+    oneK.rename(columns={"rsid": "ID", "ref": "REF"})[["ID", "REF"]].to_csv(os.path.join(args.output_dir, "oneK_rsids.tsv"), sep='\t', index=False)
+    order = np.argsort(oneK["iris"].to_numpy()[iris_rows])
+    with open(os.path.join(args.output_dir, "iris_oneK_genotypes.tsv"), 'wb') as f:
+        f.write(header)
+        write_tsv_rows(f, [info[i] for i in iris_rows[order]], iris_dosages[order])
+
+    # Settings, so benchmarkPipeline.py knows when it can reuse a dataset
+    settings = {key: value for key, value in vars(args).items() if key not in ("output_dir", "log_dir", "block_size")}
+    with open(os.path.join(args.output_dir, "synthetic.json"), 'w') as f:
+        json.dump(settings, f, indent=1)
+    with open("{}/syntheticData.log".format(args.log_dir), 'w') as log:
+        log.writelines("Users: {} ({} bad files), eye colors: {}\n".format(len(ids), bad.sum(), pd.Series(colors).value_counts().to_dict()))
+        log.writelines("SNPs: {} ({} on the 23andMe chip, {} on the AncestryDNA chip)\n".format(len(panel), len(chips["23andme"]["rows"]), len(chips["ancestry"]["rows"])))
+        log.writelines("1000Genomes: {} SNPs x {} samples\n".format(len(oneK), len(samples)))
+
+
+if __name__ == '__main__':
+    IRISPLEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../data/iris_plex/irisplex.bed")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u', '--users', type=int, default=600, help='number of openSNP users, default is 600')
+    parser.add_argument('-n', '--snps', type=int, default=100000, help='number of rs SNPs, default is 100000')
+    parser.add_argument('-k', '--samples', type=int, default=2504, help='number of 1000Genomes samples, default is 2504')
+    parser.add_argument('-ip', '--iris_plex_file', type=str, default=IRISPLEX, help='filepath to IrisPlex bed file, default is {}'.format(IRISPLEX))
+    parser.add_argument('-c', '--chip_coverage', type=float, default=0.95, help='fraction of the SNPs on each chip, default is 0.95')
+    parser.add_argument('-m', '--missing_rate', type=float, default=0.01, help='fraction of calls missing (-- or 0 0), default is 0.01')
+    parser.add_argument('-x', '--not_in_oneK', type=float, default=0.02, help='fraction of SNPs left out of 1000Genomes, default is 0.02')
+    parser.add_argument('-b', '--bad_files', type=float, default=0.02, help='fraction of users with an unreadable raw file, default is 0.02')
+    parser.add_argument('-r', '--seed', type=int, default=0, help='random seed, default is 0')
+    parser.add_argument('--block_size', type=int, default=10000, help='1000Genomes SNPs drawn and written at a time')
+    parser.add_argument('-o', '--output_dir', type=str, default='.', help='path to output dir')
+    parser.add_argument('-l', '--log_dir', type=str, default='.', help='path to output log file to')
+    args = parser.parse_args()
+    main(args)
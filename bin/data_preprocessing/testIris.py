@@ -8,32 +8,8 @@ import os
 import pandas as pd
 import argparse
 import numpy as np
+import irisPlex
 
-# Function to switch genotype label for SNPs whose ref allele matches iris
-def fix_genotypes(x):
-    if x["rsid"] in ['rs12896399', 'rs12913832', 'rs16891982']:
-        for col in x.index[3:-8]:
-            x[col] = 2 - x[col]
-    return x
-
-
-# Functions for model probability calculations
-def p_blue(m1_sum, m2_sum):
-    return np.exp(m1_sum)/(1+np.exp(m1_sum)+np.exp(m2_sum))
-
-
-def p_other(m1_sum, m2_sum):
-    return np.exp(m2_sum)/(1+np.exp(m1_sum)+np.exp(m2_sum))
-
-
-def get_color_pred(x):
-    if x["blue"] >= x["brown"] and x["blue"] >= x["other"]:
-        return "blue"
-    elif x["brown"] >= x["other"]:
-        return "brown"
-    else:
-        return "other"
-    
 
 def main(args):
     
@@ -54,23 +30,11 @@ def main(args):
     # Read in already merged table
     fixed_gt = pd.read_csv(args.genotype_file, sep='\t')
     
-    # Perform predictions for each individual based on genotype and parameters
-    a1 = 3.94
-    a2 = 0.65
-
-    predictions = {}
-    for col in fixed_gt.columns[3:-8]:
-            pred1 = np.nansum(fixed_gt[col]*fixed_gt["b1"]) + a1
-            pred2 = np.nansum(fixed_gt[col]*fixed_gt["b2"]) + a2
-            blue = p_blue(pred1, pred2)
-            other = p_other(pred1, pred2)
-            brown = 1 - blue - other
-            predictions[col] = [pred1, pred2, blue, other, brown]
-
-    predict = pd.DataFrame.from_dict(predictions, orient='index', columns=["pred1", "pred2", "blue", "other", "brown"])
+    # Perform predictions for all individuals at once based on genotype and parameters (missing SNPs count as 0)
+    individuals = fixed_gt.columns[3:-8]
+    predict = irisPlex.predict(fixed_gt[individuals], fixed_gt, individuals, flip=False)
     
     # Get the predicted phenotype
-    predict["predicted_eye_color"] = predict.apply(get_color_pred, 1)
     predict = predict.reset_index()
     print(predict.head())
     predict['user_id'] = predict['index'].astype(int)
@@ -0,0 +1,95 @@
+'''
+@author = james
+quantize.py shrinks a trained DiddyKongRacing for CPU-only scoring with post-training dynamic int8 quantization:
+    1) the model is fused with FusionDance (BatchNorm folded into the Linears, heads into one Linear), then every nn.Linear
+       gets int8 weights and activations are quantized on the fly per batch
+    2) the float32 and int8 models are both scored on the validation set with Meowth, accuracy and ROC AUCs come from
+       the same code TeamROCket plots with (PrepareForTroubleAndMakeItDouble)
+    3) if accuracy, the micro-average AUC or any per class AUC drops by more than --tolerance nothing is saved and it
+       exits with status 1 (so one class collapsing can't hide in the micro-average)
+    4) otherwise the int8 model is scripted to TorchScript (FusionDance's PotaraEarrings, so DosageKong64's pruned/folded branches
+       are kept rather than traced away) and saved, with the size, latency and throughput changes printed
+Example to run:
+python quantize.py -m ../models/best_models/BestModel_Cinco_De_Mayo_1000_100_epochs_5_hiddenLayers.pt -g ../Sheen/val_set.json -p ../Sheen/val_labels.csv -o ../models/Cinco_De_Mayo_int8.pt
+shrunkenKong = torch.jit.load("../models/Cinco_De_Mayo_int8.pt")
+'''
+
+import argparse
+import io
+import math
+import sys
+import torch
+import torch.nn as nn
+from DontGetSNPpyWithMe import KongFromCheckpoint, DosageKong64
+from FusionDance import FusionDance, PotaraEarrings, HowFastIsHe
+from PrepareForTrouble import Meowth, PrepareForTroubleAndMakeItDouble, Wobbuffet
+from data_loader import get_loader
+
+
+#Fuse the model into a Gotenks and dynamically quantize every Linear of it to int8 (the original is left alone)
+def Quantize(kong):
+    return torch.ao.quantization.quantize_dynamic(FusionDance(kong), {nn.Linear}, dtype=torch.qint8)
+
+
+#Bytes the model's state_dict takes up when saved
+def HowBigIsHe(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+#Accuracy and ROC AUCs (per class and micro-average) of a model on a loader
+def ScoreCard(model, loader):
+    scores, labels = Meowth(model, loader, "cpu")
+    _, _, roc_auc = PrepareForTroubleAndMakeItDouble(scores, labels)
+    return Wobbuffet(scores, labels), roc_auc
+
+
+def main(args):
+    kong = KongFromCheckpoint(args.model, device = "cpu")
+    dosage = isinstance(kong.hotTopVolcano[0], DosageKong64)
+    shrunkenKong = Quantize(kong)
+
+    val_loader = get_loader(genotype_file=args.genotype_file, phenotype_file=args.phenotype_file, batch_size=args.batch_size,
+                            shuffle=False, num_workers=0, pickle=not args.genotype_file.endswith(".json"),
+                            memmap=args.genotype_file.endswith(".json"), dosage=dosage)
+
+    kongAcc, kongAuc = ScoreCard(kong, val_loader)
+    shrunkenAcc, shrunkenAuc = ScoreCard(shrunkenKong, val_loader)
+    print("Validation accuracy: float32 {:.4f}, int8 {:.4f}".format(kongAcc, shrunkenAcc))
+    for key in kongAuc:
+        print("Validation AUC {}: float32 {:.4f}, int8 {:.4f}".format(key, kongAuc[key], shrunkenAuc[key]))
+
+    #Guardrail: refuse to write the artifact if the int8 model got worse by more than the tolerance
+    accDrop = kongAcc - shrunkenAcc
+    aucDrops = {key: kongAuc[key] - shrunkenAuc[key] for key in kongAuc if not math.isnan(kongAuc[key])}  #classes with no samples have nan AUCs
+    worst = max(aucDrops, key=aucDrops.get) if aucDrops else None
+    if accDrop > args.tolerance or (worst is not None and aucDrops[worst] > args.tolerance):
+        if worst is None:
+            print("Accuracy dropped by {:.4f} (no AUC could be computed), more than the tolerance of {}. Not saving {}".format(accDrop, args.tolerance, args.output))
+        else:
+            print("Accuracy dropped by {:.4f} and AUC {} by {:.4f}, more than the tolerance of {}. Not saving {}".format(accDrop, worst, aucDrops[worst], args.tolerance, args.output))
+        sys.exit(1)
+
+    #Script (not trace) so the artifact loads with torch.jit.load and no model code and keeps every branch of forward
+    batch = next(iter(val_loader))[0]
+    torch.jit.save(PotaraEarrings(shrunkenKong), args.output)
+    print("Saved int8 model to {}".format(args.output))
+
+    kongSize, shrunkenSize = HowBigIsHe(kong), HowBigIsHe(shrunkenKong)
+    kongTime, shrunkenTime = HowFastIsHe(kong, batch), HowFastIsHe(shrunkenKong, batch)
+    print("Size: float32 {:.2f} MB, int8 {:.2f} MB ({:.1f}x smaller)".format(kongSize / 1e6, shrunkenSize / 1e6, kongSize / shrunkenSize))
+    print("Latency per batch of {}: float32 {:.3f} ms, int8 {:.3f} ms ({:.1f}x)".format(len(batch), kongTime * 1000, shrunkenTime * 1000, kongTime / shrunkenTime))
+    print("Throughput: float32 {:.0f} samples/s, int8 {:.0f} samples/s".format(len(batch) / kongTime, len(batch) / shrunkenTime))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--model', type=str, required=True, help='filepath to a saved DiddyKongRacing state_dict')
+    parser.add_argument('-g', '--genotype_file', type=str, required=True, help='validation genotypes, a genotype store .json sidecar or a pickle')
+    parser.add_argument('-p', '--phenotype_file', type=str, required=True, help='validation labels csv')
+    parser.add_argument('-o', '--output', type=str, required=True, help='filepath to save the scripted int8 model to')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.01, help='largest allowed drop in accuracy or in any (per class or micro-average) AUC, default is 0.01')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='batch size for validation and timing')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,100 @@
+'''
+@author = james
+search.py runs a hyper parameter search (config/hyperparameter_search/searchIt*.csv) in parallel across CPU cores:
+    1) trials (rows of the search csv) run in a pool of --jobs processes, each torch op limited to --threads threads
+       so jobs * threads matches the cores instead of every trial fighting over all of them
+    2) every worker memory-maps the same train/val genotype stores (.json sidecars), so the OS keeps one copy in memory
+    3) each finished trial's row is appended to the results csv and its Train/Val statistics written right away
+    4) rerunning the same command resumes an interrupted sweep, trials already in the results csv are skipped
+Trials are trained with train.py's Train and the metrics reported are from the epoch EarlyStop kept the model from.
+Example to run:
+python search.py -s ../config/hyperparameter_search/searchIt_1000.csv -o ../results/search/LookAtThisWizardry_1000.csv -j 8 --threads 2
+'''
+
+import os
+import time
+import argparse
+import multiprocessing
+import traceback
+import pandas as pd
+import torch
+from train import LoadTheData, BuildTheKong, Train, AddTrainingArgs, ParseWithConfig
+
+
+RESULT_COLUMNS = ["Train_Acc", "Val_Acc", "Train_Loss", "Val_Loss", "Early_Stopping_Epoch"]
+
+#Per worker process state, set once by WakeUpTheKongs so every trial in the worker reuses the same loaders
+worker = {}
+
+
+#Pool initializer: thread budget and the memory-mapped loaders for this worker
+def WakeUpTheKongs(args, threads):
+    torch.set_num_threads(threads)
+    device = torch.device(args.device if args.device else 'cpu')
+    worker["args"], worker["device"] = args, device
+    worker["loaders"] = LoadTheData(args, device, 0)  #pool workers can't fork dataloader workers of their own
+
+
+#Train one row of the search csv, write its statistics and return its results (or the error, so the sweep keeps going)
+def RunTrial(trial):
+    i, name, layerWidths = trial
+    args, device = worker["args"], worker["device"]
+    train_loader, val_loader = worker["loaders"]
+    start = time.perf_counter()
+    try:
+        torch.manual_seed(args.seed)
+        model, optimizer, criterion = BuildTheKong(args, layerWidths, train_loader.dataset.genotypes.shape[1], device)
+        t_accs, t_losses, val_accs, val_losses, last_improved_epoch, _ = Train(model, optimizer, criterion, train_loader, val_loader, device,
+                                                                              args.epochs, args.patience, args.model_dir, name, args.train_baseline)
+    except Exception:
+        return i, name, None, traceback.format_exc()
+
+    #Same Loss,Acc files the notebook wrote
+    pd.DataFrame({"Loss": t_losses, "Acc": t_accs}).to_csv(os.path.join(args.log_dir, "Model{}_TrainStatistics.txt".format(name)), index=False)
+    pd.DataFrame({"Loss": val_losses, "Acc": val_accs}).to_csv(os.path.join(args.log_dir, "Model{}_ValStatistics.txt".format(name)), index=False)
+    if last_improved_epoch is None:  #e.g. NaN losses from a diverged learning rate
+        return i, name, None, "no epoch improved the validation loss"
+    results = {"Train_Acc": t_accs[last_improved_epoch], "Val_Acc": val_accs[last_improved_epoch], "Train_Loss": t_losses[last_improved_epoch],
+               "Val_Loss": val_losses[last_improved_epoch], "Early_Stopping_Epoch": len(val_losses) - 1}
+    return i, name, results, time.perf_counter() - start
+
+
+#Names of trials that already have results in the output csv
+def FinishedTrials(output):
+    if not os.path.exists(output):
+        return set()
+    done = pd.read_csv(output, index_col=0)
+    return set(done.loc[done["Val_Loss"].notna(), "Model"].astype(str))
+
+
+def main(args):
+    os.makedirs(args.model_dir, exist_ok = True)
+    os.makedirs(args.log_dir, exist_ok = True)
+    hyperParameterSearchFile = pd.read_csv(args.search_file)
+    done = FinishedTrials(args.output)
+    trials = [(i, str(row["Model"]), list(map(int, str(row["Layer_widths"]).split(";")))[:int(row["Num_hidden_layers"])])
+              for i, row in hyperParameterSearchFile.iterrows() if str(row["Model"]) not in done]
+    print("{} trials to run, {} already finished, {} jobs x {} threads".format(len(trials), len(done), args.jobs, args.threads))
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.jobs, initializer = WakeUpTheKongs, initargs = (args, args.threads)) as pool:
+        for i, name, results, info in pool.imap_unordered(RunTrial, trials):
+            if results == None:
+                print("Model {} failed, it will be rerun next time:\n{}".format(name, info))
+                continue
+            row = hyperParameterSearchFile.loc[[i]].copy()
+            for column in RESULT_COLUMNS:
+                row[column] = results[column]
+            row.to_csv(args.output, mode='a', header=not os.path.exists(args.output))
+            print("Finished model {} in {:.1f}s (val acc {:.4f})".format(name, info, results["Val_Acc"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--search_file', type=str, required=True, help='search csv with Model, Num_hidden_layers and Layer_widths (; separated) columns')
+    parser.add_argument('-o', '--output', type=str, required=True, help='results csv, appended to as trials finish and read to resume')
+    parser.add_argument('-j', '--jobs', type=int, default=max(1, os.cpu_count() // 2), help='trials to run at once')
+    parser.add_argument('--threads', type=int, default=2, help='torch threads per trial')
+    AddTrainingArgs(parser)
+    args = ParseWithConfig(parser)
+    main(args)
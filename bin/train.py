@@ -0,0 +1,230 @@
+'''
+@author = james
+train.py is the Train/Validate/AccuracyCalc loop from Training.ipynb with everything it used to pull from notebook globals
+(optimizer, criterion, loaders, patience, ...) passed in explicitly, so a model can be trained and profiled headless:
+    1) accuracy and loss are summed on the device and only synced once per epoch (no .item() every batch)
+    2) batches come from pinned memory and go to the GPU with non_blocking=True so the copy overlaps compute
+    3) every epoch reports time spent waiting on data, in forward, backward and the optimizer step, and validating
+       (pass --profile to synchronize the GPU between phases so these are exact, at the cost of the overlap)
+    4) the untrained pass over the training set is skipped unless --train_baseline (train epoch 0 is then nan)
+The model EarlyStop kept (from the last epoch the val loss went down) is saved to --model_dir like the notebook did and the per epoch metrics and timings to --log_dir.
+Example to run (any flag can also come from a json config, flags given on the command line win):
+python train.py -n Cinco_De_Mayo -w 1000 100 -e 100 --patience 4
+python train.py -c ../configs/Cinco_De_Mayo.json
+'''
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from DontGetSNPpyWithMe import DiddyKongRacing
+from EarlyStop import EarlyStop
+from data_loader import get_loader, read_store
+
+
+#Keeps a running total of seconds per phase, syncing the GPU at each lap if asked so the time lands in the right phase
+class Stopwatch:
+    def __init__(self, device, sync = False):
+        self.sync = sync and device.type == "cuda"
+        self.totals = {}
+        self.last = time.perf_counter()
+
+    def Lap(self, phase):
+        if self.sync:
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0.0) + now - self.last
+        self.last = now
+
+
+#Number of argmax predictions matching the labels, left on the device (softmax doesn't change the argmax)
+def AccuracyCalc(raw, labels):
+    return raw.argmax(dim = 1).eq(labels).sum()
+
+
+#inputs: 1) model 2) dataloader 3) loss function 4) device
+#outputs: 1) accuracy 2) loss (summed batch losses / number of samples like the notebook)
+def Validate(model, data, lossFn, device):
+    model.eval() #shut off batch norm and dropout
+    totalSamples = 0
+    totalLoss = torch.zeros((), device = device)
+    numerator = torch.zeros((), dtype = torch.long, device = device)
+    with torch.inference_mode():
+        for i, (snpBatch, phenotypeBatch) in enumerate(data):
+            totalSamples += len(phenotypeBatch)
+            snpBatch = snpBatch.to(device, non_blocking = True)
+            phenotypeBatch = phenotypeBatch.to(device, non_blocking = True).squeeze(1)
+            output = model(snpBatch)
+            totalLoss += lossFn(output[0], phenotypeBatch)
+            numerator += AccuracyCalc(output[0], phenotypeBatch)
+    return numerator.item() / totalSamples, totalLoss.item() / totalSamples
+
+
+#One pass over the training data, returns accuracy, loss and the seconds per phase
+def TrainOneEpoch(model, optimizer, data, lossFn, device, profile = False):
+    model.train() # turn on batch norm and dropout
+    totalSamples = 0
+    totalLoss = torch.zeros((), device = device)
+    numerator = torch.zeros((), dtype = torch.long, device = device)
+    watch = Stopwatch(device, profile)
+    for i, (snpBatch, phenotypeBatch) in enumerate(data):
+        totalSamples += len(phenotypeBatch)
+        snpBatch = snpBatch.to(device, non_blocking = True)
+        phenotypeBatch = phenotypeBatch.to(device, non_blocking = True).squeeze(1)
+        watch.Lap("data")
+
+        optimizer.zero_grad(set_to_none = True)
+        output = model(snpBatch)
+        loss = lossFn(output[0], phenotypeBatch) #output is a list to handle multi-task learning so here the prediction is output[0]
+        watch.Lap("forward")
+
+        loss.backward()
+        watch.Lap("backward")
+
+        optimizer.step()
+        with torch.no_grad():
+            totalLoss += loss.detach()
+            numerator += AccuracyCalc(output[0], phenotypeBatch)
+        watch.Lap("optimizer")
+    return numerator.item() / totalSamples, totalLoss.item() / totalSamples, watch.totals
+
+
+#Train with early stopping, save the model EarlyStop kept and return per epoch metrics (epoch 0 is the untrained model)
+#Outputs: 1) Training Accs 2) Training Losses 3) Validation Accs 4) Validation Losses 5) epoch of the saved model 6) timings per epoch
+def Train(model, optimizer, lossFn, trainData, valData, device, numEpochs, patience, modelDir, modName, trainBaseline = False, profile = False):
+    accuracies, losses = [float('nan')], [float('nan')]
+    if trainBaseline:
+        accuracies[0], losses[0] = Validate(model, trainData, lossFn, device)
+    valZeroAcc, valZeroLoss = Validate(model, valData, lossFn, device)
+    valAccs, valLosses = [valZeroAcc], [valZeroLoss]
+    timings = []
+
+    stop = EarlyStop(patience, mode = "state")
+    for epoch in range(numEpochs):
+        acc, loss, times = TrainOneEpoch(model, optimizer, trainData, lossFn, device, profile)
+        start = time.perf_counter()
+        valAcc, valLoss = Validate(model, valData, lossFn, device)
+        times["validate"] = time.perf_counter() - start
+        accuracies.append(acc)
+        losses.append(loss)
+        valAccs.append(valAcc)
+        valLosses.append(valLoss)
+        timings.append(times)
+        print("Epoch {}: train acc {:.4f} loss {:.4g}, val acc {:.4f} loss {:.4g} ({})".format(epoch + 1, acc, loss, valAcc, valLoss,
+              ", ".join("{} {:.2f}s".format(phase, seconds) for phase, seconds in times.items())))
+
+        areWeThereYet, _ = stop(valLoss, model)
+        if areWeThereYet:
+            print("Early stopping at epoch:" + str(epoch+1))
+            break
+
+    numLayers = len(model.hotTopVolcano)
+    modelFile = os.path.join(modelDir, "BestModel_{}_{}_epochs_{}_hiddenLayers.pt".format(modName, len(valLosses) - 1, numLayers))
+    if stop.SaveTheBest(modelFile):
+        print("Saved the model from epoch {}, the last improvement in val loss ({:.4g}), to {}".format(stop.lastImprovedEpoch, stop.lastImprovedLoss, modelFile))
+    else:
+        print("No epoch improved the val loss, no model saved")
+    return accuracies, losses, valAccs, valLosses, stop.lastImprovedEpoch, timings
+
+
+#1/class size of every class in the training labels, the weights the notebook hard coded
+def ClassWeights(phenotypeFile, numClasses):
+    counts = np.bincount(pd.read_csv(phenotypeFile, index_col=0).iloc[:, 0].values, minlength = numClasses)
+    return 1 / np.maximum(counts, 1)
+
+
+#Train and val loaders over the genotype stores (memory-mapped if they are .json sidecars)
+def LoadTheData(args, device, numWorkers):
+    memmap = args.train_genotypes.endswith(".json")
+    loaderArgs = {'batch_size': args.batch_size, 'num_workers': numWorkers, 'pickle': not memmap, 'memmap': memmap,
+                  'dosage': args.dosage, 'pin_memory': device.type == "cuda"}
+    train_loader = get_loader(args.train_genotypes, args.train_labels, shuffle = True, **loaderArgs)
+    val_loader = get_loader(args.val_genotypes, args.val_labels, shuffle = False, **loaderArgs)
+    return train_loader, val_loader
+
+
+#Model, optimizer and loss for one set of hidden layer widths
+def BuildTheKong(args, layerWidths, numSNPs, device):
+    snpMeans, snpStds = None, None
+    if args.dosage:
+        stats = pd.read_csv(args.stats, sep='\t', index_col=0).loc[read_store(args.train_genotypes)[2]]
+        snpMeans, snpStds = stats["means"].values, stats["std"].values
+    model = DiddyKongRacing([args.batch_size, numSNPs], len(layerWidths), layerWidths, args.dropout, args.multitask_outputs,
+                            dosage = args.dosage, snpMeans = snpMeans, snpStds = snpStds).to(device)
+    optimizer = optim.Adam(model.parameters(), lr = args.learning_rate)
+    if args.unweighted:
+        criterion = nn.CrossEntropyLoss()
+    else:
+        weights = ClassWeights(args.train_labels, args.multitask_outputs[0])
+        criterion = nn.CrossEntropyLoss(weight = torch.tensor(weights, dtype = torch.float32, device = device))
+    return model, optimizer, criterion
+
+
+def main(args):
+    torch.manual_seed(args.seed)
+    device = torch.device(args.device if args.device else ('cuda' if torch.cuda.is_available() else 'cpu'))
+    print("What are we using? {}".format(device))
+
+    train_loader, val_loader = LoadTheData(args, device, args.num_workers)
+    numSNPs = train_loader.dataset.genotypes.shape[1]
+    model, optimizer, criterion = BuildTheKong(args, args.layer_widths, numSNPs, device)
+
+    os.makedirs(args.model_dir, exist_ok = True)
+    os.makedirs(args.log_dir, exist_ok = True)
+    t_accs, t_losses, val_accs, val_losses, last_improved_epoch, timings = Train(model, optimizer, criterion, train_loader, val_loader, device,
+                                                                                args.epochs, args.patience, args.model_dir, args.name, args.train_baseline, args.profile)
+
+    statistics = pd.DataFrame({"Train_Loss": t_losses, "Train_Acc": t_accs, "Val_Loss": val_losses, "Val_Acc": val_accs})
+    statistics = statistics.join(pd.DataFrame(timings, index = range(1, len(timings) + 1)).add_suffix("_seconds"))
+    statistics.index.name = "Epoch"
+    statistics.to_csv(os.path.join(args.log_dir, "Model{}_TrainStatistics.tsv".format(args.name)), sep='\t')
+    with open(os.path.join(args.log_dir, "Model{}_config.json".format(args.name)), 'w') as f:
+        json.dump(dict(vars(args), last_improved_epoch = last_improved_epoch), f, indent = 1)
+
+
+#Options shared with search.py: data, training settings and where things go
+def AddTrainingArgs(parser):
+    parser.add_argument('--train_genotypes', type=str, default='../Sheen/train_set.json', help='training genotype store .json sidecar (or pickle)')
+    parser.add_argument('--train_labels', type=str, default='../Sheen/train_labels.csv', help='training labels csv')
+    parser.add_argument('--val_genotypes', type=str, default='../Sheen/val_set.json', help='validation genotype store .json sidecar (or pickle)')
+    parser.add_argument('--val_labels', type=str, default='../Sheen/val_labels.csv', help='validation labels csv')
+    parser.add_argument('-d', '--dosage', action='store_true', help='genotypes are int8 dosages, z-score them in the first layer with --stats')
+    parser.add_argument('--stats', type=str, default='../Sheen/train_set_stats.tsv', help='per SNP training means and stds, only used with --dosage')
+    parser.add_argument('-m', '--multitask_outputs', type=int, nargs='+', default=[3], help='number of outputs of each task')
+    parser.add_argument('--dropout', type=float, default=0.5, help='dropout fraction')
+    parser.add_argument('-b', '--batch_size', type=int, default=32, help='batch size')
+    parser.add_argument('-lr', '--learning_rate', type=float, default=5e-3, help='Adam learning rate')
+    parser.add_argument('-e', '--epochs', type=int, default=100, help='maximum number of epochs')
+    parser.add_argument('-p', '--patience', type=int, default=4, help='early stopping patience')
+    parser.add_argument('--unweighted', action='store_true', help='plain cross entropy instead of weighting classes by 1/class size')
+    parser.add_argument('--train_baseline', action='store_true', help='also score the untrained model on the training set (an extra pass over it)')
+    parser.add_argument('--profile', action='store_true', help='synchronize the GPU between phases so the timings are exact')
+    parser.add_argument('--device', type=str, default=None, help='device to train on, default is cuda if available')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--model_dir', type=str, default='../models', help='dir to save the best model to')
+    parser.add_argument('-l', '--log_dir', type=str, default='../Statistics', help='dir to save per epoch statistics and the config to')
+
+
+#Parse args, a --config json (keys are the long option names) sets defaults that flags on the command line override
+def ParseWithConfig(parser):
+    parser.add_argument('-c', '--config', type=str, default=None, help='json file of defaults for any of the options (keys are the long option names)')
+    args, _ = parser.parse_known_args()
+    if args.config != None:
+        with open(args.config) as f:
+            parser.set_defaults(**json.load(f))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--name', type=str, default='LankyKong', help='model name used in the saved model and statistics filenames')
+    parser.add_argument('-w', '--layer_widths', type=int, nargs='+', default=[512, 512, 256, 128, 64], help='hidden layer widths (the number of hidden layers is how many are given)')
+    parser.add_argument('--num_workers', type=int, default=4, help='dataloader workers')
+    AddTrainingArgs(parser)
+    args = ParseWithConfig(parser)
+    main(args)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts import each other as top level modules, like they do when run from bin/ and bin/data_preprocessing/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bin"))
+sys.path.insert(0, os.path.join(ROOT, "bin", "data_preprocessing"))
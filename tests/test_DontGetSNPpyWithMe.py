@@ -0,0 +1,130 @@
+"""
+DosageKong64's on the fly z-scoring against z-scoring the dosages by hand, and its inference tricks (FoldTheScales, Prune,
+PruneTheJungle, ShrinkRay) against the plain layer, plus KongFromCheckpoint rebuilding saved models
+"""
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+from DontGetSNPpyWithMe import DiddyKongRacing, DosageKong64, KongFromCheckpoint
+
+
+NUM_SNPS = 100
+
+
+# Means and stds with an all missing SNP (nan) and a monomorphic one (std 0) in the mix
+def SnpStats():
+    rng = np.random.default_rng(0)
+    snpMeans, snpStds = rng.uniform(0, 2, NUM_SNPS), rng.uniform(0.2, 1, NUM_SNPS)
+    snpMeans[3], snpStds[3] = np.nan, np.nan
+    snpStds[5] = 0
+    return snpMeans, snpStds
+
+
+# An eval-mode DosageKong64 with non trivial BatchNorm statistics
+def MakeDosageKong():
+    torch.manual_seed(0)
+    donkey = DosageKong64(NUM_SNPS, 8, 0.5, *SnpStats())
+    with torch.no_grad():
+        donkey.goldBanana[0].running_mean.uniform_(-1, 1)
+        donkey.goldBanana[0].running_var.uniform_(0.5, 2)
+    return donkey.eval()
+
+
+def MakeBatch(size=50):
+    return torch.randint(-1, 3, (size, NUM_SNPS), dtype=torch.int8, generator=torch.Generator().manual_seed(1))
+
+
+def Run(donkey, batch):
+    with torch.inference_mode():
+        return donkey(batch)
+
+
+def test_z_scores_like_the_preprocessing():
+    donkey, batch = MakeDosageKong(), MakeBatch()
+    snpMeans, snpStds = SnpStats()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (batch.numpy() - snpMeans) / snpStds
+    z[(batch.numpy() < 0) | ~np.isfinite(z)] = 0  #missing calls, all missing and monomorphic SNPs are 0
+    with torch.inference_mode():
+        expected = donkey.goldBanana(donkey.firstLinear(torch.tensor(z, dtype=torch.float32)))
+    assert torch.allclose(Run(donkey, batch), expected, atol=1e-5)
+
+
+def test_fold_the_scales():
+    donkey, batch = MakeDosageKong(), MakeBatch()
+    expected = Run(donkey, batch)
+    donkey.FoldTheScales()
+    assert bool(donkey.isFolded)
+    assert torch.allclose(Run(donkey, batch), expected, atol=1e-4)
+    assert torch.equal(Run(donkey.FoldTheScales(), batch), Run(donkey, batch))  #folding twice does nothing
+
+
+@pytest.mark.parametrize("folded", [False, True])
+def test_prune_is_zeroing_the_dropped_columns(folded):
+    donkey, batch = MakeDosageKong(), MakeBatch()
+    if folded:
+        donkey.FoldTheScales()
+    keep = np.sort(np.random.default_rng(2).choice(NUM_SNPS, size=60, replace=False))
+    zeroed = MakeDosageKong()
+    if folded:
+        zeroed.FoldTheScales()
+    dropped = np.setdiff1d(np.arange(NUM_SNPS), keep)
+    with torch.no_grad():
+        zeroed.firstLinear.weight[:, dropped] = 0
+    expected = Run(zeroed, batch)
+
+    donkey.Prune(keep)
+    assert donkey.firstLinear.in_features == 60
+    assert torch.allclose(Run(donkey, batch), expected, atol=1e-5)
+
+    # Pruning again takes SNP indices into the original input, not the current columns
+    donkey.Prune(keep[::2])
+    with torch.no_grad():
+        zeroed.firstLinear.weight[:, keep[1::2]] = 0
+    assert donkey.firstLinear.in_features == 30
+    assert torch.allclose(Run(donkey, batch), Run(zeroed, batch), atol=1e-5)
+
+
+def test_prune_the_jungle_keeps_the_heaviest_blocks():
+    donkey = MakeDosageKong()
+    with torch.no_grad():
+        donkey.firstLinear.weight[:, 20:40] *= 10
+        donkey.firstLinear.weight[:, 80:100] *= 20
+    donkey.PruneTheJungle(0.4, blockSize=20)
+    assert donkey.keep.tolist() == list(range(20, 40)) + list(range(80, 100))
+
+    # A last block shorter than blockSize
+    donkey = MakeDosageKong()
+    with torch.no_grad():
+        donkey.firstLinear.weight[:, 96:] *= 100
+    donkey.PruneTheJungle(0.01, blockSize=32)
+    assert donkey.keep.tolist() == [96, 97, 98, 99]
+
+
+def test_shrink_ray_stays_close():
+    donkey, batch = MakeDosageKong(), MakeBatch()
+    expected = Run(donkey, batch)
+    shrunk = Run(donkey.FoldTheScales().ShrinkRay(), batch)
+    assert (shrunk - expected).abs().max() < 0.1 * expected.abs().max()  #int8 weights, so only close
+
+
+@pytest.mark.parametrize("dosage", [False, True])
+def test_kong_from_checkpoint(tmp_path, dosage):
+    torch.manual_seed(0)
+    snpMeans, snpStds = SnpStats() if dosage else (None, None)
+    kong = DiddyKongRacing([2, NUM_SNPS], 3, [16, 8, 4], 0.5, [3, 2], dosage=dosage, snpMeans=snpMeans, snpStds=snpStds).eval()
+    if dosage:
+        kong.hotTopVolcano[0].FoldTheScales().PruneTheJungle(0.5, blockSize=10)
+        batch = MakeBatch()
+    else:
+        batch = torch.randn(50, NUM_SNPS)
+    torch.save(kong.state_dict(), str(tmp_path / "kong.pt"))
+
+    rebuilt = KongFromCheckpoint(str(tmp_path / "kong.pt"))
+    assert rebuilt.getWide == kong.getWide
+    assert isinstance(rebuilt.hotTopVolcano[0], DosageKong64) == dosage
+    with torch.inference_mode():
+        for expected, output in zip(kong(batch), rebuilt(batch)):
+            assert torch.equal(output, expected)
@@ -0,0 +1,91 @@
+"""
+FusionDance.py's fused Gotenks (BatchNorms folded, heads concatenated, scripted and frozen) against the DiddyKongRacing
+it was made from in eval mode, for float z-score models and int8 dosage models (pruned or not)
+"""
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+from DontGetSNPpyWithMe import DiddyKongRacing, DosageKong64
+from FusionDance import FoldTheBanana, FusionDance, ShrinkGotenks, PotaraEarrings
+
+
+NUM_SNPS = 200
+
+
+# Random BatchNorm statistics and affine parameters so folding them is not a no-op
+def ScrambleTheBananas(kong, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for module in kong.modules():
+            if isinstance(module, nn.BatchNorm1d):
+                size = module.num_features
+                module.running_mean.copy_(torch.randn(size, generator=generator))
+                module.running_var.copy_(torch.rand(size, generator=generator) + 0.5)
+                module.weight.copy_(torch.randn(size, generator=generator))
+                module.bias.copy_(torch.randn(size, generator=generator))
+    return kong.eval()
+
+
+def MakeKong(dosage):
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    snpMeans, snpStds = None, None
+    if dosage:
+        snpMeans, snpStds = rng.uniform(0, 2, NUM_SNPS), rng.uniform(0.2, 1, NUM_SNPS)
+        snpMeans[3], snpStds[3] = np.nan, np.nan  #all missing SNP
+        snpStds[5] = 0  #monomorphic SNP
+    kong = DiddyKongRacing([2, NUM_SNPS], 2, [32, 16], 0.5, [3, 2], dosage=dosage, snpMeans=snpMeans, snpStds=snpStds)
+    return ScrambleTheBananas(kong)
+
+
+def MakeBatch(dosage, size=64):
+    generator = torch.Generator().manual_seed(1)
+    if dosage:
+        return torch.randint(-1, 3, (size, NUM_SNPS), dtype=torch.int8, generator=generator)
+    return torch.randn(size, NUM_SNPS, generator=generator)
+
+
+def AssertSameOutputs(expected, outputs, atol=1e-4):
+    assert len(outputs) == len(expected)
+    for e, o in zip(expected, outputs):
+        assert o.shape == e.shape
+        assert torch.allclose(o, e, atol=atol, rtol=1e-4)
+
+
+def test_fold_the_banana():
+    torch.manual_seed(0)
+    linear, batchNorm = nn.Linear(10, 6), nn.BatchNorm1d(6)
+    ScrambleTheBananas(batchNorm)
+    x = torch.randn(20, 10)
+    with torch.no_grad():
+        assert torch.allclose(FoldTheBanana(linear, batchNorm)(x), batchNorm(linear(x)), atol=1e-5)
+
+
+@pytest.mark.parametrize("dosage", [False, True])
+def test_fusion_dance_matches_kong(dosage):
+    kong, batch = MakeKong(dosage), MakeBatch(dosage)
+    with torch.inference_mode():
+        expected = kong(batch)
+        gotenks = FusionDance(kong)
+        AssertSameOutputs(expected, gotenks(batch))
+        AssertSameOutputs(expected, PotaraEarrings(gotenks)(batch))
+        AssertSameOutputs(expected, kong(batch), atol=0)  #the original model is left alone
+
+
+def test_fusion_dance_pruned_dosage():
+    kong, batch = MakeKong(True), MakeBatch(True)
+    kong.hotTopVolcano[0].PruneTheJungle(0.5, blockSize=16)
+    with torch.inference_mode():
+        AssertSameOutputs(kong(batch), PotaraEarrings(FusionDance(kong))(batch))
+
+
+@pytest.mark.parametrize("dosage", [False, True])
+def test_shrink_gotenks_stays_close(dosage):
+    kong, batch = MakeKong(dosage), MakeBatch(dosage)
+    with torch.inference_mode():
+        expected = kong(batch)
+        shrunk = PotaraEarrings(ShrinkGotenks(FusionDance(kong)))(batch)
+    for e, o in zip(expected, shrunk):  #int8 weights, so only close
+        assert (o - e).abs().max() < 0.1 * e.abs().max()
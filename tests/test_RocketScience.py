@@ -0,0 +1,53 @@
+"""
+RocketScience.py's midrank AUCs and cumulative sum ROC curves against sklearn.metrics, scores rounded so there are ties
+"""
+
+import numpy as np
+import pytest
+from sklearn.metrics import roc_auc_score, roc_curve
+from sklearn.preprocessing import label_binarize
+from RocketScience import Binarize, MidrankAUC, RocCurve, LookingForTrouble
+
+
+@pytest.fixture
+def scores():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 3, size=500)
+    scores = np.round(rng.normal(size=(4, 500, 3)) + 0.5 * Binarize(labels), 1)  #4 models, lots of tied scores
+    return scores, labels
+
+
+def test_binarize():
+    labels = np.array([2, 0, 1, 1])
+    assert (Binarize(labels) == label_binarize(labels, classes=[0, 1, 2])).all()
+
+
+def test_midrank_auc(scores):
+    scores, labels = scores
+    y = Binarize(labels)
+    for model in scores:
+        for i in range(3):
+            assert MidrankAUC(model[:, i], y[:, i]) == pytest.approx(roc_auc_score(y[:, i], model[:, i]))
+    assert MidrankAUC([0.5, 0.5, 0.5, 0.5], [True, False, True, False]) == pytest.approx(0.5)
+    assert np.isnan(MidrankAUC([0.1, 0.2], [False, False]))
+
+
+def test_looking_for_trouble(scores):
+    scores, labels = scores
+    metrics = LookingForTrouble(scores, labels)
+    y = label_binarize(labels, classes=[0, 1, 2])
+    for model, row in zip(scores, metrics.itertuples(index=False)):
+        assert list(row[:3]) == pytest.approx([roc_auc_score(y[:, i], model[:, i]) for i in range(3)])
+        assert row[3] == pytest.approx(roc_auc_score(y, model, average="micro"))
+        assert row[4] == pytest.approx(roc_auc_score(y, model, average="macro"))
+
+
+def test_roc_curve(scores):
+    scores, labels = scores
+    y = Binarize(labels)
+    for model in scores:
+        for i in range(3):
+            fpr, tpr = RocCurve(model[:, i], y[:, i])
+            expected_fpr, expected_tpr, _ = roc_curve(y[:, i], model[:, i], drop_intermediate=False)
+            assert fpr == pytest.approx(expected_fpr)
+            assert tpr == pytest.approx(expected_tpr)
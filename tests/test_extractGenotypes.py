@@ -0,0 +1,82 @@
+"""
+extractGenotypes.py --cache_dir has to write the same openSNP_initial_genotypes.tsv as a run without the cache,
+on the first run and after raw files are added, changed and only touched
+"""
+
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin", "data_preprocessing", "extractGenotypes.py")
+RSIDS = ["rs{}".format(i) for i in range(3000, 3060)] + ["i700{}".format(i) for i in range(5)]
+CALLS = ["AA", "AG", "GG", "CT", "--"]
+
+
+# A 23andMe or AncestryDNA raw file over a random subset of the rsids (with a duplicated one)
+def write_raw_file(genotypes_dir, user, kind, rng):
+    rsids = sorted(rng.choice(RSIDS, size=45, replace=False)) + [RSIDS[0]]
+    calls = rng.choice(CALLS, size=len(rsids))
+    filename = os.path.join(genotypes_dir, "user{}_file{}_yearofbirth_1990_sex_XY.{}.txt".format(user, user, kind))
+    with open(filename, 'w') as f:
+        if kind == "23andme":
+            f.write("# rsid\tchromosome\tposition\tgenotype\n")
+            f.writelines("{}\t1\t{}\t{}\n".format(rsid, 1000 + RSIDS.index(rsid), call) for rsid, call in zip(rsids, calls))
+        else:
+            f.write("rsid\tchromosome\tposition\tallele1\tallele2\n")
+            f.writelines("{}\t1\t{}\t{}\t{}\n".format(rsid, 1000 + RSIDS.index(rsid), call[0], call[1]) for rsid, call in zip(rsids, calls))
+    return filename
+
+
+# Run the script into its own dir, returns the genotype table and the log
+def extract(tmp_path, name, cache_dir=None, jobs=1):
+    out = tmp_path / name
+    out.mkdir()
+    command = [sys.executable, SCRIPT, "-i", str(tmp_path / "ids.txt"), "-g", str(tmp_path / "genotypes"),
+               "-o", str(out), "-l", str(out), "-j", str(jobs)]
+    if cache_dir != None:
+        command += ["-c", str(cache_dir)]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (out / "openSNP_initial_genotypes.tsv").read_bytes(), (out / "extractGenotypes.log").read_text()
+
+
+@pytest.fixture
+def genotypes(tmp_path):
+    rng = np.random.default_rng(0)
+    genotypes_dir = tmp_path / "genotypes"
+    genotypes_dir.mkdir()
+    users = list(range(6, 16))
+    for user in users:
+        write_raw_file(str(genotypes_dir), user, "23andme" if user % 3 else "ancestry", rng)
+    (genotypes_dir / "user16_file16_yearofbirth_1990_sex_XY.23andme.txt").write_text("not\ta\nraw\tfile\tat all\n")
+    (genotypes_dir / "user17_file17_yearofbirth_1990_sex_XY.ftdna-illumina.txt").write_text("RSID,CHROMOSOME\n")
+    (tmp_path / "ids.txt").write_text("".join("{}\n".format(user) for user in users + [16, 17]))
+    return rng
+
+
+def test_cache_matches_uncached_output(tmp_path, genotypes):
+    rng = genotypes
+    cache_dir = tmp_path / "cache"
+    uncached, _ = extract(tmp_path, "uncached")
+    cold, log = extract(tmp_path, "cold", cache_dir)
+    assert cold == uncached
+    assert "Files parsed: 12, read from the cache in {}: 0".format(cache_dir) in log
+    warm, log = extract(tmp_path, "warm", cache_dir, jobs=2)
+    assert warm == uncached
+    assert "Files parsed: 0" in log
+
+    # Add a user, change one file and only touch another (new mtime, same contents)
+    genotypes_dir = str(tmp_path / "genotypes")
+    write_raw_file(genotypes_dir, 18, "ancestry", rng)
+    with open(tmp_path / "ids.txt", 'a') as f:
+        f.write("18\n")
+    write_raw_file(genotypes_dir, 9, "ancestry", rng)
+    touched = os.path.join(genotypes_dir, "user10_file10_yearofbirth_1990_sex_XY.23andme.txt")
+    os.utime(touched, ns=(os.stat(touched).st_atime_ns, os.stat(touched).st_mtime_ns + 10 ** 9))
+
+    uncached, _ = extract(tmp_path, "uncached_delta")
+    delta, log = extract(tmp_path, "delta", cache_dir)
+    assert delta == uncached
+    assert "Files parsed: 2, read from the cache in {}: 11".format(cache_dir) in log
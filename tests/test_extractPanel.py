@@ -0,0 +1,138 @@
+"""
+extractPanel.py's tabix/BGZF reading against a brute force scan of a tiny vcf
+The vcf is bgzipped and indexed here following the SAM/tabix specs, so bgzip/tabix are not needed
+"""
+
+import gzip
+import struct
+import zlib
+import numpy as np
+import pytest
+from extractPanel import reg2bins, read_tabix_index, fetch, extract_panel
+
+
+SAMPLES = ["HG00096", "HG00097", "NA12249"]
+CALLS = ["0|0", "0|1", "1|1"]
+
+
+# Smallest bin holding the 0-based half-open [beg, end), reg2bin from the SAM spec
+def reg2bin(beg, end):
+    end -= 1
+    for shift, first in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+        if beg >> shift == end >> shift:
+            return first + (beg >> shift)
+    return 0
+
+
+# One BGZF block: a gzip member whose BC extra field holds the block size - 1
+def bgzf_block(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    header = struct.pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(deflated) + 25)
+    return header + deflated + struct.pack('<2I', zlib.crc32(data), len(data))
+
+
+# Write vcf lines (bytes) as BGZF blocks of a few records each plus the .tbi index of their virtual offsets
+def write_indexed_vcf(path, header, records, per_block=3):
+    blocks = [[header]] + [records[i:i + per_block] for i in range(0, len(records), per_block)]
+    chroms, offsets, data = {}, [], b""
+    for block in blocks:
+        within = 0
+        for line in block:
+            offsets.append(((len(data) << 16) | within, (len(data) << 16) | (within + len(line))))
+            within += len(line)
+        data += bgzf_block(b"".join(block))
+    with open(path, 'wb') as f:
+        f.write(data + bgzf_block(b""))
+
+    for line, (start, end) in zip(records, offsets[1:]):
+        chrom, pos, _, ref = line.split(b"\t", 4)[:4]
+        beg = int(pos) - 1
+        bins, intervals = chroms.setdefault(chrom, ({}, {}))
+        bins.setdefault(reg2bin(beg, beg + len(ref)), []).append((start, end))
+        for window in range(beg >> 14, ((beg + len(ref) - 1) >> 14) + 1):
+            intervals.setdefault(window, start)
+
+    names = b"".join(chrom + b"\0" for chrom in chroms)
+    index = b"TBI\x01" + struct.pack('<8i', len(chroms), 2, 1, 2, 0, ord("#"), 0, len(names)) + names
+    for bins, intervals in chroms.values():
+        index += struct.pack('<i', len(bins))
+        for bin_id, chunks in sorted(bins.items()):
+            index += struct.pack('<Ii', bin_id, len(chunks)) + b"".join(struct.pack('<2Q', *chunk) for chunk in chunks)
+        linear, last = [], 0
+        for window in range(max(intervals) + 1):
+            last = intervals.get(window, last)
+            linear.append(last)
+        index += struct.pack('<i', len(linear)) + struct.pack('<{}Q'.format(len(linear)), *linear)
+    with gzip.open(path + ".tbi", 'wb') as f:
+        f.write(index)
+
+
+@pytest.fixture
+def vcf(tmp_path):
+    rng = np.random.default_rng(0)
+    header = ("##fileformat=VCFv4.1\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + "\t".join(SAMPLES) + "\n").encode()
+    positions = {"15": np.sort(rng.choice(np.arange(1, 3 * 10 ** 6), size=40, replace=False)),
+                 "16": np.sort(rng.choice(np.arange(1, 2 * 10 ** 5), size=10, replace=False))}
+    records = []
+    for chrom, chrom_positions in positions.items():
+        for i, pos in enumerate(chrom_positions):
+            calls = "\t".join(CALLS[(i + j) % 3] for j in range(len(SAMPLES)))
+            records.append("{}\t{}\trs{}{}\tA\tG\t100\tPASS\t.\tGT\t{}\n".format(chrom, pos, chrom, i, calls).encode())
+    path = str(tmp_path / "ALL.chr15.vcf.gz")
+    write_indexed_vcf(path, header, records)
+    return path, records
+
+
+def test_reg2bins_holds_every_overlapping_record_bin():
+    rng = np.random.default_rng(1)
+    assert reg2bins(0, 1) == [0, 1, 9, 73, 585, 4681]
+    for _ in range(2000):
+        beg = int(rng.integers(0, 10 ** 8))
+        end = beg + int(rng.integers(1, 10 ** 6))
+        query_beg = int(rng.integers(max(0, beg - 10 ** 6), end))
+        query_end = query_beg + int(rng.integers(1, 10 ** 6))
+        if query_beg < end and beg < query_end:
+            assert reg2bin(beg, end) in reg2bins(query_beg, query_end)
+
+
+def test_read_tabix_index(vcf):
+    path, records = vcf
+    index = read_tabix_index(path + ".tbi")
+    assert list(index) == ["15", "16"]
+    assert sum(len(chunks) for chunks in index["15"][0].values()) == 40
+
+
+def test_fetch_matches_a_scan(vcf):
+    path, records = vcf
+    index = read_tabix_index(path + ".tbi")
+    rng = np.random.default_rng(2)
+    regions = [("15", 1, 3 * 10 ** 6), ("16", 1, 2 * 10 ** 5), ("15", 1, 1), ("22", 1, 100)]
+    for _ in range(100):
+        beg = int(rng.integers(1, 3 * 10 ** 6))
+        regions.append((str(rng.choice(["15", "16"])), beg, beg + int(rng.integers(0, 2 * 10 ** 5))))
+    for line in records[::7]:
+        chrom, pos = line.split(b"\t")[:2]
+        regions.append((chrom.decode(), int(pos), int(pos)))
+
+    for chrom, beg, end in regions:
+        expected = [line for line in records
+                    if line.split(b"\t")[0].decode() == chrom and beg <= int(line.split(b"\t")[1]) <= end]
+        assert list(fetch(path, index, chrom, beg, end)) == expected, (chrom, beg, end)
+
+
+def test_extract_panel(vcf, tmp_path):
+    path, records = vcf
+    wanted = [records[12], records[3], records[45]]
+    bed = tmp_path / "panel.bed"
+    lines = ["{}\t{}\t{}\t{}".format(chrom.decode(), int(pos) - 1, pos.decode(), rsid.decode())
+             for chrom, pos, rsid in (line.split(b"\t")[:3] for line in wanted)]
+    bed.write_text("\n".join(lines + ["15\t0\t10\trs_not_there"]) + "\n")
+
+    # Both chromosomes are in the one vcf, so every chromosome's vcf is that file
+    samples, info, dosages, missing = extract_panel(str(bed), str(tmp_path), "ALL.chr15.vcf.gz")
+    assert samples == SAMPLES
+    assert [row[2] for row in info] == [line.split(b"\t")[2].decode() for line in wanted]
+    assert missing == ["rs_not_there"]
+    expected = [[{"0|0": 0, "0|1": 1, "1|1": 2}[call.decode()] for call in line.rstrip(b"\n").split(b"\t")[9:]] for line in wanted]
+    assert dosages.tolist() == expected
@@ -0,0 +1,82 @@
+"""
+irisPlex.py's all-individuals-at-once scoring against IrisPlex worked by hand and against the old per individual
+loop from predictPhenotype.py, on the irisplex.bed in data/iris_plex
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from irisPlex import read_iris, logits, probabilities, predict, A1, A2
+
+
+IRIS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "iris_plex", "irisplex.bed")
+
+
+@pytest.fixture
+def iris():
+    return read_iris(IRIS_FILE)
+
+
+# The old loop: flip the genotypes of the three SNPs, then a dot product and the p_blue/p_other formulas per individual
+def old_predict(genotypes, iris):
+    flipped = genotypes.copy()
+    flip = iris["id"].isin(['rs12896399', 'rs12913832', 'rs16891982']).values
+    flipped[flip] = 2 - flipped[flip]
+    rows = []
+    for individual in flipped.T:
+        pred1 = np.dot(individual, iris["b1"]) + 3.94
+        pred2 = np.dot(individual, iris["b2"]) + 0.65
+        blue = np.exp(pred1) / (1 + np.exp(pred1) + np.exp(pred2))
+        other = np.exp(pred2) / (1 + np.exp(pred1) + np.exp(pred2))
+        rows.append([pred1, pred2, blue, other, 1 - blue - other])
+    return np.array(rows)
+
+
+def test_known_individuals(iris):
+    # No minor alleles: the flipped SNPs (rs12913832, rs12896399, rs16891982) count 2 each
+    # Two minor alleles everywhere: only rs1800407, rs1393350 and rs12203592 count
+    genotypes = np.array([[0, 2]] * 6, dtype=float)
+    predictions = predict(genotypes, iris, ["brown_eyed", "blue_eyed"])
+    assert predictions["pred1"].tolist() == pytest.approx([3.94 + 2 * (-4.81 - 0.58 - 1.30), 3.94 + 2 * (1.40 + 0.47 + 0.70)])
+    assert predictions["pred2"].tolist() == pytest.approx([0.65 + 2 * (-1.79 - 0.03 - 0.50), 0.65 + 2 * (0.87 + 0.27 + 0.73)])
+    assert predictions["predicted_eye_color"].tolist() == ["brown", "blue"]
+    blue = np.exp(9.08) / (1 + np.exp(9.08) + np.exp(4.39))
+    assert predictions.loc["blue_eyed", "blue"] == pytest.approx(blue)
+    assert predictions.loc["blue_eyed", ["blue", "other", "brown"]].sum() == pytest.approx(1)
+
+
+def test_matches_the_old_loop(iris):
+    rng = np.random.default_rng(0)
+    genotypes = rng.integers(0, 3, size=(len(iris), 200)).astype(float)
+    samples = ["HG{:05d}".format(i) for i in range(200)]
+    predictions = predict(genotypes, iris, samples)
+    expected = old_predict(genotypes, iris)
+    assert list(predictions.index) == samples
+    assert predictions[["pred1", "pred2", "blue", "other", "brown"]].values == pytest.approx(expected)
+    colors = pd.DataFrame(expected[:, 2:], columns=["blue", "other", "brown"]).idxmax(axis=1)
+    assert (predictions["predicted_eye_color"].values == colors.values).all()
+
+
+def test_missing_genotypes_count_zero(iris):
+    genotypes = np.array([[np.nan, 1], [1, 1], [2, 2], [np.nan, 0], [0, 0], [1, 1]])
+    pred = logits(genotypes, iris[["b1", "b2"]])
+    expected = logits(np.nan_to_num(genotypes), iris[["b1", "b2"]])
+    assert np.isfinite(pred).all()
+    assert pred == pytest.approx(expected)
+    assert logits(np.zeros((6, 1)), iris[["b1", "b2"]]).tolist() == [[A1, A2]]
+
+
+def test_probabilities_are_stable():
+    probs = probabilities(np.array([[1000.0, -1000.0], [0.0, 0.0], [-800.0, -800.0]]))
+    assert np.isfinite(probs).all()
+    assert probs == pytest.approx(np.array([[0, 1, 0], [1 / 3, 1 / 3, 1 / 3], [1, 0, 0]]))
+
+
+def test_ties_go_to_blue_then_brown():
+    # Coefficients that cancel the intercepts: logits (0, -1) tie blue with brown, (-1, 0) tie brown with other
+    iris = pd.DataFrame({"id": ["rs1", "rs2"], "b1": [-A1, -A1 - 1], "b2": [-A2 - 1, -A2]})
+    predictions = predict(np.array([[1, 0], [0, 1]]), iris, ["blue_brown", "brown_other"])
+    assert predictions["blue"].iloc[0] == predictions["brown"].iloc[0]
+    assert predictions["brown"].iloc[1] == predictions["other"].iloc[1]
+    assert predictions["predicted_eye_color"].tolist() == ["blue", "brown"]
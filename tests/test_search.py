@@ -0,0 +1,92 @@
+"""
+search.py's trials on the tiny stores from test_train.py: one trial's results and statistics files, diverged trials
+reported as failed instead of crashing, and a sweep through the process pool resuming where the results csv left off
+"""
+
+import os
+import math
+import argparse
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import search
+from search import WakeUpTheKongs, RunTrial, FinishedTrials, RESULT_COLUMNS, main
+from train import AddTrainingArgs
+from test_train import MakeStores
+
+
+def SearchArgs(directory, extra=()):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--search_file')
+    parser.add_argument('-o', '--output')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=1)
+    AddTrainingArgs(parser)
+    return parser.parse_args(MakeStores(directory) + ["-s", os.path.join(directory, "search.csv"), "-o", os.path.join(directory, "results.csv")] + list(extra))
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setattr(search, "worker", {})
+    return search.worker
+
+
+def test_run_trial(tmp_path, worker):
+    args = SearchArgs(str(tmp_path))
+    WakeUpTheKongs(args, torch.get_num_threads())
+    i, name, results, seconds = RunTrial((4, "Tiny", [8, 4]))
+    assert (i, name) == (4, "Tiny")
+    assert set(results) == set(RESULT_COLUMNS) and seconds > 0
+
+    train = pd.read_csv(os.path.join(args.log_dir, "ModelTiny_TrainStatistics.txt"))
+    val = pd.read_csv(os.path.join(args.log_dir, "ModelTiny_ValStatistics.txt"))
+    assert list(val.columns) == ["Loss", "Acc"]
+    assert results["Early_Stopping_Epoch"] == len(val) - 1
+    kept = int(np.argmin(np.abs(val["Loss"].values - results["Val_Loss"])))  #all four metrics are from the epoch the model was kept from
+    assert kept >= 1
+    assert [results["Val_Loss"], results["Val_Acc"], results["Train_Loss"], results["Train_Acc"]] == \
+        pytest.approx([val.loc[kept, "Loss"], val.loc[kept, "Acc"], train.loc[kept, "Loss"], train.loc[kept, "Acc"]])
+    assert os.path.exists(os.path.join(args.model_dir, "BestModel_Tiny_{}_epochs_2_hiddenLayers.pt".format(len(val) - 1)))
+
+
+def test_diverged_trial_fails(tmp_path, worker):
+    args = SearchArgs(str(tmp_path), ["-lr", "1e30"])
+    WakeUpTheKongs(args, torch.get_num_threads())
+    assert RunTrial((0, "Nan", [8])) == (0, "Nan", None, "no epoch improved the validation loss")
+    assert pd.read_csv(os.path.join(args.log_dir, "ModelNan_ValStatistics.txt"))["Loss"].iloc[1:].isna().all()
+    assert os.listdir(args.model_dir) == []
+
+
+def test_broken_trial_returns_its_traceback(tmp_path, worker):
+    args = SearchArgs(str(tmp_path), ["-lr", "nan"])  #Adam refuses it
+    WakeUpTheKongs(args, torch.get_num_threads())
+    i, name, results, info = RunTrial((1, "Broken", [8]))
+    assert (i, name, results) == (1, "Broken", None)
+    assert info.startswith("Traceback") and "learning rate" in info
+
+
+def test_finished_trials(tmp_path):
+    output = str(tmp_path / "results.csv")
+    assert FinishedTrials(output) == set()
+    pd.DataFrame({"Model": [1, "B", "C"], "Val_Loss": [0.5, math.nan, 0.7]}).to_csv(output)
+    assert FinishedTrials(output) == {"1", "C"}
+
+
+def test_sweep_resumes(tmp_path):
+    args = SearchArgs(str(tmp_path))
+    search_file = pd.DataFrame({"Model": ["A", "B"], "Num_hidden_layers": [2, 1], "Layer_widths": ["8;4", "6;3"]})
+    search_file.to_csv(args.search_file, index=False)
+    main(args)
+    results = pd.read_csv(args.output, index_col=0)
+    assert sorted(results["Model"]) == ["A", "B"]
+    assert results[RESULT_COLUMNS].notna().all().all()
+
+    # A row added to the search csv is the only one the rerun trains
+    pd.concat([search_file, pd.DataFrame({"Model": ["C"], "Num_hidden_layers": [1], "Layer_widths": ["5"]})]).to_csv(args.search_file, index=False)
+    os.remove(os.path.join(args.log_dir, "ModelA_TrainStatistics.txt"))
+    main(args)
+    results = pd.read_csv(args.output, index_col=0)
+    assert sorted(results["Model"]) == ["A", "B", "C"]
+    assert results.loc[results["Model"] == "C"].index.tolist() == [2]
+    assert not os.path.exists(os.path.join(args.log_dir, "ModelA_TrainStatistics.txt"))
@@ -0,0 +1,109 @@
+"""
+train.py's Train/main on tiny memory-mapped genotype stores: per epoch lists lined up with the untrained epoch 0,
+the saved model being the one from the epoch EarlyStop reports, dosage models built from the stats file and json configs
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from genotypeStore import write_store
+from DontGetSNPpyWithMe import DosageKong64, KongFromCheckpoint
+from train import LoadTheData, BuildTheKong, Train, Validate, AddTrainingArgs, ParseWithConfig, main
+
+
+NUM_SNPS = 30
+
+
+# Train and val stores whose labels follow the first SNPs, plus the labels csvs and the per SNP stats, returns training flags
+def MakeStores(directory, dosage=False):
+    rng = np.random.default_rng(0)
+    rsids = ["rs{}".format(i) for i in range(NUM_SNPS)]
+    flags = []
+    for name, size in (("train", 96), ("val", 32)):
+        samples = ["{}{:03d}".format(name, i) for i in range(size)]
+        dosages = rng.integers(0, 3, size=(size, NUM_SNPS))
+        labels = np.clip(dosages[:, 0] + dosages[:, 1] - 1, 0, 2)
+        dosages[rng.random(dosages.shape) < 0.05] = -1
+        matrix = dosages if dosage else np.where(dosages < 0, 0, dosages - 1)
+        sidecar = write_store(matrix, samples, rsids, os.path.join(directory, name + "_set"), dtype=np.int8 if dosage else np.float32)
+        pd.DataFrame({"label": labels}, index=samples).to_csv(os.path.join(directory, name + "_labels.csv"))
+        flags += ["--{}_genotypes".format(name), sidecar, "--{}_labels".format(name), os.path.join(directory, name + "_labels.csv")]
+    stats = os.path.join(directory, "train_set_stats.tsv")
+    pd.DataFrame({"means": np.ones(NUM_SNPS), "std": np.full(NUM_SNPS, 0.8)}, index=rsids[::-1]).to_csv(stats, sep='\t')
+    flags += ["--stats", stats, "--model_dir", os.path.join(directory, "models"), "-l", os.path.join(directory, "logs"),
+              "-b", "16", "-e", "6", "-p", "2", "--device", "cpu"]
+    os.makedirs(os.path.join(directory, "models"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "logs"), exist_ok=True)
+    return flags + (["--dosage"] if dosage else [])
+
+
+def TrainingArgs(flags):
+    parser = argparse.ArgumentParser()
+    AddTrainingArgs(parser)
+    return parser.parse_args(flags)
+
+
+@pytest.mark.parametrize("dosage", [False, True])
+def test_train_saves_the_model_it_reports(tmp_path, dosage):
+    args = TrainingArgs(MakeStores(str(tmp_path), dosage))
+    device = torch.device("cpu")
+    torch.manual_seed(0)
+    train_loader, val_loader = LoadTheData(args, device, 0)
+    model, optimizer, criterion = BuildTheKong(args, [8, 4], NUM_SNPS, device)
+    assert isinstance(model.hotTopVolcano[0], DosageKong64) == dosage
+
+    accs, losses, valAccs, valLosses, lastImprovedEpoch, timings = Train(model, optimizer, criterion, train_loader, val_loader, device,
+                                                                        args.epochs, args.patience, args.model_dir, "Tiny")
+    numEpochs = len(timings)
+    assert 1 <= numEpochs <= args.epochs
+    assert len(accs) == len(losses) == len(valAccs) == len(valLosses) == numEpochs + 1
+    assert np.isnan(accs[0]) and np.isnan(losses[0])  #no --train_baseline
+    assert set(timings[0]) == {"data", "forward", "backward", "optimizer", "validate"}
+    assert 1 <= lastImprovedEpoch <= numEpochs
+
+    modelFile = os.path.join(args.model_dir, "BestModel_Tiny_{}_epochs_2_hiddenLayers.pt".format(numEpochs))
+    saved = KongFromCheckpoint(modelFile)
+    valAcc, valLoss = Validate(saved, val_loader, criterion, device)
+    assert valAcc == pytest.approx(valAccs[lastImprovedEpoch])
+    assert valLoss == pytest.approx(valLosses[lastImprovedEpoch], rel=1e-5)
+
+
+def test_dosage_kong_uses_the_stats_of_the_store_rsids(tmp_path):
+    args = TrainingArgs(MakeStores(str(tmp_path), dosage=True))
+    stats = pd.read_csv(args.stats, sep='\t', index_col=0)
+    stats["means"] = np.arange(NUM_SNPS, dtype=float)  #row rs29 first, so the order has to come from the store
+    stats.to_csv(args.stats, sep='\t')
+    model, _, _ = BuildTheKong(args, [8], NUM_SNPS, torch.device("cpu"))
+    assert model.hotTopVolcano[0].means.tolist() == list(range(NUM_SNPS))[::-1]
+
+
+def test_parse_with_config(tmp_path, monkeypatch):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"epochs": 3, "learning_rate": 0.1, "dosage": True}))
+    parser = argparse.ArgumentParser()
+    AddTrainingArgs(parser)
+    monkeypatch.setattr(sys, "argv", ["train.py", "-c", str(config), "-e", "7"])
+    args = ParseWithConfig(parser)
+    assert (args.epochs, args.learning_rate, args.dosage, args.batch_size) == (7, 0.1, True, 32)  #command line > config > defaults
+
+
+def test_main_writes_statistics_and_config(tmp_path):
+    parser = argparse.ArgumentParser()
+    AddTrainingArgs(parser)
+    parser.add_argument('-n', '--name')
+    parser.add_argument('-w', '--layer_widths', type=int, nargs='+')
+    parser.add_argument('--num_workers', type=int)
+    args = parser.parse_args(MakeStores(str(tmp_path)) + ["-n", "Tiny", "-w", "8", "4", "--num_workers", "0"])
+    main(args)
+
+    statistics = pd.read_csv(os.path.join(args.log_dir, "ModelTiny_TrainStatistics.tsv"), sep='\t', index_col=0)
+    config = json.load(open(os.path.join(args.log_dir, "ModelTiny_config.json")))
+    assert list(statistics.columns[:4]) == ["Train_Loss", "Train_Acc", "Val_Loss", "Val_Acc"]
+    assert np.isnan(statistics.loc[0, "Train_Loss"]) and np.isnan(statistics.loc[0, "forward_seconds"])
+    assert config["layer_widths"] == [8, 4]
+    assert 1 <= config["last_improved_epoch"] < len(statistics)